@@ -0,0 +1,285 @@
+# pylint: disable = C0116, C0115, C0114, C0411, C0413, C0415
+"""
+benchmarks against the local mock server in mock_server.py, no api key or
+network needed. results are written as json, pass an older results file to
+--compare to see what got faster or slower
+
+    python benchmarks/bench.py --output results.json --compare old.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from mock_server import TEXT, MockServer
+
+from AI_TUI import backend, native_render, render
+from AI_TUI import main as tui
+from AI_TUI.clients import close_clients
+from AI_TUI.context import Window
+from AI_TUI.log_writer import LogWriter, format_msgs
+from AI_TUI.pydantic_stuff.models import Config
+from AI_TUI.render import markdown
+
+TURNS = (10, 100, 1000)
+WIDTH = 100
+# every code block differs, so nothing is highlighted from a cache
+CODE_HEAVY = "".join(
+    "Here is the whole module, then what changed:\n\n```python\n"
+    + f"def handler_{block}(request, retries={block}):\n"
+    "    for attempt in range(retries):\n"
+    "        response = send(request)  # `send` retries on its own\n"
+    "        if response.ok:\n"
+    "            return response.json()\n"
+    "    raise RuntimeError(f'gave up after {retries} tries')\n\n" * 40
+    + "```\n\n- **first** change\n- *second* change\n\n"
+    for block in range(5)
+)
+ENDPOINTS = {"openai": "/v1/", "google": "/v1beta/"}
+
+
+def measure(fn: Callable[[], Any], repeat: int) -> dict[str, float]:
+    fn()  # warm up imports, connections and caches
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return {
+        "runs": repeat,
+        "min_ms": round(times[0], 4),
+        "median_ms": round(statistics.median(times), 4),
+        "mean_ms": round(statistics.fmean(times), 4),
+        "max_ms": round(times[-1], 4),
+    }
+
+
+def use_config(config: Config) -> None:
+    # MessagesArray and friends read the config through tui.get_config
+    tui.get_config = lambda: config
+
+
+def make_config(server: MockServer, api_type: str) -> Config:
+    return Config(
+        api_key="benchmark-key",
+        model="mock-model",
+        api_type=api_type,  # type: ignore
+        endpoint=server.url + ENDPOINTS[api_type],  # type: ignore
+        max_retries=0,
+    )
+
+
+def conversation(turns: int) -> tui.MessagesArray:
+    messages = tui.MessagesArray()
+    for i in range(turns):
+        messages.append(tui.Message(role="user", content=f"question {i}?"))
+        messages.append(tui.Message(role="assistant", content=TEXT))
+    return messages
+
+
+def one_turn(config: Config, stream: bool) -> Callable[[], Any]:
+    def run() -> None:
+        messages = tui.MessagesArray()
+        messages.append(tui.Message(role="user", content="hello"))
+        if stream:
+            response = "".join(
+                backend.make_query_stream(config.api_key, messages, config, tui.SOURCE)
+            )
+        else:
+            response = backend.make_query(config.api_key, messages, config, tui.SOURCE)
+        if not response:
+            raise RuntimeError(f"no response from the mock {config.api_type} api")
+
+    return run
+
+
+def bench_queries(server: MockServer, repeat: int) -> dict[str, Any]:
+    results = {}
+    for api_type in ENDPOINTS:
+        for tool_rounds in (0, 1):
+            server.tool_rounds = tool_rounds
+            for stream in (False, True):
+                config = make_config(server, api_type)
+                use_config(config)
+                name = "make_query_stream" if stream else "make_query"
+                results[f"{name}[{api_type},tool_rounds={tool_rounds}]"] = measure(
+                    one_turn(config, stream), repeat
+                )
+    server.tool_rounds = 0
+    return results
+
+
+def bench_client_reuse(server: MockServer, repeat: int) -> dict[str, Any]:
+    """the shared client against a new client, and connection, every turn"""
+    results = {}
+    for api_type in ENDPOINTS:
+        config = make_config(server, api_type)
+        use_config(config)
+        turn = one_turn(config, stream=False)
+
+        def fresh(turn=turn) -> None:
+            close_clients()
+            turn()
+
+        before = server.connections
+        results[f"client_reuse[{api_type},shared]"] = measure(turn, repeat)
+        results[f"client_reuse[{api_type},shared]"]["connections"] = (
+            server.connections - before
+        )
+        before = server.connections
+        results[f"client_reuse[{api_type},fresh]"] = measure(fresh, repeat)
+        results[f"client_reuse[{api_type},fresh]"]["connections"] = (
+            server.connections - before
+        )
+        close_clients()
+    return results
+
+
+def bench_formatter(server: MockServer, repeat: int, turns: tuple) -> dict:
+    from AI_TUI.providers import google_api
+
+    config = make_config(server, "google")
+    use_config(config)
+    results = {}
+    for n in turns:
+        messages = conversation(n)
+
+        def cold(messages=messages) -> None:
+            # a copy has an empty conversion cache, like a resumed session
+            copy = tui.MessagesArray(messages[1:])
+            payload = backend.build_payload(google_api, copy, Window())
+            google_api.google_messages_formatter(payload, tui.SOURCE)
+
+        def warm(messages=messages) -> None:
+            payload = backend.build_payload(google_api, messages, Window())
+            google_api.google_messages_formatter(payload, tui.SOURCE)
+
+        results[f"google_messages_formatter[{n},cold]"] = measure(cold, repeat)
+        results[f"google_messages_formatter[{n},warm]"] = measure(warm, repeat)
+    return results
+
+
+def bench_log(repeat: int, turns: tuple) -> dict[str, Any]:
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        for n in turns:
+            messages = conversation(n)
+            path = Path(folder) / f"log_{n}.md"
+
+            def whole(messages=messages, path=path) -> None:
+                path.write_text(format_msgs(messages), encoding="utf-8")
+
+            def append(messages=messages, path=path) -> None:
+                # what a turn costs: the log already holds all but the last turn
+                log = LogWriter(path, "never")
+                log.count = len(messages) - 2
+                log.sync(messages)
+                log.close()
+
+            results[f"format_msgs[{n}]"] = measure(
+                lambda messages=messages: format_msgs(messages), repeat
+            )
+            results[f"log_rewrite[{n}]"] = measure(whole, repeat)
+            results[f"log_append[{n}]"] = measure(append, repeat)
+    return results
+
+
+def bench_markdown(repeat: int) -> dict[str, Any]:
+    texts = {
+        "response": TEXT,
+        "10 turns": format_msgs(conversation(10)),
+        "code-heavy": CODE_HEAVY,
+    }
+    results = {}
+    widths = iter(range(WIDTH, 10**6))
+
+    def cold(text: str) -> None:
+        native_render.highlight.cache_clear()
+        markdown(text, WIDTH, cache=False)
+
+    for name in ("mdv", "native"):
+        render.renderer = name  # type: ignore
+        for label, text in texts.items():
+            results[f"markdown[{name},{label}]"] = measure(
+                lambda text=text: cold(text), repeat
+            )
+        # what the log viewer and repeated renders pay once it is cached
+        results[f"markdown[{name},code-heavy,cached]"] = measure(
+            lambda: markdown(CODE_HEAVY, WIDTH), repeat
+        )
+        # a resize, and the whole answer rendered again after it streamed
+        results[f"markdown[{name},code-heavy,new width]"] = measure(
+            lambda: markdown(CODE_HEAVY, next(widths)), repeat
+        )
+    render.renderer = "mdv"
+    return results
+
+
+def compare(old: dict, new: dict) -> str:
+    lines = []
+    for name, stats in new["results"].items():
+        if name not in old.get("results", {}):
+            continue
+        before = old["results"][name]["median_ms"]
+        after = stats["median_ms"]
+        change = (after - before) / before * 100 if before else 0.0
+        lines.append(f"{name}: {before:.3f}ms -> {after:.3f}ms ({change:+.1f}%)")
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--output", type=Path, default=Path("bench_results.json"))
+    parser.add_argument("--compare", type=Path)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--turns", type=int, nargs="+", default=list(TURNS))
+    parser.add_argument("--delay", type=float, default=0.0, help="server delay")
+    parser.add_argument("--chunk-delay", type=float, default=0.0)
+    args = parser.parse_args()
+
+    backend.HEADLESS = True
+    server = MockServer(delay=args.delay, chunk_delay=args.chunk_delay).start()
+    turns = tuple(args.turns)
+    results: dict[str, Any] = {}
+    try:
+        results.update(bench_queries(server, args.repeat))
+        results.update(bench_client_reuse(server, args.repeat))
+        results.update(bench_formatter(server, args.repeat, turns))
+        results.update(bench_log(args.repeat, turns))
+        results.update(bench_markdown(args.repeat))
+    finally:
+        close_clients()
+        server.stop()
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "args": {k: str(v) for k, v in vars(args).items()},
+        },
+        "results": results,
+    }
+    args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    for name, stats in results.items():
+        print(f"{name}: median {stats['median_ms']:.3f}ms")
+    if args.compare:
+        old = json.loads(args.compare.read_text(encoding="utf-8"))
+        print("\ncompared to", args.compare)
+        print(compare(old, report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+# pylint: disable = C0116, C0115, C0114, C0411
+"""
+local stand-in for the openai responses api and gemini generateContent,
+streaming included. the first tool_rounds requests of a conversation answer
+with a dice_roll function call, the one after that with text
+
+    python benchmarks/mock_server.py --port 8000 --delay 0.2
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Iterator
+
+TEXT = (
+    "Here is the answer.\n\n```python\nprint('hello world')\n```\n\n"
+    "- one point\n- another point\n\nThat should be all."
+)
+TOOL_NAME = "dice_roll"
+TOOL_ARGS = {"n_min": 1, "n_max": 6}
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        port: int = 0,
+        delay: float = 0.0,
+        chunk_delay: float = 0.0,
+        chunks: int = 8,
+        tool_rounds: int = 0,
+    ) -> None:
+        super().__init__(("127.0.0.1", port), Handler)
+        # delay is before the first byte, chunk_delay between streamed chunks
+        self.delay = delay
+        self.chunk_delay = chunk_delay
+        self.chunks = chunks
+        self.tool_rounds = tool_rounds
+        self.requests = 0
+        self.connections = 0
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self) -> MockServer:
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def pieces(self) -> list[str]:
+        size = -(-len(TEXT) // self.chunks)
+        return [TEXT[i : i + size] for i in range(0, len(TEXT), size)]
+
+
+class Handler(BaseHTTPRequestHandler):
+    # keep-alive, so reusing a client actually reuses the connection
+    protocol_version = "HTTP/1.1"
+    # headers and body are separate writes, nagle would hold the body back
+    # until the client's delayed ack, about 40ms on every reused connection
+    disable_nagle_algorithm = True
+    server: MockServer
+
+    def setup(self) -> None:
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, format: str, *args: Any) -> None:  # pylint: disable = W0622
+        pass
+
+    def do_GET(self) -> None:  # pylint: disable = C0103
+        # model lists, for the startup probe
+        if self.path.startswith("/v1/models"):
+            self.send_json({"object": "list", "data": [{"id": "mock-model"}]})
+        else:
+            self.send_json({"models": [{"name": "models/mock-model"}]})
+
+    def do_HEAD(self) -> None:  # pylint: disable = C0103
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self) -> None:  # pylint: disable = C0103
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        self.server.requests += 1
+        time.sleep(self.server.delay)
+        if self.path.startswith("/v1/responses"):
+            self.openai(body)
+        elif ":streamGenerateContent" in self.path:
+            self.send_events(self.gemini_stream(body))
+        elif ":generateContent" in self.path:
+            self.send_json(self.gemini_response(body, TEXT))
+        else:
+            self.send_error(404)
+
+    def send_json(self, data: Any) -> None:
+        raw = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def send_events(self, events: Iterator[str]) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, event in enumerate(events):
+            if i:
+                time.sleep(self.server.chunk_delay)
+            raw = event.encode()
+            self.wfile.write(f"{len(raw):x}\r\n".encode() + raw + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def wants_tool(self, done_rounds: int) -> bool:
+        return done_rounds < self.server.tool_rounds
+
+    # openai responses api
+
+    def openai(self, body: dict) -> None:
+        items = body.get("input") or []
+        done = sum(1 for i in items if i.get("type") == "function_call_output")
+        response = openai_response(body.get("model", ""), self.wants_tool(done))
+        if not body.get("stream"):
+            self.send_json(response)
+            return
+
+        def events() -> Iterator[str]:
+            yield sse({"type": "response.created", "response": response})
+            if not self.wants_tool(done):
+                for piece in self.server.pieces():
+                    yield sse(
+                        {
+                            "type": "response.output_text.delta",
+                            "item_id": "msg_mock",
+                            "output_index": 0,
+                            "content_index": 0,
+                            "delta": piece,
+                        }
+                    )
+            yield sse({"type": "response.completed", "response": response})
+
+        self.send_events(events())
+
+    # gemini
+
+    def gemini_rounds(self, body: dict) -> int:
+        return sum(
+            1
+            for content in body.get("contents") or []
+            for part in content.get("parts") or []
+            if "functionResponse" in part or "function_response" in part
+        )
+
+    def gemini_response(self, body: dict, text: str) -> dict:
+        if self.wants_tool(self.gemini_rounds(body)):
+            part: dict = {"functionCall": {"name": TOOL_NAME, "args": TOOL_ARGS}}
+        else:
+            part = {"text": text}
+        return {
+            "candidates": [
+                {
+                    "content": {"role": "model", "parts": [part]},
+                    "finishReason": "STOP",
+                    "index": 0,
+                }
+            ],
+            "usageMetadata": {"promptTokenCount": 10, "candidatesTokenCount": 10},
+        }
+
+    def gemini_stream(self, body: dict) -> Iterator[str]:
+        if self.wants_tool(self.gemini_rounds(body)):
+            yield sse(self.gemini_response(body, ""))
+            return
+        for piece in self.server.pieces():
+            yield sse(self.gemini_response(body, piece))
+
+
+def openai_response(model: str, tool: bool) -> dict:
+    if tool:
+        output: dict = {
+            "type": "function_call",
+            "id": "fc_mock",
+            "call_id": "call_mock",
+            "name": TOOL_NAME,
+            "arguments": json.dumps(TOOL_ARGS),
+            "status": "completed",
+        }
+    else:
+        output = {
+            "type": "message",
+            "id": "msg_mock",
+            "role": "assistant",
+            "status": "completed",
+            "content": [{"type": "output_text", "text": TEXT, "annotations": []}],
+        }
+    return {
+        "id": "resp_mock",
+        "object": "response",
+        "created_at": int(time.time()),
+        "model": model,
+        "status": "completed",
+        "output": [output],
+        "parallel_tool_calls": True,
+        "tool_choice": "auto",
+        "tools": [],
+        "usage": {"input_tokens": 10, "output_tokens": 10, "total_tokens": 20},
+    }
+
+
+def sse(data: dict) -> str:
+    event = f"event: {data['type']}\n" if "type" in data else ""
+    return f"{event}data: {json.dumps(data)}\n\n"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--delay", type=float, default=0.0)
+    parser.add_argument("--chunk-delay", type=float, default=0.0)
+    parser.add_argument("--chunks", type=int, default=8)
+    parser.add_argument("--tool-rounds", type=int, default=0)
+    args = parser.parse_args()
+    server = MockServer(
+        args.port, args.delay, args.chunk_delay, args.chunks, args.tool_rounds
+    )
+    print(f"serving on {server.url}, openai at /v1/, gemini at /v1beta/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+# pylint: disable = C0116, C0115, C0114, C0411
+"""
+the conversation screen, one full-screen application for the whole session:
+the conversation pane with the rendered messages and the answer being
+written, the input pane under it and a status bar. nothing gets cleared,
+prompt_toolkit only redraws what changed
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+from prompt_toolkit import Application
+from prompt_toolkit.application import get_app
+from prompt_toolkit.buffer import Buffer
+from prompt_toolkit.formatted_text import ANSI
+from prompt_toolkit.key_binding import KeyBindings, merge_key_bindings
+from prompt_toolkit.layout import HSplit, Layout, Window
+from prompt_toolkit.layout.controls import BufferControl, FormattedTextControl
+from prompt_toolkit.layout.dimension import Dimension
+
+from AI_TUI import metrics, multi_backend
+from AI_TUI.backend import StreamError
+from AI_TUI.clients import close_async_clients
+from AI_TUI.main import (
+    GLOBAL_KEYS,
+    SOURCE,
+    Message,
+    MessagesArray,
+    get_config,
+    get_probe,
+    get_response_cache,
+    metrics_file,
+)
+from AI_TUI.render import last_block_boundary, markdown, side_by_side
+from AI_TUI.warmup import warm_up
+
+if TYPE_CHECKING:
+    from AI_TUI.log_writer import LogWriter
+
+RENDER_CACHE = 256
+HEADERS = {
+    "user": "\x1b[1;33mYou:\x1b[0m",
+    "assistant": "\x1b[1;36mAssistant:\x1b[0m",
+}
+HELP = "c-d send | c-z undo | c-y redo | pgup/pgdn scroll | c-c cancel/exit"
+WAITING = "\x1b[2mProcessing...\x1b[0m"
+
+
+def split(rendered: str) -> list[str]:
+    return rendered.rstrip("\n").split("\n")
+
+
+def fanning_out() -> bool:
+    return get_config().backend_mode == "fanout" and bool(get_config().backends)
+
+
+class LiveAnswer:
+    """
+    the answer being written. finished markdown blocks are rendered once,
+    only the unfinished tail is rendered again on every redraw
+    """
+
+    def __init__(self) -> None:
+        self.text = ""
+        self._width = 0
+        self._done = 0
+        self._done_lines: list[str] = []
+
+    def lines(self, width: int) -> list[str]:
+        if not self.text:
+            return [HEADERS["assistant"], WAITING]
+        if width != self._width:
+            self._width, self._done, self._done_lines = width, 0, []
+        boundary = last_block_boundary(self.text[self._done :])
+        if boundary:
+            block = self.text[self._done : self._done + boundary]
+            self._done_lines += split(markdown(block, width))
+            self._done += boundary
+        tail = self.text[self._done :]
+        tail_lines = split(markdown(tail, width, cache=False)) if tail.strip() else []
+        return [HEADERS["assistant"], *self._done_lines, *tail_lines]
+
+
+class ConversationPane:
+    def __init__(self, messages: MessagesArray) -> None:
+        self.messages = messages
+        self.live: LiveAnswer | None = None
+        # the turn being answered, redraws happen outside of its context
+        self.turn: metrics.Turn | None = None
+        # what got printed since the last prompt, errors mostly
+        self.printed = ""
+        self.scroll = 0  # lines above the bottom
+        self.window = Window(FormattedTextControl(self.page), wrap_lines=False)
+        self._rendered: OrderedDict[int, tuple[Message, int, list[str]]] = (
+            OrderedDict()
+        )
+
+    def rendered(self, message: Message, width: int) -> list[str]:
+        key = id(message)
+        cached = self._rendered.get(key)
+        if cached is not None and cached[0] is message and cached[1] == width:
+            self._rendered.move_to_end(key)
+            return cached[2]
+        header = HEADERS.get(message.role, message.role)
+        lines = [header, *split(markdown(message.content, width))]
+        self._rendered[key] = (message, width, lines)
+        if len(self._rendered) > RENDER_CACHE:
+            self._rendered.popitem(last=False)
+        return lines
+
+    def height(self) -> int:
+        info = self.window.render_info
+        if info is not None:
+            return info.window_height
+        # before the first render, the rows less the input and status lines
+        return max(1, get_app().output.get_size().rows - 3)
+
+    def blocks(self, width: int):
+        """the pane's blocks of lines, last one first"""
+        if self.printed:
+            yield split(self.printed)
+        if self.live is not None:
+            yield self.live.lines(width)
+        # the developer prompt isn't part of the conversation on screen
+        for i in range(len(self.messages) - 1, 0, -1):
+            yield self.rendered(self.messages[i], width)
+
+    def page(self) -> ANSI:
+        width = get_app().output.get_size().columns
+        height = self.height()
+        lines: list[str] = []
+        with metrics.within(self.turn):
+            # only as many messages get rendered as it takes to fill the screen
+            for block in self.blocks(width):
+                lines[:0] = [*block, ""]
+                if len(lines) >= height + self.scroll:
+                    break
+        self.scroll = max(0, min(self.scroll, len(lines) - height))
+        end = len(lines) - self.scroll
+        return ANSI("\n".join(lines[max(0, end - height) : end]))
+
+    def up(self) -> None:
+        self.scroll += self.height()
+
+    def down(self) -> None:
+        self.scroll = max(0, self.scroll - self.height())
+
+
+class PaneOutput:
+    """stdout while the screen is up, prints land at the end of the pane"""
+
+    def __init__(self, pane: ConversationPane) -> None:
+        self.pane = pane
+
+    def write(self, text: str) -> int:
+        self.pane.printed += text
+        with contextlib.suppress(Exception):
+            get_app().invalidate()
+        return len(text)
+
+    def flush(self) -> None:
+        pass
+
+    def isatty(self) -> bool:
+        return False
+
+
+class ChatApp:
+    def __init__(self, messages: MessagesArray, api_key: str, log: LogWriter):
+        self.messages = messages
+        self.api_key = api_key
+        self.log = log
+        self.pane = ConversationPane(messages)
+        self.input = Buffer(multiline=True)
+        self.notice_text = ""
+        self.waiting: list[str] = []
+        self.tasks: list[asyncio.Task] = []
+        self.warm: asyncio.Task | None = None
+
+        kb = KeyBindings()
+        kb.add("c-d")(lambda _: self.submit())
+        kb.add("c-c")(lambda _: self.interrupt())
+        kb.add("pageup")(lambda _: self.pane.up())
+        kb.add("pagedown")(lambda _: self.pane.down())
+        kb.add("c-end")(lambda _: setattr(self.pane, "scroll", 0))
+
+        input_window = Window(
+            BufferControl(self.input),
+            height=Dimension(min=1, max=10),
+            get_line_prefix=lambda line, wrap: ">> ",
+            wrap_lines=True,
+        )
+        layout = Layout(
+            HSplit(
+                [
+                    self.pane.window,
+                    Window(height=1, char="─", style="class:separator"),
+                    input_window,
+                    Window(
+                        FormattedTextControl(self.status),
+                        height=1,
+                        style="reverse",
+                    ),
+                ]
+            ),
+            focused_element=input_window,
+        )
+        self.app: Application = Application(
+            layout=layout,
+            key_bindings=merge_key_bindings([kb, GLOBAL_KEYS]),
+            full_screen=True,
+            # the status bar picks up turns that finish in the background
+            refresh_interval=0.5,
+            # a fast stream shouldn't redraw for every chunk
+            min_redraw_interval=0.05,
+        )
+
+    def notice(self, text: str) -> None:
+        self.notice_text = text
+        self.app.invalidate()
+
+    def answering(self) -> bool:
+        """an answer is being written, or a prompt waits for its turn"""
+        return any(not t.done() for t in self.tasks)
+
+    def status(self) -> str:
+        # the probe finishes whenever it does, the refresh picks it up
+        if error := get_probe().take_error():
+            self.notice_text = f"WARN: {error}"
+        parts = [self.notice_text or HELP]
+        if self.answering():
+            parts.insert(0, f"answering, {len(self.waiting)} waiting")
+        if self.pane.scroll:
+            parts.insert(0, f"scrolled up {self.pane.scroll} lines")
+        if turn := metrics.status_line().strip():
+            parts.append(turn)
+        return " " + " | ".join(parts)
+
+    def submit(self) -> None:
+        query = self.input.text
+        if not query.strip():
+            return
+        self.tasks = [t for t in self.tasks if not t.done()]
+        if self.tasks and get_config().async_ui != "yes":
+            self.notice("An answer is still being written.")
+            return
+        self.input.reset(append_to_history=True)
+        self.pane.printed = ""
+        self.pane.scroll = 0
+        self.notice_text = ""
+        previous = self.tasks[-1] if self.tasks else None
+        self.waiting.append(query)
+        self.tasks.append(asyncio.create_task(self.answer(previous, query)))
+
+    def interrupt(self) -> None:
+        self.tasks = [t for t in self.tasks if not t.done()]
+        if not self.tasks:
+            self.app.exit()
+            return
+        for task in self.tasks:
+            task.cancel()
+
+    async def answer(self, previous: asyncio.Task | None, query: str) -> None:
+        try:
+            if previous:
+                # answers stay in order, asyncio.wait doesn't re-raise its cancellation
+                await asyncio.wait([previous])
+        finally:
+            # cancelled while queued, or its turn came
+            self.waiting.remove(query)
+        with metrics.turn(metrics_file()) as turn:
+            self.pane.turn = turn
+            try:
+                await self.write_answer(query)
+            finally:
+                self.pane.turn = None
+        self.app.invalidate()
+        if all(t.done() or t is asyncio.current_task() for t in self.tasks):
+            self.start_warm_up()
+
+    def start_warm_up(self) -> None:
+        """gets the next request ready while the prompt is typed"""
+        if self.warm is not None and not self.warm.done():
+            return
+        self.warm = asyncio.create_task(
+            warm_up(self.messages, get_config(), self.api_key, SOURCE)
+        )
+
+    async def write_answer(self, query: str) -> None:
+        messages = self.messages
+        user_message = Message(role="user", content=query)
+        messages.append(user_message)
+        live = self.pane.live = LiveAnswer()
+        args = (self.api_key, messages, get_config(), SOURCE, get_response_cache())
+        response = None
+        try:
+            if fanning_out():
+                answers = await multi_backend.fan_out_async(*args)
+                response = self.show_fan_out(answers)
+            elif get_config().stream == "yes":
+                async for chunk in multi_backend.stream_async(*args):
+                    live.text += chunk
+                    self.app.invalidate()
+                response = live.text or None
+            else:
+                # a plain request, in a thread so the screen stays responsive
+                response = await asyncio.to_thread(multi_backend.query, *args)
+        except asyncio.CancelledError:
+            if messages[-1] is user_message:
+                messages.pop(-1)
+            print("Cancelled.")
+            raise
+        except StreamError:
+            pass  # the provider printed what went wrong, half an answer isn't kept
+        except Exception as err:  # pylint: disable = W0718
+            # tools.json, the connection, the summary request...
+            print(f"ERROR: {err}")
+        finally:
+            self.pane.live = None
+
+        if not response:
+            if messages[-1] is user_message:
+                messages.pop(-1)
+            print("ERROR: did not receive response from API.")
+            return
+
+        answer = Message(role="assistant", content=response)
+        messages.append(answer)
+        # rendered while the turn is still measured, the redraw finds it cached
+        self.pane.rendered(answer, get_app().output.get_size().columns)
+        self.log.sync(messages)
+
+    def show_fan_out(self, answers: multi_backend.Answers) -> str | None:
+        """prints the answers next to each other, returns the one to keep"""
+        answered = [(name, text) for name, text in answers if text]
+        if not answered:
+            return None
+        width = get_app().output.get_size().columns
+        print(side_by_side(answered, width))
+        if answered[0][0] != answers[0][0]:
+            print(f"(kept the answer from {answered[0][0]})")
+        return answered[0][1]
+
+    async def run_async(self) -> None:
+        self.start_warm_up()
+        try:
+            with contextlib.redirect_stdout(PaneOutput(self.pane)):  # type: ignore
+                await self.app.run_async()
+        finally:
+            tasks = [*self.tasks, *([self.warm] if self.warm else [])]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await close_async_clients()
+
+    def run(self) -> None:
+        asyncio.run(self.run_async())
@@ -2,167 +2,220 @@
 
 from __future__ import annotations
 
+import asyncio
+import threading
 from pathlib import Path
-import json
-from typing import TYPE_CHECKING
-
-import openai
-from openai import OpenAI
-from google import genai
-from google.genai import types
-import google.genai.errors as g_error
-
-from AI_TUI.tools import tools as tool_callables
+from types import ModuleType
+from typing import TYPE_CHECKING, Any, AsyncIterator, Iterator, Sequence
+
+from AI_TUI import metrics
+from AI_TUI.clients import get_async_client, get_client
+from AI_TUI.context import SUMMARY_PREFIX, Window
+from AI_TUI.log_writer import format_msgs
+from AI_TUI.response_cache import ResponseCache, cache_key
+from AI_TUI.server_context import ServerContext
+from AI_TUI.tools.executor import run_calls
+from AI_TUI.tools.registry import get_registry
 
 if TYPE_CHECKING:
-    from AI_TUI.main import MessagesArray, Config
+    from AI_TUI.main import Message, MessagesArray, Config
 
 ERROR_MESSAGE = "ERROR. press enter to continue"
+# set by batch mode, nobody is there to press enter after an error
+HEADLESS = False
+SUMMARY_REQUEST = (
+    "Summarize the conversation you are given in a few short paragraphs. "
+    "Keep facts, names, decisions and open questions, drop small talk."
+)
 
 
-def get_tools(home: Path) -> list[dict[str, str | dict]]:
-    if (home / "src").exists():
-        home = home / "src"
+class StreamError(Exception):
+    """
+    a stream that broke off, raised by the providers after they reported it.
+    what it yielded so far is not the whole answer
+    """
 
-    tool_data = home / "tools" / "tools.json"
 
-    if not tool_data.exists():
-        raise FileNotFoundError(f"json tool data not found in {tool_data}")
+def pause_on_error() -> None:
+    # worker threads (batch, hedged and fan-out queries) can't own the prompt
+    if not HEADLESS and threading.current_thread() is threading.main_thread():
+        input(ERROR_MESSAGE)
 
-    return json.loads(tool_data.read_text(encoding="utf-8"))
 
+def get_tools(home: Path) -> list[dict]:
+    return get_registry(home).openai_tools()
 
-def make_query_openai(
-    client: OpenAI, messages: MessagesArray | list, config: Config, home: Path
-) -> str | None:
-    try:
-        response = client.responses.create(
-            model=config.model,
-            input=messages.to_list(),  # type: ignore
-            tools=get_tools(home),  # type: ignore
-        )
-        has_called_tools = False
-
-        for call in response.output:
-            if call.type == "function_call":
-                has_called_tools = True
-                result = tool_callables.functions[call.name](**call.arguments)  # type: ignore
-                _messages: list = messages.copy()
-                _messages.append(call)
-                _messages.append(
-                    {
-                        "type": "function_call_output",
-                        "call_id": call.call_id,
-                        "output": str(result),
-                    }
-                )
-                return make_query_openai(client, _messages, config, home)
-
-        if not has_called_tools:
-            return response.output_text
-
-    except openai.RateLimitError:
-        print("Too many requests. Try again later.")
-        return None
-
-    except openai.OpenAIError as err:
-        print(err or "")
-        print(f"ERROR MSG: {getattr(err, 'message', 'None avaliable')}")
-        input(ERROR_MESSAGE)
-        return None
 
+def run_tools(
+    calls: list[tuple[str, dict[str, Any]]], config: Config, home: Path
+) -> list[Any]:
+    return run_calls(
+        calls, get_registry(home), config.tool_workers, config.tool_timeout
+    )
 
-def get_gemini_tools(home: Path) -> types.Tool:
-    return types.Tool(function_declarations=[*get_tools(home)])  # type: ignore
 
+def get_provider(config: Config) -> ModuleType:
+    """imports only the sdk of the configured api type"""
+    if config.api_type == "google":
+        from AI_TUI.providers import google_api  # pylint: disable = C0415
 
-def make_query_gemini(
-    client: genai.Client,
-    messages: list[types.Content],
-    config: Config,
-    model_config: types.GenerateContentConfig,
-) -> str | None:
-    try:
-        response = client.models.generate_content(
-            model=config.model, contents=messages, config=model_config
-        )
-    except g_error.APIError as e:
-        print(e)
-        input(ERROR_MESSAGE)
-        return None
+        return google_api
 
-    if response.function_calls:
-        return handle_gemini_tools(response, client, messages, config, model_config)
+    if config.api_type == "openai":
+        from AI_TUI.providers import openai_api  # pylint: disable = C0415
+
+        return openai_api
+
+    raise TypeError(f"unknown api type: {config.api_type}")
+
+
+def build_payload(
+    provider: ModuleType, messages: MessagesArray, window: Window
+) -> list:
+    """
+    provider-specific request history. messages keeps the converted
+    messages around, so only the ones added since last turn get converted
+    """
+    key, convert = provider.__name__, provider.convert
+    summary = [convert(window.summary)] if window.summary else []
+    return (
+        messages.converted(key, convert, 0, 1)
+        + summary
+        + messages.converted(key, convert, window.start)
+    )
 
-    elif response.text:
-        return response.text
 
-    print(f"ERROR: {response}")
-    input(ERROR_MESSAGE)
-    return None
+def server_context(messages: MessagesArray, config: Config) -> ServerContext | None:
+    """what the provider holds of this conversation, when Config.server_context"""
+    return messages.server if config.server_context == "yes" else None
 
 
-def handle_gemini_tools(
-    response,
-    client: genai.Client,
-    messages: list[types.Content],
-    config: Config,
-    model_config: types.GenerateContentConfig,
-) -> str | None:
-    for call in response.function_calls:
-        if not call.name:
-            raise ValueError(
-                f"invalid function call in {make_query_gemini.__name__}: {call}"
-            )
-
-        result = tool_callables.functions[call.name](**call.args)  # type: ignore
-        function_response_part = types.Part.from_function_response(
-            name=call.name,
-            response={"result": result},
-        )
-        messages.extend(add_function_call_content(call, function_response_part))
-        return make_query_gemini(client, messages, config, model_config)
+def fit_context(
+    api_key: str, messages: MessagesArray, config: Config, home: Path
+) -> Window:
+    """the part of the history that fits in Config.context_budget"""
 
+    def summarize(previous: str, turns: Sequence[Message]) -> str | None:
+        from AI_TUI.main import Message  # pylint: disable = C0415
 
-def add_function_call_content(
-    call: types.FunctionCall, response: types.Part
-) -> list[types.Content]:
-    return [
-        types.Content(role="model", parts=[types.Part(function_call=call)]),
-        types.Content(role="user", parts=[response]),
-    ]
+        transcript = format_msgs(turns)
+        if previous:
+            transcript = f"{SUMMARY_PREFIX}{previous}\n\n{transcript}"
+        provider = get_provider(config)
+        request = [
+            provider.convert(Message(role="developer", content=SUMMARY_REQUEST)),
+            provider.convert(Message(role="user", content=transcript)),
+        ]
+        return provider.query(get_client(config, api_key), request, config, home)
 
+    return messages.context.fit(messages, config, summarize)
 
-def google_messages_formatter(
-    messages: MessagesArray, home: Path
-) -> tuple[list[types.Content], types.GenerateContentConfig]:
-    config = types.GenerateContentConfig(
-        system_instruction=messages[0].content, tools=[get_gemini_tools(home)]
-    )
 
-    roles = ["model" if m.role == "assistant" else "user" for m in messages[1:]]
-    return [
-        types.Content(parts=[types.Part(text=m.content)], role=r)
-        for m, r in zip(messages[1:], roles)
-    ], config
+def cached(
+    cache: ResponseCache | None, config: Config, messages: MessagesArray, home: Path
+) -> tuple[str | None, str | None]:
+    """the cache key of the query and the cached response, if any"""
+    if cache is None:
+        return None, None
+    key = cache_key(config, get_tools(home), messages)
+    return key, cache.get(key)
 
 
 def make_query(
-    api_key: str, messages: MessagesArray, config: Config, home: Path
+    api_key: str,
+    messages: MessagesArray,
+    config: Config,
+    home: Path,
+    cache: ResponseCache | None = None,
 ) -> str | None:
-    if config.api_type == "google":
-        api = genai.Client(api_key=api_key)
-        msgs, model_config = google_messages_formatter(messages, home)
-        return make_query_gemini(api, msgs, config, model_config)
-
-    if config.api_type == "openai":
-        api = OpenAI(
-            base_url=str(config.endpoint),
-            api_key=api_key,
+    key, hit = cached(cache, config, messages, home)
+    if hit is not None:
+        metrics.first_token()
+        return hit
+
+    provider = get_provider(config)
+    with metrics.span("request"):
+        window = fit_context(api_key, messages, config, home)
+        response = provider.query(
+            get_client(config, api_key),
+            build_payload(provider, messages, window),
+            config,
+            home,
+            server_context(messages, config),
         )
-        return make_query_openai(api, messages, config, home)
+    metrics.first_token()
+    if cache and key and response:
+        cache.put(key, response)
+    return response
 
-    raise TypeError
+
+def make_query_stream(
+    api_key: str,
+    messages: MessagesArray,
+    config: Config,
+    home: Path,
+    cache: ResponseCache | None = None,
+) -> Iterator[str]:
+    """
+    same as make_query but yields the response text as it is generated.
+    only an answer that streamed to the end gets cached
+    """
+    key, hit = cached(cache, config, messages, home)
+    if hit is not None:
+        metrics.first_token()
+        yield hit
+        return
+
+    provider = get_provider(config)
+    chunks: list[str] = []
+    # the time the reader spends between chunks counts too
+    with metrics.span("request"):
+        window = fit_context(api_key, messages, config, home)
+        for chunk in provider.stream(
+            get_client(config, api_key),
+            build_payload(provider, messages, window),
+            config,
+            home,
+            server_context(messages, config),
+        ):
+            metrics.first_token()
+            chunks.append(chunk)
+            yield chunk
+    if cache and key and chunks:
+        cache.put(key, "".join(chunks))
+
+
+async def make_query_async(
+    api_key: str,
+    messages: MessagesArray,
+    config: Config,
+    home: Path,
+    cache: ResponseCache | None = None,
+) -> AsyncIterator[str]:
+    """asyncio version of make_query_stream, cancelling it stops the request"""
+    key, hit = await asyncio.to_thread(cached, cache, config, messages, home)
+    if hit is not None:
+        metrics.first_token()
+        yield hit
+        return
+
+    provider = get_provider(config)
+    chunks: list[str] = []
+    with metrics.span("request"):
+        # summarizing is a blocking request of its own
+        window = await asyncio.to_thread(fit_context, api_key, messages, config, home)
+        async for chunk in provider.stream_async(
+            get_async_client(config, api_key),
+            build_payload(provider, messages, window),
+            config,
+            home,
+            server_context(messages, config),
+        ):
+            metrics.first_token()
+            chunks.append(chunk)
+            yield chunk
+    if cache and key and chunks:
+        cache.put(key, "".join(chunks))
 
 
 if __name__ == "__main__":
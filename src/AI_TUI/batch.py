@@ -0,0 +1,144 @@
+# pylint: disable = C0116, C0115, C0114, C0411
+"""
+headless mode for scripts. every line of the input jsonl is a conversation
+of its own, either {"prompt": "..."} or {"messages": [{"role", "content"}]},
+with an optional "id". they run a few at a time through make_query and a
+result line is written as soon as each one finishes
+"""
+
+from __future__ import annotations
+
+import contextlib
+import json
+import math
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import IO, Any
+
+from AI_TUI import backend
+from AI_TUI.clients import close_clients
+from AI_TUI.log_writer import ROLES
+from AI_TUI.main import (
+    SOURCE,
+    Message,
+    MessagesArray,
+    get_config,
+    get_response_cache,
+)
+from AI_TUI.tools.executor import shutdown_pools
+from AI_TUI.tools.registry import get_registry
+
+PERCENTILES = (50, 90, 99)
+
+
+def read_job(number: int, line: str) -> dict[str, Any]:
+    """the job on a line, a line that isn't one gets an error and no messages"""
+    try:
+        job = json.loads(line)
+    except ValueError as err:
+        return {"id": number, "error": f"line {number} is not json: {err}"}
+    if not isinstance(job, dict):
+        return {"id": number, "error": f"line {number} is not a json object"}
+    job.setdefault("id", number)
+    if "prompt" in job:
+        job["messages"] = [{"role": "user", "content": job["prompt"]}]
+    if not job.get("messages"):
+        return {"id": job["id"], "error": f"line {number} has no prompt or messages"}
+    return job
+
+
+def read_jobs(path: Path) -> list[dict[str, Any]]:
+    with path.open(encoding="utf-8") as f:
+        return [read_job(n, line) for n, line in enumerate(f, 1) if line.strip()]
+
+
+def job_messages(job: dict[str, Any]) -> MessagesArray:
+    messages = []
+    for m in job["messages"]:
+        # Message(**m) takes any role, the api doesn't
+        if not isinstance(m, dict) or m.get("role") not in ROLES:
+            raise ValueError(f"not a message: {json.dumps(m, ensure_ascii=False)}")
+        messages.append(Message(**m))
+    return MessagesArray(messages)
+
+
+def run_job(job: dict[str, Any], api_key: str) -> dict[str, Any]:
+    if not job.get("messages"):
+        # a bad line fails like a bad message would, the rest still runs
+        return {"id": job["id"], "latency": 0.0, "error": job["error"]}
+    start = time.perf_counter()
+    result: dict[str, Any] = {"id": job["id"]}
+    try:
+        # a malformed message fails its own job, not the batch
+        messages = job_messages(job)
+        response = backend.make_query(
+            api_key, messages, get_config(), SOURCE, get_response_cache()
+        )
+    except Exception as err:  # pylint: disable = W0718
+        response = None
+        result["error"] = f"{type(err).__name__}: {err}"
+    result["latency"] = round(time.perf_counter() - start, 4)
+    if response:
+        result["response"] = response
+    else:
+        result.setdefault("error", "no response from the API")
+    return result
+
+
+def percentile(ordered: list[float], p: float) -> float:
+    """nearest rank, ordered has to be sorted and not empty"""
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def report(latencies: list[float], failed: int, elapsed: float) -> str:
+    done = len(latencies) + failed
+    lines = [
+        f"{done} prompts in {elapsed:.2f}s, {failed} failed, "
+        f"{done / elapsed if elapsed else 0:.2f} prompts/s"
+    ]
+    if latencies:
+        ordered = sorted(latencies)
+        lines.append(
+            "latency "
+            + ", ".join(f"p{p} {percentile(ordered, p):.3f}s" for p in PERCENTILES)
+        )
+    return "\n".join(lines)
+
+
+def run_batch(path: Path, output: IO[str], concurrency: int) -> int:
+    """returns the exit code: 1 if any prompt failed"""
+    backend.HEADLESS = True
+    jobs = read_jobs(path)
+    config = get_config()
+    get_registry(SOURCE)
+    get_response_cache()  # created once here, not by racing workers
+    latencies: list[float] = []
+    failed = 0
+    start = time.perf_counter()
+    # provider errors are printed, keep them out of the results
+    with contextlib.redirect_stdout(sys.stderr), ThreadPoolExecutor(
+        max_workers=max(1, concurrency)
+    ) as pool:
+        try:
+            futures = [pool.submit(run_job, job, config.api_key) for job in jobs]
+            for future in as_completed(futures):
+                result = future.result()
+                output.write(json.dumps(result, ensure_ascii=False) + "\n")
+                output.flush()
+                if "error" in result:
+                    failed += 1
+                else:
+                    latencies.append(result["latency"])
+        except KeyboardInterrupt:
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        finally:
+            close_clients()
+            shutdown_pools()
+            if cache := get_response_cache():
+                cache.close()
+    print(report(latencies, failed, time.perf_counter() - start), file=sys.stderr)
+    return 1 if failed else 0
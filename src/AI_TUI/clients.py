@@ -0,0 +1,131 @@
+# pylint: disable = C0116, C0115, C0114, C0411, C0415
+# sdk imports live inside the functions so only the configured one gets loaded
+
+from __future__ import annotations
+
+import importlib.util
+import threading
+from urllib.parse import urlsplit
+from typing import TYPE_CHECKING, Any, Union
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, OpenAI
+    from google import genai
+    from AI_TUI.pydantic_stuff.models import Config
+
+    Client = Union[OpenAI, genai.Client]
+    AsyncClient = Union[AsyncOpenAI, genai.Client]
+
+_clients: dict[tuple[str, str, str], Client] = {}
+_async_clients: dict[tuple[str, str, str], AsyncOpenAI] = {}
+_lock = threading.Lock()
+
+
+def http2_enabled(config: Config) -> bool:
+    # http2 needs the optional h2 package, fall back to http/1.1 without it
+    return config.http2 == "yes" and importlib.util.find_spec("h2") is not None
+
+
+def get_limits(config: Config) -> Any:
+    import httpx
+
+    return httpx.Limits(
+        max_connections=config.pool_size,
+        max_keepalive_connections=config.pool_size,
+    )
+
+
+def create_openai(config: Config, api_key: str) -> OpenAI:
+    from openai import DefaultHttpxClient, OpenAI
+
+    # retries are done by ratelimit.py, which also honors the rate limits
+    return OpenAI(
+        base_url=str(config.endpoint),
+        api_key=api_key,
+        max_retries=0,
+        http_client=DefaultHttpxClient(
+            http2=http2_enabled(config), limits=get_limits(config)
+        ),
+    )
+
+
+def create_async_openai(config: Config, api_key: str) -> AsyncOpenAI:
+    from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+    return AsyncOpenAI(
+        base_url=str(config.endpoint),
+        api_key=api_key,
+        max_retries=0,
+        http_client=DefaultAsyncHttpxClient(
+            http2=http2_enabled(config), limits=get_limits(config)
+        ),
+    )
+
+
+def create_gemini(config: Config, api_key: str) -> genai.Client:
+    from google import genai
+    from google.genai import types
+    from AI_TUI.pydantic_stuff.models import DEFAULT_API
+
+    options: dict[str, Any] = {}
+    if str(config.endpoint) != DEFAULT_API:
+        # the sdk takes the version apart from the host: http://host/ + v1beta
+        url = urlsplit(str(config.endpoint))
+        options["base_url"] = f"{url.scheme}://{url.netloc}/"
+        options["api_version"] = url.path.strip("/") or None
+    # older google-genai versions don't accept custom httpx arguments
+    httpx_args = {"http2": http2_enabled(config), "limits": get_limits(config)}
+    if "client_args" in types.HttpOptions.model_fields:
+        options["client_args"] = httpx_args
+    # client.aio, the streaming path, has an httpx client of its own
+    if "async_client_args" in types.HttpOptions.model_fields:
+        options["async_client_args"] = httpx_args
+    return genai.Client(api_key=api_key, http_options=types.HttpOptions(**options))
+
+
+def get_client(config: Config, api_key: str) -> Client:
+    """
+    returns a client shared by every query with the same api type, endpoint
+    and key, so keep-alive connections survive between turns
+    """
+    key = (config.api_type, str(config.endpoint), api_key)
+    with _lock:
+        if key not in _clients:
+            if config.api_type == "google":
+                _clients[key] = create_gemini(config, api_key)
+            elif config.api_type == "openai":
+                _clients[key] = create_openai(config, api_key)
+            else:
+                raise TypeError(f"unknown api type: {config.api_type}")
+        return _clients[key]
+
+
+def get_async_client(config: Config, api_key: str) -> AsyncClient:
+    """
+    same as get_client, for the asyncio backend. gemini clients
+    carry their async api in client.aio so they are shared with get_client
+    """
+    if config.api_type != "openai":
+        return get_client(config, api_key)
+    key = (config.api_type, str(config.endpoint), api_key)
+    with _lock:
+        if key not in _async_clients:
+            _async_clients[key] = create_async_openai(config, api_key)
+        return _async_clients[key]
+
+
+async def close_async_clients() -> None:
+    # async clients belong to the event loop, close them before it stops
+    with _lock:
+        clients = list(_async_clients.values())
+        _async_clients.clear()
+    for client in clients:
+        await client.close()
+
+
+def close_clients() -> None:
+    with _lock:
+        for (api_type, _, _), client in _clients.items():
+            if api_type == "openai":
+                client.close()  # type: ignore
+        _clients.clear()
@@ -4,17 +4,17 @@ from __future__ import annotations
 
 from pathlib import Path
 
-import mdv
-import questionary
 import tomllib
 
 from AI_TUI import main
+from AI_TUI.log_viewer import view_log
 
 EDITOR_MESSAGE = (
     'INFO: Press "CTRL" + "D" to save.\n'
     'INFO: Press "CTRL" + "C" to cancel.\n'
     "WARN: api_endpoint setting is not used if your model type is gemini."
 )
+RESUME_CHOICE = "Resume the conversation from here"
 
 
 def text_edit(initial: str = "", msg: str | None = None) -> tuple[str, bool]:
@@ -40,9 +40,15 @@ def edit_toml() -> None:
 
 
 def find_logs() -> None:
+    import questionary  # pylint: disable = C0415
+
     folder = (Path(main.HOME) / main.LOG_NAME).parent
     log_name = Path(main.LOG_NAME)
-    logs = {f.name: f for f in folder.glob(f"{log_name.stem}*") if not f.is_dir()}
+    logs = {
+        f.name: f
+        for f in folder.glob(f"{log_name.stem}*{log_name.suffix}")
+        if not f.is_dir()
+    }
 
     if len(logs) == 0:
         print("Log not found.")
@@ -57,18 +63,60 @@ def find_logs() -> None:
         return read_log(logs[selected])
 
 
-def read_log(log: Path) -> None:
-    contents = log.read_text(encoding="utf-8")
-    print(mdv.main(contents))
-    main.keypress_to_exit("c-d", "c-c", "enter", "escape")
+def search_logs() -> None:
+    import questionary  # pylint: disable = C0415
+
+    text = questionary.text("Search the conversation logs for:").ask(kbi_msg="")
+    if not text or not text.strip():
+        return None
+    index = main.get_log_index()
+    index.refresh()
+    hits = index.search(text)
+    main.clear()
+    if not hits:
+        print(f"Nothing found for {text!r}.")
+        return None
+
+    hit = questionary.select(
+        message="Select a match:",
+        choices=[
+            questionary.Choice(
+                title=f"{h.log} #{h.position} {h.role}: {h.snippet}", value=h
+            )
+            for h in hits
+        ],
+    ).ask(kbi_msg="")
+    main.clear()
+    if hit is None:
+        return None
+
+    action = questionary.select(
+        message=f"{hit.log}, message {hit.position}:",
+        choices=[RESUME_CHOICE, "View log", "Back"],
+    ).ask(kbi_msg="")
+    main.clear()
+    if action == "View log":
+        read_log(index.folder / hit.log, hit.position)
+    elif action == RESUME_CHOICE:
+        # a user message is resumed together with the answer it got
+        upto = hit.position + (hit.role == "user")
+        main.ArgsSingleton.resume = index.messages(hit.log, upto)
+    return None
+
+
+def read_log(log: Path, start: int = 0) -> None:
+    view_log(log, start)
     main.clear()
 
 
 def startup() -> None | type[Exception]:
+    import questionary  # pylint: disable = C0415
+
     main.clear()
     choices = {
         "Edit config.toml": edit_toml,
         "See conversation log": find_logs,
+        "Search conversation logs": search_logs,
         "Go back to main program": None,
         "Exit program": Exception,
     }
@@ -86,6 +134,8 @@ def startup() -> None | type[Exception]:
 
         if callable(result):
             result()
+        if main.ArgsSingleton.resume:
+            return None
 
 
 if __name__ == "__main__":
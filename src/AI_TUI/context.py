@@ -0,0 +1,95 @@
+# pylint: disable = C0116, C0115, C0114, C0411
+"""
+keeps the history sent to the provider under Config.context_budget tokens.
+the developer prompt is always kept, older turns are dropped ("window") or
+folded into a running summary ("summarize")
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Callable, NamedTuple, Sequence
+
+if TYPE_CHECKING:
+    from AI_TUI.main import Message
+    from AI_TUI.pydantic_stuff.models import Config
+
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD = 4
+# share of the budget kept free for the summary of the dropped turns
+SUMMARY_SHARE = 0.15
+SUMMARY_PREFIX = "Summary of the earlier part of this conversation:\n"
+
+Summarizer = Callable[[str, "Sequence[Message]"], "str | None"]
+
+
+class Window(NamedTuple):
+    """send messages[0], then the summary if there is one, then messages[start:]"""
+
+    start: int = 1
+    summary: Message | None = None
+
+
+def estimate_tokens(text: str) -> int:
+    """rough token count, good enough for budgeting without a tokenizer"""
+    return len(text) // CHARS_PER_TOKEN + MESSAGE_OVERHEAD
+
+
+def window_start(messages: Sequence[Message], budget: int) -> int:
+    """index of the oldest message that still fits, never past the last one"""
+    used = messages[0].tokens
+    start = len(messages)
+    while start > 1 and used + messages[start - 1].tokens <= budget:
+        start -= 1
+        used += messages[start].tokens
+    return min(start, len(messages) - 1) if len(messages) > 1 else 1
+
+
+class ContextManager:
+    def __init__(self) -> None:
+        # the summary covers messages[1:summary_end], boundary is the last of
+        # them, kept to notice when undo or a new session changed that prefix
+        self.text = ""
+        self.summary: Message | None = None
+        self.summary_end = 1
+        self.boundary: Message | None = None
+
+    def fit(
+        self,
+        messages: Sequence[Message],
+        config: Config,
+        summarize: Summarizer | None = None,
+    ) -> Window:
+        budget = config.context_budget
+        if budget <= 0 or sum(m.tokens for m in messages) <= budget:
+            return Window()
+
+        if config.context_strategy != "summarize" or summarize is None:
+            return Window(window_start(messages, budget))
+
+        start = window_start(messages, int(budget * (1 - SUMMARY_SHARE)))
+        return Window(start, self.summarize_upto(messages, start, summarize))
+
+    def summarize_upto(
+        self, messages: Sequence[Message], start: int, summarize: Summarizer
+    ) -> Message | None:
+        from AI_TUI.main import Message  # pylint: disable = C0415
+
+        still_valid = (
+            self.boundary is not None
+            and self.summary_end <= start
+            and messages[self.summary_end - 1] is self.boundary
+        )
+        if not still_valid:
+            self.text, self.summary, self.summary_end = "", None, 1
+
+        if self.summary_end < start:
+            # only the newly dropped turns get summarized, on top of the old summary
+            text = summarize(self.text, messages[self.summary_end : start])
+            if text is None:
+                return None
+            self.text = text
+            self.summary = Message(role="user", content=SUMMARY_PREFIX + text)
+            self.summary_end = start
+            self.boundary = messages[start - 1]
+
+        return self.summary
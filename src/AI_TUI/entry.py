@@ -1,8 +1,9 @@
 # pylint: disable = C0116, C0115, C0114, C0411
 
 import argparse
-from AI_TUI.main import startup
-from AI_TUI.main import ArgsSingleton
+import multiprocessing
+import sys
+from pathlib import Path
 
 
 def main() -> None:
@@ -10,6 +11,9 @@ def main() -> None:
     entry point for application for main.py
     optional, running main.py also works
     """
+    # tools with "executor": "process" start workers by running the frozen
+    # binary again, this makes those copies run the worker instead of the app
+    multiprocessing.freeze_support()
 
     parser = argparse.ArgumentParser(
         prog="AI-TUI",
@@ -32,9 +36,58 @@ def main() -> None:
         help="see the options straight from the get-go",
     )
 
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="print how long the imports at startup take, then exit",
+    )
+
+    parser.add_argument(
+        "--resume",
+        nargs="?",
+        const="",
+        default=None,
+        metavar="SESSION",
+        help="continue a saved session, the last one when no name is given",
+    )
+
+    parser.add_argument(
+        "--batch",
+        type=Path,
+        metavar="PROMPTS.jsonl",
+        help="run every prompt of a jsonl file without the UI, then exit",
+    )
+    parser.add_argument(
+        "--output",
+        type=argparse.FileType("w", encoding="utf-8"),
+        default=sys.stdout,
+        metavar="RESULTS.jsonl",
+        help="where --batch writes its results, stdout by default",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="how many --batch prompts run at once",
+    )
+
     args = parser.parse_args()
+    # pylint: disable = C0415
+    if args.profile_startup:
+        from AI_TUI.startup_profile import profile_startup
+
+        sys.exit(profile_startup())
+
+    if args.batch:
+        from AI_TUI.batch import run_batch
+
+        sys.exit(run_batch(args.batch, args.output, args.concurrency))
+
+    from AI_TUI.main import ArgsSingleton, startup
+
     ArgsSingleton.start_on_options = args.options
     ArgsSingleton.skip_intro = args.skip
+    ArgsSingleton.session = args.resume
 
     startup()
 
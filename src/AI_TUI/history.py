@@ -0,0 +1,55 @@
+# pylint: disable = C0116, C0115, C0114, C0411
+"""
+long sessions move their oldest message bodies to an anonymous temporary
+file, past Config.history_ram_mb. the messages keep their metadata and an
+offset into the file, reading them goes through an mmap of it
+"""
+
+from __future__ import annotations
+
+import mmap
+import tempfile
+import threading
+from functools import lru_cache
+
+
+class SpillFile:
+    def __init__(self) -> None:
+        # the os removes it once it is closed, or when the app exits
+        self._file = tempfile.TemporaryFile()
+        self._map: mmap.mmap | None = None
+        self.size = 0
+        self._lock = threading.Lock()
+
+    def write(self, text: str) -> tuple[int, int]:
+        """appends text, returns the offset and length to read it back with"""
+        data = text.encode("utf-8")
+        with self._lock:
+            offset = self.size
+            self._file.seek(offset)
+            self._file.write(data)
+            self._file.flush()
+            self.size += len(data)
+        return offset, len(data)
+
+    def read(self, offset: int, length: int) -> str:
+        if not length:
+            return ""
+        with self._lock:
+            if self._map is None or len(self._map) < offset + length:
+                # the file grew since it was mapped
+                if self._map is not None:
+                    self._map.close()
+                self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            return self._map[offset : offset + length].decode("utf-8")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+            self._file.close()
+
+
+@lru_cache
+def get_spill_file() -> SpillFile:
+    return SpillFile()
@@ -0,0 +1,173 @@
+# pylint: disable = C0116, C0115, C0114, C0411
+"""
+full text index of every conversation log, in sqlite (fts5 when the sqlite
+build has it, LIKE otherwise). the live log is indexed as it is written,
+logs written before the index existed get indexed by refresh()
+"""
+
+from __future__ import annotations
+
+import sqlite3
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, NamedTuple, Sequence
+
+from AI_TUI.log_writer import ROLES, apply_tombstones, parse_msgs
+
+if TYPE_CHECKING:
+    from AI_TUI.main import Message
+
+INDEX_FILE = "log_index.sqlite3"
+# bumped when parse_msgs changes, older indexes get rebuilt by refresh()
+INDEX_VERSION = 1
+SNIPPET_WORDS = 12
+SNIPPET_CHARS = 80
+
+
+class Hit(NamedTuple):
+    log: str
+    position: int
+    role: str
+    snippet: str
+
+
+def fts_query(text: str) -> str:
+    # every word quoted, so user input can't be fts syntax
+    return " ".join('"' + word.replace('"', '""') + '"' for word in text.split())
+
+
+def like_snippet(content: str, text: str) -> str:
+    at = max(0, content.lower().find(text.lower()) - SNIPPET_CHARS // 2)
+    return content[at : at + SNIPPET_CHARS]
+
+
+class LogIndex:
+    def __init__(self, path: Path, folder: Path, pattern: str) -> None:
+        self.folder = folder
+        self.pattern = pattern
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS logs (name TEXT PRIMARY KEY, mtime REAL)"
+        )
+        try:
+            self._db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS turns USING "
+                "fts5(content, log UNINDEXED, position UNINDEXED, role UNINDEXED)"
+            )
+        except sqlite3.OperationalError:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS turns "
+                "(content TEXT, log TEXT, position INTEGER, role TEXT)"
+            )
+        sql = self._db.execute(
+            "SELECT sql FROM sqlite_master WHERE name = 'turns'"
+        ).fetchone()[0]
+        self.fts = "fts5" in sql.lower()
+        if self._db.execute("PRAGMA user_version").fetchone()[0] < INDEX_VERSION:
+            self._db.execute("DELETE FROM turns")
+            self._db.execute("DELETE FROM logs")
+            self._db.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+        self._db.commit()
+
+    def _insert(self, log: str, rows: Sequence[tuple[int, str, str]]) -> None:
+        self._db.executemany(
+            "INSERT INTO turns (content, log, position, role) VALUES (?, ?, ?, ?)",
+            [(content, log, position, role) for position, role, content in rows],
+        )
+
+    def add(self, log: str, start: int, messages: Sequence[Message]) -> None:
+        """indexes messages, the first one being at start in the log"""
+        rows = [(start + i, m.role, m.content) for i, m in enumerate(messages)]
+        with self._lock:
+            self._insert(log, rows)
+            self._db.commit()
+
+    def retract(self, log: str, length: int) -> None:
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM turns WHERE log = ? AND position >= ?", (log, length)
+            )
+            self._db.commit()
+
+    def rename(self, old: str, new: Path) -> None:
+        """the live log got archived as new, its turns move along"""
+        with self._lock:
+            moved = self._db.execute(
+                "UPDATE turns SET log = ? WHERE log = ?", (new.name, old)
+            ).rowcount
+            # a log that was never indexed is left for refresh() to pick up
+            if moved:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO logs VALUES (?, ?)",
+                    (new.name, new.stat().st_mtime),
+                )
+            self._db.commit()
+
+    def forget(self, log: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM turns WHERE log = ?", (log,))
+            self._db.execute("DELETE FROM logs WHERE name = ?", (log,))
+            self._db.commit()
+
+    def refresh(self) -> None:
+        """indexes logs that are new or changed, drops the deleted ones"""
+        files = {f.name: f for f in self.folder.glob(self.pattern) if f.is_file()}
+        with self._lock:
+            known = dict(self._db.execute("SELECT name, mtime FROM logs"))
+        for name in known.keys() - files.keys():
+            self.forget(name)
+        for name, file in files.items():
+            mtime = file.stat().st_mtime
+            if known.get(name) == mtime:
+                continue
+            text = apply_tombstones(file.read_text(encoding="utf-8"))
+            rows = [(i, *message) for i, message in enumerate(parse_msgs(text))]
+            with self._lock:
+                self._db.execute("DELETE FROM turns WHERE log = ?", (name,))
+                self._insert(name, rows)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO logs VALUES (?, ?)", (name, mtime)
+                )
+                self._db.commit()
+
+    def search(self, text: str, limit: int = 50) -> list[Hit]:
+        with self._lock:
+            if self.fts:
+                rows = self._db.execute(
+                    "SELECT log, position, role, "
+                    f"snippet(turns, 0, '[', ']', '...', {SNIPPET_WORDS}) "
+                    "FROM turns WHERE turns MATCH ? ORDER BY rank LIMIT ?",
+                    (fts_query(text), limit),
+                ).fetchall()
+            else:
+                rows = [
+                    (log, position, role, like_snippet(content, text))
+                    for log, position, role, content in self._db.execute(
+                        "SELECT log, position, role, content FROM turns "
+                        "WHERE content LIKE ? LIMIT ?",
+                        (f"%{text}%", limit),
+                    )
+                ]
+        return [
+            Hit(log, int(position), role, " ".join(snippet.split()))
+            for log, position, role, snippet in rows
+        ]
+
+    def messages(self, log: str, upto: int) -> list[tuple[str, str]]:
+        """(role, content) of the messages of log up to position upto"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT position, role, content FROM turns WHERE log = ?", (log,)
+            ).fetchall()
+        rows.sort()
+        # whatever got indexed, only these roles go back to the api
+        return [
+            (role, content)
+            for at, role, content in rows
+            if at <= upto and role in ROLES
+        ]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,165 @@
+# pylint: disable = C0116, C0115, C0114, C0411
+"""
+paged viewer for conversation logs. the log is memory-mapped and split at
+its "### Role:" headers up front, only the turns on screen get rendered and
+the last few renders are kept around
+"""
+
+from __future__ import annotations
+
+import mmap
+from collections import OrderedDict
+from pathlib import Path
+
+from prompt_toolkit import Application
+from prompt_toolkit.application import get_app
+from prompt_toolkit.formatted_text import ANSI
+from prompt_toolkit.key_binding import KeyBindings
+from prompt_toolkit.layout import HSplit, Layout, Window
+from prompt_toolkit.layout.controls import FormattedTextControl
+
+from AI_TUI.log_writer import HEADERS, TOMBSTONE, apply_tombstones
+from AI_TUI.render import markdown
+
+RENDER_CACHE = 32
+HELP = "up/down scroll, pgup/pgdn page, n/p turn, g/G start/end, q quit"
+HEADER_LINES = {header.encode() for header in HEADERS}
+
+
+def header_offsets(data: bytes | mmap.mmap) -> list[int]:
+    """where every turn starts, anything before the first header counts as one"""
+    if not len(data):
+        return []
+    offsets = [0]
+    at = data.find(b"\n### ")
+    while at != -1:
+        end = data.find(b"\n", at + 1)
+        line = data[at + 1 : end if end != -1 else len(data)]
+        if line.rstrip() in HEADER_LINES and at + 1 != offsets[-1]:
+            offsets.append(at + 1)
+        at = data.find(b"\n### ", at + 1)
+    return offsets
+
+
+class LogFile:
+    def __init__(self, path: Path) -> None:
+        self._file = path.open("rb")
+        self.data: bytes | mmap.mmap = b""
+        if path.stat().st_size:
+            self.data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data.find(TOMBSTONE.encode()) != -1:
+            # only the live log has these, folding them needs the whole text
+            text = apply_tombstones(self.data[:].decode("utf-8", "replace"))
+            self.close()
+            self.data = text.encode("utf-8")
+        self.offsets = header_offsets(self.data)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def turn(self, i: int) -> str:
+        end = self.offsets[i + 1] if i + 1 < len(self.offsets) else len(self.data)
+        return self.data[self.offsets[i] : end].decode("utf-8", "replace")
+
+    def close(self) -> None:
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self._file.close()
+
+
+class LogViewer:
+    def __init__(self, log: LogFile, name: str, start: int = 0) -> None:
+        self.log = log
+        self.name = name
+        # the first turn on screen and how many of its lines are scrolled past
+        self.turn = min(start, max(0, len(log) - 1))
+        self.line = 0
+        self._rendered: OrderedDict[int, list[str]] = OrderedDict()
+
+    def rendered(self, i: int) -> list[str]:
+        if i in self._rendered:
+            self._rendered.move_to_end(i)
+        else:
+            self._rendered[i] = markdown(self.log.turn(i)).rstrip("\n").split("\n")
+            if len(self._rendered) > RENDER_CACHE:
+                self._rendered.popitem(last=False)
+        return self._rendered[i]
+
+    def height(self) -> int:
+        return max(1, get_app().output.get_size().rows - 1)
+
+    def page(self) -> ANSI:
+        lines: list[str] = []
+        i, skip = self.turn, self.line
+        while len(lines) < self.height() and i < len(self.log):
+            lines.extend(self.rendered(i)[skip:])
+            lines.append("")
+            i, skip = i + 1, 0
+        return ANSI("\n".join(lines[: self.height()]))
+
+    def status(self) -> str:
+        if not len(self.log):
+            return f" {self.name} is empty | q quit"
+        return f" {self.name} | turn {self.turn + 1}/{len(self.log)} | {HELP}"
+
+    def down(self, n: int) -> None:
+        self.line += n
+        # each turn is followed by a blank line, hence the + 1
+        while (
+            self.turn + 1 < len(self.log)
+            and self.line >= len(self.rendered(self.turn)) + 1
+        ):
+            self.line -= len(self.rendered(self.turn)) + 1
+            self.turn += 1
+        if self.turn + 1 >= len(self.log):
+            self.line = min(self.line, max(0, len(self.rendered(self.turn)) - 1))
+
+    def up(self, n: int) -> None:
+        self.line -= n
+        while self.line < 0 and self.turn > 0:
+            self.turn -= 1
+            self.line += len(self.rendered(self.turn)) + 1
+        self.line = max(0, self.line)
+
+    def go(self, turn: int) -> None:
+        self.turn = max(0, min(turn, len(self.log) - 1))
+        self.line = 0
+
+
+def view_log(path: Path, start: int = 0) -> None:
+    """shows the log a screen at a time, starting at turn start"""
+    log = LogFile(path)
+    viewer = LogViewer(log, path.name, start)
+    kb = KeyBindings()
+    kb.add("down")(lambda _: viewer.down(1))
+    kb.add("j")(lambda _: viewer.down(1))
+    kb.add("up")(lambda _: viewer.up(1))
+    kb.add("k")(lambda _: viewer.up(1))
+    kb.add("pagedown")(lambda _: viewer.down(viewer.height()))
+    kb.add("space")(lambda _: viewer.down(viewer.height()))
+    kb.add("pageup")(lambda _: viewer.up(viewer.height()))
+    kb.add("n")(lambda _: viewer.go(viewer.turn + 1))
+    kb.add("right")(lambda _: viewer.go(viewer.turn + 1))
+    kb.add("p")(lambda _: viewer.go(viewer.turn - (viewer.line == 0)))
+    kb.add("left")(lambda _: viewer.go(viewer.turn - (viewer.line == 0)))
+    kb.add("g")(lambda _: viewer.go(0))
+    kb.add("home")(lambda _: viewer.go(0))
+    kb.add("G")(lambda _: viewer.go(len(log) - 1))
+    kb.add("end")(lambda _: viewer.go(len(log) - 1))
+    for combo in ("q", "escape", "c-c", "c-d", "enter"):
+        kb.add(combo)(lambda event: event.app.exit())
+
+    layout = Layout(
+        HSplit(
+            [
+                Window(FormattedTextControl(viewer.page), wrap_lines=False),
+                Window(
+                    FormattedTextControl(viewer.status), height=1, style="reverse"
+                ),
+            ]
+        )
+    )
+    try:
+        Application(layout=layout, key_bindings=kb, full_screen=True).run()
+    finally:
+        log.close()
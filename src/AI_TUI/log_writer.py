@@ -0,0 +1,150 @@
+# pylint: disable = C0116, C0115, C0114, C0411
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Iterable, TextIO
+
+from AI_TUI import metrics
+
+if TYPE_CHECKING:
+    from AI_TUI.log_index import LogIndex
+    from AI_TUI.main import Message
+    from AI_TUI.pydantic_stuff.models import FsyncPolicy
+    from AI_TUI.session import SessionWriter
+
+TOMBSTONE = "<!-- AI-TUI: retracted -->\n"
+# only these start a message, replies have "### Heading:" lines of their own
+ROLES = ("developer", "user", "assistant")
+HEADERS = {f"### {role.capitalize()}:": role for role in ROLES}
+
+
+def format_msgs(m_array: Iterable[Message]) -> str:
+    return "".join(f"### {m.role.capitalize()}:\n{m.content}\n\n" for m in m_array)
+
+
+def is_header(line: str) -> bool:
+    return line.rstrip() in HEADERS
+
+
+def parse_msgs(text: str) -> list[tuple[str, str]]:
+    """(role, content) of every message of a log, undoes format_msgs"""
+    messages: list[tuple[str, list[str]]] = []
+    for line in text.splitlines(keepends=True):
+        if is_header(line):
+            messages.append((HEADERS[line.rstrip()], []))
+        elif messages:
+            messages[-1][1].append(line)
+    return [(role, "".join(lines).removesuffix("\n\n")) for role, lines in messages]
+
+
+def apply_tombstones(text: str) -> str:
+    """drops every message that was retracted by a tombstone record"""
+    if TOMBSTONE not in text:
+        return text
+    records: list[list[str]] = []
+    for line in text.splitlines(keepends=True):
+        if line == TOMBSTONE:
+            if records:
+                records.pop()
+        elif is_header(line) or not records:
+            records.append([line])
+        else:
+            records[-1].append(line)
+    return "".join("".join(r) for r in records)
+
+
+def replace_file(path: Path, data: str | bytes, fsync: FsyncPolicy) -> None:
+    """writes data next to path, then moves it over path in one step"""
+    temp = path.with_suffix(path.suffix + ".tmp")
+    if isinstance(data, bytes):
+        f: IO = temp.open("wb")
+    else:
+        f = temp.open("w", encoding="utf-8")
+    with f:
+        f.write(data)
+        if fsync != "never":
+            f.flush()
+            os.fsync(f.fileno())
+    temp.replace(path)
+
+
+def append(file: IO, data: str | bytes, fsync: FsyncPolicy) -> None:
+    """writes to a file that is appended to, to disk as well if fsync is always"""
+    file.write(data)
+    file.flush()
+    if fsync == "always":
+        os.fsync(file.fileno())
+
+
+def close_file(file: IO, fsync: FsyncPolicy) -> None:
+    """closes a file that was appended to, it's on disk unless fsync is never"""
+    if fsync != "never":
+        os.fsync(file.fileno())
+    file.close()
+
+
+class LogWriter:
+    """
+    append-only conversation log. new messages are appended, undos are
+    written as tombstones and compact() folds them back into plain markdown
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        fsync: FsyncPolicy = "exit",
+        index: LogIndex | None = None,
+        session: SessionWriter | None = None,
+    ) -> None:
+        self.path = path
+        self.fsync = fsync
+        # kept in step with the file, so searches see the live log too
+        self.index = index
+        # and the snapshot --resume reads
+        self.session = session
+        self.count = 0
+        self._file: TextIO | None = None
+
+    def _get_file(self) -> TextIO:
+        if self._file is None:
+            self.path.parent.mkdir(exist_ok=True, parents=True)
+            self._file = self.path.open("a", encoding="utf-8")
+        return self._file
+
+    def _write(self, text: str) -> None:
+        append(self._get_file(), text, self.fsync)
+
+    def sync(self, messages: list[Message]) -> None:
+        """appends the messages that haven't been written yet"""
+        if len(messages) > self.count:
+            with metrics.span("log"):
+                self._write(format_msgs(messages[self.count :]))
+                if self.index:
+                    self.index.add(self.path.name, self.count, messages[self.count :])
+        if self.session:
+            self.session.sync(messages)  # type: ignore
+        self.count = len(messages)
+
+    def retract(self, length: int) -> None:
+        """marks written messages past length as deleted"""
+        if self.count > length:
+            self._write(TOMBSTONE * (self.count - length))
+            if self.index:
+                self.index.retract(self.path.name, length)
+            self.count = length
+
+    def compact(self, messages: list[Message]) -> None:
+        """rewrites the log without tombstones"""
+        self.close()
+        if self.session:
+            self.session.compact(messages)  # type: ignore
+        if not self.path.exists():
+            return
+        replace_file(self.path, format_msgs(messages[: self.count]), self.fsync)
+
+    def close(self) -> None:
+        if self._file is not None:
+            close_file(self._file, self.fsync)
+            self._file = None
@@ -2,29 +2,47 @@
 
 from __future__ import annotations
 
+from collections import deque
 from datetime import datetime
+import hashlib
 import os
 import sys
+import threading
 from functools import lru_cache
 from pathlib import Path
-from typing import Literal, NoReturn
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Literal,
+    NoReturn,
+    Sequence,
+    SupportsIndex,
+)
 
-import mdv
 import pydantic_core
-import requests
-import toml
 import tomllib
 from prompt_toolkit import Application, PromptSession
-from prompt_toolkit.application import run_in_terminal
 from prompt_toolkit.cursor_shapes import CursorShape
 from prompt_toolkit.key_binding import KeyBindings, merge_key_bindings
 from prompt_toolkit.layout import Layout
 from prompt_toolkit.layout.containers import Window
 from prompt_toolkit.shortcuts import confirm
 
-from AI_TUI import config_tools
-from AI_TUI.backend import make_query
+from AI_TUI import config_tools, render
+from AI_TUI.clients import close_clients
+from AI_TUI.context import ContextManager, estimate_tokens
+from AI_TUI.history import get_spill_file
+from AI_TUI.log_writer import LogWriter, apply_tombstones
+from AI_TUI.metrics import METRICS_FILE
 from AI_TUI.pydantic_stuff.models import Config
+from AI_TUI.pydantic_stuff.probe import Probe
+from AI_TUI.server_context import ServerContext
+from AI_TUI.tools.registry import get_registry
+
+if TYPE_CHECKING:
+    from AI_TUI.log_index import LogIndex
+    from AI_TUI.response_cache import ResponseCache
 
 STARTUP_MESSAGE = (
     'INFO: Press "CTRL" + "D" to submit prompt '
@@ -33,13 +51,14 @@ STARTUP_MESSAGE = (
     "last message of the conversation.\n"
     'Press "CTRL" + "C" to exit.'
 )
-WAITING_MESSAGE = "Processing..."
 CONFIG_FILE = "config.toml"
 LOG_NAME = "logs/conversation_log.md"
 ENV_KEY = "API_KEY"
 CONTINUE_KEYS = ("c-d", "enter", "escape", "q", "c-q")
 GLOBAL_KEYS = KeyBindings()
-deleted: list[Message] = []
+UNDO_LIMIT = 100
+# the oldest undone messages fall off once there are more than UNDO_LIMIT
+deleted: deque[Message] = deque(maxlen=UNDO_LIMIT)
 
 
 def get_config_home() -> Path:
@@ -79,8 +98,13 @@ def get_src() -> Path:
 SOURCE = get_src()
 
 
-def clear() -> int:
-    return os.system("cls") if os.name == "nt" else os.system("clear")
+def clear() -> None:
+    # escape codes instead of running clear, no process per screen
+    if os.name == "nt":
+        os.system("cls")
+        return
+    sys.stdout.write("\x1b[H\x1b[2J\x1b[3J")
+    sys.stdout.flush()
 
 
 class ArgsSingleton:
@@ -91,6 +115,12 @@ class ArgsSingleton:
             cls.instance = super(ArgsSingleton, cls).__new__(cls)
             cls.skip_intro = False
             cls.start_on_options = False
+            # (role, content) pairs picked from a log search to continue from
+            cls.resume: list[tuple[str, str]] = []
+            # --resume, "" for the last session
+            cls.session: str | None = None
+            # server context entries of the resumed session
+            cls.server: dict[str, bytes] = {}
         return cls.instance
 
 
@@ -109,7 +139,41 @@ def get_config() -> Config:
     return config_wiz(data["main"])
 
 
+@lru_cache
+def get_probe() -> Probe:
+    """checks the endpoint and api key in the background"""
+    return Probe(HOME, get_config()).start()
+
+
+@lru_cache
+def get_response_cache() -> ResponseCache | None:
+    config = get_config()
+    if config.response_cache != "yes":
+        return None
+    # pylint: disable = C0415
+    # sqlite only gets imported when the cache is on
+    from AI_TUI.response_cache import CACHE_FILE, ResponseCache
+
+    return ResponseCache(HOME / CACHE_FILE, config.response_cache_mb)
+
+
+@lru_cache
+def get_log_index() -> LogIndex:
+    from AI_TUI.log_index import INDEX_FILE, LogIndex  # pylint: disable = C0415
+
+    log = Path(LOG_NAME)
+    folder = HOME / log.parent
+    folder.mkdir(exist_ok=True, parents=True)
+    return LogIndex(HOME / INDEX_FILE, folder, f"{log.stem}*{log.suffix}")
+
+
+def metrics_file() -> Path | None:
+    return HOME / METRICS_FILE if get_config().metrics_export == "yes" else None
+
+
 def write_config(data: dict) -> None:
+    import toml  # pylint: disable = C0415
+
     file = HOME / CONFIG_FILE
     with file.open("w", encoding="utf-8") as f:
         toml.dump(data, f)
@@ -140,63 +204,105 @@ def config_wiz(data: dict) -> Config:
     return config_data
 
 
-def check_connection(timeout=5) -> bool:
-    url = get_config().endpoint
-    try:
-        _ = requests.head(url=str(url), timeout=timeout, allow_redirects=True)
-        return True
-    except requests.ConnectionError:
-        return False
-
-
-def add_global_bindings(messages: MessagesArray) -> None:
+def add_global_bindings(
+    messages: MessagesArray,
+    log: LogWriter,
+    notify: Callable[[str], None],
+    busy: Callable[[], bool] = lambda: False,
+) -> None:
+    """busy tells whether an answer is being written, the history is left alone"""
     kb = GLOBAL_KEYS
 
     @kb.add("c-z")
     def _undo(_):
+        if busy():
+            notify("Wait for the answer, or cancel it, before undoing.")
+            return
         if len(messages) > 0 and messages[-1].role != "developer":
             m = messages.pop(-1)
             deleted.append(m)
-            run_in_terminal(
-                lambda: print(
-                    f"Deleted last message, by {m.role} with {len(m.content)} "
-                    'characters. Press "CONTROL" + "Y" to undo'
-                )
+            log.retract(len(messages))
+            if log.session:
+                log.session.undo(m, len(messages))
+            notify(
+                f"Deleted last message, by {m.role} with {m.size} "
+                'characters. Press "CONTROL" + "Y" to undo'
             )
 
     @kb.add("c-y")
     def _redo(_):
+        if busy():
+            notify("Wait for the answer, or cancel it, before redoing.")
+            return
         if len(deleted) > 0:
-            m = deleted.pop(-1)
+            m = deleted.pop()
             messages.append(m)
-            run_in_terminal(
-                lambda: print(
-                    "Undid last message deletion, was written by "
-                    f"{m.role} and had {len(m.content)} characters"
-                )
+            if log.session:
+                log.session.redo(len(messages))
+            notify(
+                "Undid last message deletion, was written by "
+                f"{m.role} and had {m.size} characters"
             )
 
+    @kb.add("c-b")
+    def _bypass_cache(_):
+        cache = get_response_cache()
+        if cache is None:
+            return
+        cache.bypass_next = not cache.bypass_next
+        state = "skip" if cache.bypass_next else "use"
+        notify(f"The next prompt will {state} the response cache.")
+
 
 def handle_log() -> None:
+    from AI_TUI.session import SESSION_SUFFIX  # pylint: disable = C0415
+
     log = HOME / LOG_NAME
     log.parent.mkdir(exist_ok=True, parents=True)
     if not log.exists():
         return None
-    text = log.read_text()
+    text = apply_tombstones(log.read_text(encoding="utf-8"))
     log.unlink()
-    if get_config().overwrite_log == "no":
-        if text:
-            create_numbered_log(log.parent, text)
+    session = log.with_suffix(SESSION_SUFFIX)
+    if get_config().overwrite_log == "no" and text:
+        archived = create_numbered_log(log.parent, text)
+        get_log_index().rename(log.name, archived)
+        if session.exists():
+            session.replace(archived.with_suffix(SESSION_SUFFIX))
+    else:
+        get_log_index().forget(log.name)
+        session.unlink(missing_ok=True)
     return None
 
 
-def create_numbered_log(path: Path, text: str) -> None:
+def load_resumed_session(name: str) -> None | NoReturn:
+    """fills ArgsSingleton and the undo stack from the --resume session"""
+    from AI_TUI.session import find_session, load_session  # pylint: disable = C0415
+
+    log = Path(LOG_NAME)
+    path = find_session(HOME / log.parent, log.stem, name)
+    if path is None:
+        sys.exit(f"ERROR: no session {name!r} found." if name else "ERROR: no session.")
+    try:
+        session = load_session(path, UNDO_LIMIT)
+    except ValueError as err:
+        sys.exit(f"ERROR: {err}")
+    ArgsSingleton.resume = session.messages
+    ArgsSingleton.server = session.server
+    deleted.extend(
+        Message(role=role, content=content)  # type: ignore
+        for role, content in session.deleted
+    )
+
+
+def create_numbered_log(path: Path, text: str) -> Path:
     now = datetime.now()
     pathlib_log = Path(LOG_NAME)
     log_name, suffix = pathlib_log.stem, pathlib_log.suffix
     file_name = f"{log_name}_{now.strftime(r'%Y-%m-%d_%H-%M-%S')}{suffix}"
     log = path / file_name
     log.write_text(text, "utf-8")
+    return log
 
 
 class AlternateBuffer:
@@ -212,13 +318,55 @@ class AlternateBuffer:
 
 
 class Message:
+    # sessions hold thousands of these, slots keep each one small
+    __slots__ = ("role", "size", "_content", "_where", "_tokens", "_digest")
+
     def __init__(
         self,
         role: Literal["user", "developer", "assistant"],
         content: str,
     ):
-        self.role = role
-        self.content = content
+        # interned, so all the messages share one string per role
+        self.role = sys.intern(role)
+        self.size = len(content)
+        self._content: str | None = content
+        # offset and length in the spill file, once the body moved there
+        self._where: tuple[int, int] | None = None
+        self._tokens: int | None = None
+        self._digest: bytes | None = None
+
+    @property
+    def content(self) -> str:
+        if self._content is None:
+            return get_spill_file().read(*self._where)  # type: ignore
+        return self._content
+
+    @property
+    def spilled(self) -> bool:
+        return self._content is None
+
+    def spill(self) -> None:
+        """moves the body to disk, the metadata stays in memory"""
+        if self._content is None or not self.size:
+            return
+        _ = self.tokens, self.digest
+        self._where = get_spill_file().write(self._content)
+        self._content = None
+
+    @property
+    def tokens(self) -> int:
+        """approximate, counted once per message"""
+        if self._tokens is None:
+            self._tokens = estimate_tokens(self.content)
+        return self._tokens
+
+    @property
+    def digest(self) -> bytes:
+        """hash of the role and the whitespace-trimmed content, counted once"""
+        if self._digest is None:
+            normalized = f"{self.role}\0{self.content.strip()}"
+            self._digest = hashlib.sha256(normalized.encode()).digest()
+        return self._digest
 
     def to_dict(self) -> dict[str, str]:
         return {"role": self.role, "content": self.content}
@@ -226,21 +374,114 @@ class Message:
 
 class MessagesArray(list[Message]):
     def __init__(self, initial=None) -> None:
+        # provider name -> messages converted for that provider, in order
+        self._converted: dict[str, list[Any]] = {}
+        # the warm-up and fan-out queries convert from other threads
+        self._lock = threading.RLock()
         super().__init__(initial or [])
         self.insert(0, Message(role="developer", content=get_config().prompt))
+        self.context = ContextManager()
+        self.server = ServerContext()
 
     def to_list(self) -> list[dict[str, str]]:
         return [m.to_dict() for m in self]
 
-
-def format_msgs(m_array: MessagesArray | tuple[Message, ...]) -> str:
-    return "".join(f"### {m.role.capitalize()}:\n{m.content}\n\n" for m in m_array)
-
-
-def update_log(contents: MessagesArray) -> None:
-    file = HOME / LOG_NAME
-    file.parent.mkdir(exist_ok=True, parents=True)
-    file.write_text(format_msgs(contents), encoding="utf-8")
+    def converted(
+        self,
+        key: str,
+        convert: Callable[[Message], Any],
+        start: int = 0,
+        stop: int | None = None,
+    ) -> list[Any]:
+        """
+        messages[start:stop] converted by convert, only new ones get converted.
+        spilled messages aren't kept converted, they get converted every time
+        """
+        with self._lock:
+            self.spill()
+            cache = self._converted.setdefault(key, [])
+            cache.extend(
+                None if m.spilled else convert(m) for m in self[len(cache) :]
+            )
+            part = cache[start:stop]
+            messages = self[start:stop]
+        if all(c is not None for c in part):
+            return part
+        return [convert(m) if c is None else c for c, m in zip(part, messages)]
+
+    def shared(self, items: Sequence[Any]) -> tuple[str, int]:
+        """
+        the provider whose converted messages items starts with, and how many
+        of them it starts with
+        """
+        best = ("", 0)
+        for key, cache in self._converted.items():
+            count = 0
+            for item, converted in zip(items, cache):
+                if item is not converted:
+                    break
+                count += 1
+            best = max(best, (key, count), key=lambda pair: pair[1])
+        return best
+
+    def spill(self) -> None:
+        """moves the oldest bodies to disk while they take more than history_ram_mb"""
+        budget = int(get_config().history_ram_mb * 1024 * 1024)
+        if budget <= 0:
+            return
+        with self._lock:
+            resident = sum(m.size for m in self if not m.spilled)
+            # the developer prompt is sent every turn, it stays
+            for i in range(1, len(self)):
+                if resident <= budget:
+                    break
+                message = self[i]
+                if message.spilled:
+                    continue
+                message.spill()
+                resident -= message.size
+                for cache in self._converted.values():
+                    if i < len(cache):
+                        cache[i] = None
+
+    def _invalidate(self, index: int) -> None:
+        with self._lock:
+            for cache in self._converted.values():
+                del cache[index:]
+
+    def _position(self, index: SupportsIndex) -> int:
+        i = index.__index__()
+        return max(0, i + len(self) if i < 0 else i)
+
+    def pop(self, index: SupportsIndex = -1) -> Message:
+        with self._lock:
+            position = self._position(index)
+            message = super().pop(index)
+            self._invalidate(position)
+        return message
+
+    def insert(self, index: SupportsIndex, message: Message) -> None:
+        with self._lock:
+            self._invalidate(self._position(index))
+            super().insert(index, message)
+
+    def remove(self, message: Message) -> None:
+        self.pop(self.index(message))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._invalidate(0)
+            super().clear()
+
+    def __setitem__(self, index, value) -> None:
+        with self._lock:
+            self._invalidate(0 if isinstance(index, slice) else self._position(index))
+            super().__setitem__(index, value)
+
+    def __delitem__(self, index) -> None:
+        with self._lock:
+            self._invalidate(0 if isinstance(index, slice) else self._position(index))
+            super().__delitem__(index)
 
 
 def keypress_to_exit(*combos: str) -> None:
@@ -257,7 +498,7 @@ def keypress_to_exit(*combos: str) -> None:
     app.run()
 
 
-def multiline_editor(initial: str = "") -> tuple[str, bool]:
+def editor_session() -> PromptSession:
     kb = KeyBindings()
 
     @kb.add("enter")
@@ -270,7 +511,7 @@ def multiline_editor(initial: str = "") -> tuple[str, bool]:
 
     merged = merge_key_bindings([kb, GLOBAL_KEYS])
 
-    session = PromptSession(
+    return PromptSession(
         message=">> ",
         multiline=True,
         key_bindings=merged,
@@ -278,6 +519,9 @@ def multiline_editor(initial: str = "") -> tuple[str, bool]:
         prompt_continuation=lambda width, line_number, is_soft_wrap: ">> ",
     )
 
+
+def multiline_editor(initial: str = "") -> tuple[str, bool]:
+    session = editor_session()
     try:
         received_input = session.prompt(default=initial)
     except KeyboardInterrupt:
@@ -286,37 +530,56 @@ def multiline_editor(initial: str = "") -> tuple[str, bool]:
     return received_input, False
 
 
-def conversation_loop(messages: MessagesArray, api_key: str):
-    while True:
-        clear()
-        print("Enter prompt:")
-        query, is_exit = multiline_editor()
-        if is_exit:
-            break
-
-        clear()
-        print(WAITING_MESSAGE, end="", flush=True)
-        messages.append(Message(role="user", content=query))
-        response = make_query(api_key, messages, get_config(), SOURCE)
-        if not response:
-            print("ERROR: did not receive response from API. Exiting on input.")
-            keypress_to_exit(*CONTINUE_KEYS)
-            break
-
-        print(f"\r{' ' * len(WAITING_MESSAGE)}\r", end="", flush=True)
-        print(mdv.main(response))
-        messages.append(Message(role="assistant", content=response))
-        update_log(contents=messages)
-        keypress_to_exit("c-d")
+def open_log(messages: MessagesArray) -> LogWriter:
+    """
+    the log and snapshot of this session, with the resumed messages in them
+    from the start: handle_log archives or deletes the ones they came from
+    """
+    # pylint: disable = C0415
+    from AI_TUI.session import SESSION_SUFFIX, SessionWriter
+
+    fsync = get_config().log_fsync
+    snapshot = (HOME / LOG_NAME).with_suffix(SESSION_SUFFIX)
+    log = LogWriter(
+        HOME / LOG_NAME,
+        fsync,
+        get_log_index(),
+        SessionWriter(snapshot, fsync, deleted),
+    )
+    handle_log()
+    if ArgsSingleton.resume:
+        log.sync(messages)
+    return log
 
 
 def orchestrate() -> None:
+    # pylint: disable = C0415
+    # kept out of the import of main, see --profile-startup
+    from AI_TUI.app import ChatApp
+    from AI_TUI.session import restore_server
+    from AI_TUI.tools.executor import shutdown_pools
+
     clear()
-    messages = MessagesArray()
-    add_global_bindings(messages)
-    handle_log()
-    api_key = get_config().api_key
-    conversation_loop(messages, api_key)
+    get_registry(SOURCE)
+    messages = MessagesArray(
+        Message(role=role, content=content)  # type: ignore
+        for role, content in ArgsSingleton.resume
+        if role != "developer"
+    )
+    if ArgsSingleton.server and get_config().server_context == "yes":
+        restore_server(messages, ArgsSingleton.server)
+    log = open_log(messages)
+    app = ChatApp(messages, get_config().api_key, log)
+    add_global_bindings(messages, log, app.notice, app.answering)
+    try:
+        app.run()
+    finally:
+        log.compact(messages)
+        close_clients()
+        shutdown_pools()
+        get_log_index().close()
+        if cache := get_response_cache():
+            cache.close()
 
 
 def see_if_options() -> None | NoReturn:
@@ -337,9 +600,12 @@ def go_to_config() -> None | NoReturn:
 
 
 def startup() -> None:
+    if ArgsSingleton.session is not None:
+        load_resumed_session(ArgsSingleton.session)
     with AlternateBuffer():
         clear()
-        get_config()
+        render.renderer = get_config().renderer
+        get_probe()
         clear()
         if not ArgsSingleton.skip_intro:
             see_if_options()
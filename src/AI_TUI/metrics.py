@@ -0,0 +1,155 @@
+# pylint: disable = C0116, C0115, C0114, C0411
+"""
+timings and token counts per turn. spans add up the time spent under a name
+(request, tool:<name>, render, log) for the turn that is running, outside of
+a turn they do nothing. the last finished turn is shown in the toolbar and
+can be appended to a jsonl file
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+METRICS_FILE = "metrics.jsonl"
+
+
+class Turn:
+    def __init__(self) -> None:
+        self.wall = time.time()
+        self.started = time.perf_counter()
+        self.first_token: float | None = None
+        self.ended: float | None = None
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.spans: dict[str, float] = {}
+        # tool timers finish on pool threads
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def timer(self, name: str) -> Callable[[Any], None]:
+        """a callback that adds the time from now until it is called"""
+        start = time.perf_counter()
+        return lambda _: self.add(name, time.perf_counter() - start)
+
+    @property
+    def total(self) -> float:
+        return (self.ended or time.perf_counter()) - self.started
+
+    @property
+    def ttft(self) -> float | None:
+        if self.first_token is None:
+            return None
+        return self.first_token - self.started
+
+    @property
+    def tokens_per_second(self) -> float | None:
+        # generation speed, after the first token showed up
+        if not self.tokens_out or self.first_token is None:
+            return None
+        generating = (self.ended or time.perf_counter()) - self.first_token
+        return self.tokens_out / generating if generating > 0 else None
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "time": self.wall,
+            "total": round(self.total, 4),
+            "ttft": None if self.ttft is None else round(self.ttft, 4),
+            "tokens_in": self.tokens_in,
+            "tokens_out": self.tokens_out,
+            "tokens_per_second": self.tokens_per_second,
+            "spans": {k: round(v, 4) for k, v in self.spans.items()},
+        }
+
+    def status(self) -> str:
+        parts = [f"total {self.total:.2f}s"]
+        if self.ttft is not None:
+            parts.append(f"first token {self.ttft:.2f}s")
+        if self.tokens_in or self.tokens_out:
+            parts.append(f"tokens {self.tokens_in} in / {self.tokens_out} out")
+        if self.tokens_per_second:
+            parts.append(f"{self.tokens_per_second:.0f} tok/s")
+        tools = sum(v for k, v in self.spans.items() if k.startswith("tool:"))
+        if tools:
+            parts.append(f"tools {tools:.2f}s")
+        for name in ("render", "log"):
+            if name in self.spans:
+                parts.append(f"{name} {self.spans[name] * 1000:.0f}ms")
+        return " | ".join(parts)
+
+
+_current: ContextVar[Turn | None] = ContextVar("turn", default=None)
+last: Turn | None = None
+
+
+def current() -> Turn | None:
+    return _current.get()
+
+
+@contextmanager
+def turn(export: Path | None = None) -> Iterator[Turn]:
+    """measures everything inside as one turn, export appends it as jsonl"""
+    global last  # pylint: disable = W0603
+    measured = Turn()
+    token = _current.set(measured)
+    try:
+        yield measured
+    finally:
+        _current.reset(token)
+        measured.ended = time.perf_counter()
+        last = measured
+        if export:
+            with export.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(measured.to_dict()) + "\n")
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    measured = _current.get()
+    if measured is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        measured.add(name, time.perf_counter() - start)
+
+
+@contextmanager
+def within(measured: Turn | None) -> Iterator[None]:
+    """counts the block towards measured, for callbacks outside its context"""
+    token = _current.set(measured)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def first_token() -> None:
+    measured = _current.get()
+    if measured is not None and measured.first_token is None:
+        measured.first_token = time.perf_counter()
+
+
+def add_tokens(tokens_in: int | None, tokens_out: int | None) -> None:
+    """usage as the provider reported it, once per request"""
+    measured = _current.get()
+    if measured is not None:
+        # hedged and fan-out requests report from threads of their own
+        with measured._lock:  # pylint: disable = W0212
+            measured.tokens_in += tokens_in or 0
+            measured.tokens_out += tokens_out or 0
+
+
+def status_line() -> str:
+    """the bottom toolbar text, about the last finished turn"""
+    return f" last turn: {last.status()}" if last else ""
@@ -0,0 +1,325 @@
+# pylint: disable = C0116, C0115, C0114, C0411
+"""
+more than one backend per prompt. Config.backends lists extra ones as
+"api_type/model", optionally "@endpoint", with their key in API_KEY_OPENAI
+or API_KEY_GOOGLE (Config.api_key otherwise). hedged mode sends the prompt
+to the next backend whenever nothing arrived within hedge_after seconds and
+keeps the first one that answers, fan-out mode asks all of them at once
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, AsyncIterator, Iterator
+
+from AI_TUI.backend import (
+    StreamError,
+    make_query,
+    make_query_async,
+    make_query_stream,
+)
+from AI_TUI.pydantic_stuff.models import DEFAULT_API
+
+if TYPE_CHECKING:
+    from AI_TUI.main import MessagesArray
+    from AI_TUI.pydantic_stuff.models import Config
+    from AI_TUI.response_cache import ResponseCache
+
+ENDPOINTS = {"google": DEFAULT_API, "openai": "https://api.openai.com/v1/"}
+_END = object()
+
+Answers = list[tuple[str, "str | None"]]
+
+
+def label(config: Config) -> str:
+    return f"{config.api_type}/{config.model}"
+
+
+def backend_configs(config: Config, api_key: str) -> list[tuple[Config, str]]:
+    """the configured backend first, then the ones in Config.backends"""
+    configs = [(config, api_key)]
+    for entry in config.backends:
+        spec, _, endpoint = entry.partition("@")
+        api_type, _, model = spec.partition("/")
+        update: dict[str, Any] = {"api_type": api_type, "model": model}
+        if endpoint:
+            update["endpoint"] = endpoint
+        elif api_type != config.api_type:
+            update["endpoint"] = ENDPOINTS[api_type]
+        key = os.environ.get(f"API_KEY_{api_type.upper()}", api_key)
+        configs.append((config.model_copy(update=update), key))
+    return configs
+
+
+class Pump(threading.Thread):
+    """
+    reads a sync stream into out on a thread of its own, as (index, item).
+    it runs in the context it was made in, so metrics count it to the turn
+    """
+
+    def __init__(self, index: int, chunks: Iterator[str], out: queue.Queue) -> None:
+        super().__init__(daemon=True)
+        self.index = index
+        self.chunks = chunks
+        self.out = out
+        self.context = contextvars.copy_context()
+        self.stopped = threading.Event()
+        # held while reading, a generator can't be closed in the middle of that
+        self._reading = threading.Lock()
+
+    def run(self) -> None:
+        self.context.run(self.pump)
+
+    def pump(self) -> None:
+        try:
+            while True:
+                with self._reading:
+                    if self.stopped.is_set():
+                        break
+                    chunk = next(self.chunks, _END)
+                if chunk is _END:
+                    break
+                self.out.put((self.index, chunk))
+        except Exception as err:  # pylint: disable = W0718
+            if not isinstance(err, StreamError):
+                print(f"ERROR: {err}")
+            # a winner that breaks off takes the whole answer with it
+            self.out.put((self.index, err))
+        finally:
+            with self._reading:
+                self.chunks.close()  # type: ignore
+            self.out.put((self.index, _END))
+
+    def stop(self) -> None:
+        """
+        closes the stream now if it is between chunks, a read that is under
+        way can't be interrupted, the stream is closed once it returns
+        """
+        self.stopped.set()
+        if self._reading.acquire(blocking=False):
+            try:
+                self.chunks.close()  # type: ignore
+            finally:
+                self._reading.release()
+
+
+def hedged_stream(
+    api_key: str,
+    messages: MessagesArray,
+    config: Config,
+    home: Path,
+    cache: ResponseCache | None = None,
+) -> Iterator[str]:
+    """make_query_stream racing the backends, the losers get closed"""
+    backends = backend_configs(config, api_key)
+    results: queue.Queue = queue.Queue()
+    pumps: list[Pump] = []
+
+    def launch() -> None:
+        backend_config, key = backends[len(pumps)]
+        chunks = make_query_stream(key, messages, backend_config, home, cache)
+        pumps.append(Pump(len(pumps), chunks, results))
+        pumps[-1].start()
+
+    launch()
+    running, winner = 1, None
+    try:
+        while winner is None:
+            can_hedge = len(pumps) < len(backends)
+            try:
+                index, item = results.get(
+                    timeout=config.hedge_after if can_hedge else None
+                )
+            except queue.Empty:
+                launch()
+                running += 1
+                continue
+            if isinstance(item, Exception):
+                continue
+            if item is not _END:
+                winner = index
+                break
+            # one gave up without an answer, don't wait for the timer
+            running -= 1
+            if can_hedge and not running:
+                launch()
+                running += 1
+            elif not running:
+                return
+
+        for loser in pumps:
+            if loser.index != winner:
+                loser.stop()
+        yield item
+        while (result := results.get()) != (winner, _END):
+            if result[0] != winner:
+                continue
+            if isinstance(result[1], Exception):
+                raise result[1]
+            yield result[1]
+    finally:
+        for pump in pumps:
+            pump.stop()
+
+
+async def hedged_stream_async(
+    api_key: str,
+    messages: MessagesArray,
+    config: Config,
+    home: Path,
+    cache: ResponseCache | None = None,
+) -> AsyncIterator[str]:
+    """make_query_async racing the backends, the losers get cancelled"""
+    backends = backend_configs(config, api_key)
+    streams: dict[asyncio.Future, AsyncIterator[str]] = {}
+    launched = 0
+
+    def launch() -> None:
+        nonlocal launched
+        backend_config, key = backends[launched]
+        launched += 1
+        chunks = make_query_async(key, messages, backend_config, home, cache)
+        streams[asyncio.ensure_future(anext(chunks, None))] = chunks
+
+    launch()
+    winner: AsyncIterator[str] | None = None
+    first = None
+    try:
+        while winner is None:
+            can_hedge = launched < len(backends)
+            if not streams:
+                if not can_hedge:
+                    return
+                launch()
+                continue
+            done, _ = await asyncio.wait(
+                list(streams),
+                timeout=config.hedge_after if can_hedge else None,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done:
+                launch()
+                continue
+            for task in done:
+                chunks = streams.pop(task)
+                answered = task.exception() is None and task.result() is not None
+                if winner is None and answered:
+                    winner, first = chunks, task.result()
+                else:
+                    await chunks.aclose()  # type: ignore
+
+        # the others lost, stop them before streaming the winner
+        for task in streams:
+            task.cancel()
+        await asyncio.gather(*streams, return_exceptions=True)
+        for chunks in streams.values():
+            await chunks.aclose()  # type: ignore
+        streams.clear()
+
+        yield first  # type: ignore
+        async for chunk in winner:
+            yield chunk
+    finally:
+        for task in streams:
+            task.cancel()
+
+
+def fan_out(
+    api_key: str,
+    messages: MessagesArray,
+    config: Config,
+    home: Path,
+    cache: ResponseCache | None = None,
+) -> Answers:
+    """every backend's answer, in the order of backend_configs"""
+    backends = backend_configs(config, api_key)
+    with ThreadPoolExecutor(max_workers=len(backends)) as pool:
+        # a context each, one can't be entered by two threads at once
+        futures = [
+            pool.submit(
+                contextvars.copy_context().run,
+                make_query,
+                key,
+                messages,
+                backend_config,
+                home,
+                cache,
+            )
+            for backend_config, key in backends
+        ]
+    answers: Answers = []
+    for (backend_config, _), future in zip(backends, futures):
+        try:
+            answers.append((label(backend_config), future.result()))
+        except Exception as err:  # pylint: disable = W0718
+            print(f"ERROR from {label(backend_config)}: {err}")
+            answers.append((label(backend_config), None))
+    return answers
+
+
+async def fan_out_async(
+    api_key: str,
+    messages: MessagesArray,
+    config: Config,
+    home: Path,
+    cache: ResponseCache | None = None,
+) -> Answers:
+    async def collect(backend_config: Config, key: str) -> str | None:
+        chunks = make_query_async(key, messages, backend_config, home, cache)
+        return "".join([chunk async for chunk in chunks]) or None
+
+    backends = backend_configs(config, api_key)
+    results = await asyncio.gather(
+        *(collect(c, k) for c, k in backends), return_exceptions=True
+    )
+    answers: Answers = []
+    for (backend_config, _), result in zip(backends, results):
+        if isinstance(result, asyncio.CancelledError):
+            raise result
+        if isinstance(result, BaseException):
+            print(f"ERROR from {label(backend_config)}: {result}")
+            result = None
+        answers.append((label(backend_config), result))
+    return answers
+
+
+def query(
+    api_key: str,
+    messages: MessagesArray,
+    config: Config,
+    home: Path,
+    cache: ResponseCache | None = None,
+) -> str | None:
+    if config.backend_mode == "hedged" and config.backends:
+        return "".join(hedged_stream(api_key, messages, config, home, cache)) or None
+    return make_query(api_key, messages, config, home, cache)
+
+
+def stream(
+    api_key: str,
+    messages: MessagesArray,
+    config: Config,
+    home: Path,
+    cache: ResponseCache | None = None,
+) -> Iterator[str]:
+    if config.backend_mode == "hedged" and config.backends:
+        return hedged_stream(api_key, messages, config, home, cache)
+    return make_query_stream(api_key, messages, config, home, cache)
+
+
+def stream_async(
+    api_key: str,
+    messages: MessagesArray,
+    config: Config,
+    home: Path,
+    cache: ResponseCache | None = None,
+) -> AsyncIterator[str]:
+    if config.backend_mode == "hedged" and config.backends:
+        return hedged_stream_async(api_key, messages, config, home, cache)
+    return make_query_async(api_key, messages, config, home, cache)
@@ -0,0 +1,190 @@
+# pylint: disable = C0116, C0115, C0114, C0411
+"""
+markdown to ANSI in one pass over the lines, no mdv. covers what models
+write: headings, lists, quotes, rules, fenced code (highlighted by pygments
+when it is installed), emphasis, inline code and links. anything else,
+tables included, is printed as written
+"""
+
+from __future__ import annotations
+
+import re
+from functools import lru_cache
+from typing import Any
+
+from prompt_toolkit.utils import get_cwidth
+
+RESET = "\x1b[0m"
+BOLD = "\x1b[1m"
+DIM = "\x1b[2m"
+ITALIC = "\x1b[3m"
+UNDERLINE = "\x1b[4m"
+HEADING = "\x1b[1;36m"
+CODE = "\x1b[38;5;180m"
+QUOTE = "\x1b[38;5;245m"
+
+FENCE = re.compile(r"^(\s*)(```|~~~)\s*([\w+#.-]*)")
+HEADER = re.compile(r"^(#{1,6})\s+(.*)")
+BULLET = re.compile(r"^(\s*)([-*+]|\d+[.)])\s+(.*)")
+RULE = re.compile(r"^\s*([-*_])(\s*\1){2,}\s*$")
+INLINE_CODE = re.compile(r"(`[^`]+`)")
+EMPHASIS = (
+    (re.compile(r"\*\*(.+?)\*\*|__(.+?)__"), BOLD),
+    (re.compile(r"(?<![*\w])\*(?!\s)(.+?)(?<!\s)\*(?![*\w])"), ITALIC),
+    (re.compile(r"~~(.+?)~~"), DIM),
+)
+LINK = re.compile(r"\[([^\]]+)\]\(([^)\s]+)\)")
+ESCAPE = re.compile(r"\x1b\[[0-9;]*m")
+SPACE = re.compile(r"(\s+)")
+
+
+def inline(text: str) -> str:
+    parts = INLINE_CODE.split(text)
+    for i, part in enumerate(parts):
+        if i % 2:  # inside backticks, left alone
+            parts[i] = f"{CODE}{part[1:-1]}{RESET}"
+            continue
+        for pattern, style in EMPHASIS:
+            part = pattern.sub(
+                lambda m, style=style: f"{style}{m.group(m.lastindex)}{RESET}", part
+            )
+        parts[i] = LINK.sub(rf"{UNDERLINE}\1{RESET}{DIM} (\2){RESET}", part)
+    return "".join(parts)
+
+
+def visible(text: str) -> int:
+    """columns on screen, wide characters (CJK, emoji) take two"""
+    return get_cwidth(ESCAPE.sub("", text))
+
+
+def split_at(text: str, columns: int, least: bool = False) -> tuple[str, str]:
+    """
+    text cut after columns on screen, escape codes stay whole. with least the
+    first character is kept even when it doesn't fit
+    """
+    at = used = 0
+    while at < len(text):
+        if match := ESCAPE.match(text, at):
+            at = match.end()
+            continue
+        size = get_cwidth(text[at])
+        if used + size > columns and (used or not least):
+            break
+        at += 1
+        used += size
+    return text[:at], text[at:]
+
+
+def carry_styles(lines: list[str]) -> list[str]:
+    """a style left open at the end of a line is closed and opened again"""
+    out, active = [], ""
+    for line in lines:
+        start = active
+        for code in ESCAPE.findall(line):
+            active = "" if code == RESET else active + code
+        out.append(start + line + (RESET if active else ""))
+    return out
+
+
+def wrap(text: str, width: int, first: str, rest: str) -> list[str]:
+    # styled before wrapping, so emphasis across a line break keeps its
+    # markers. escape codes don't count towards the width
+    width = max(10, width)
+    lines: list[str] = []
+    line, indent = first, len(first)
+    used = indent
+    for chunk in SPACE.split(inline(text)):
+        if not chunk:
+            continue
+        if chunk.isspace():
+            # spaces at a line break are dropped
+            if (lines and used == indent) or used + visible(chunk) > width:
+                continue
+            line, used = line + chunk, used + visible(chunk)
+            continue
+        size = visible(chunk)
+        while chunk and used + size > width:
+            if used > indent and size <= width - len(rest):
+                lines.append(line.rstrip())
+                line, indent = rest, len(rest)
+                used = indent
+                break
+            # longer than a whole line, it gets cut where the line ends. a
+            # line of its own takes at least a character, even a wide one
+            head, chunk = split_at(chunk, width - used, used == indent)
+            lines.append(line + head)
+            line, indent = rest, len(rest)
+            used, size = indent, visible(chunk)
+        line, used = line + chunk, used + size
+    if used > indent or not lines:
+        lines.append(line.rstrip())
+    return carry_styles(lines)
+
+
+@lru_cache(maxsize=32)
+def get_lexer(language: str) -> Any:
+    try:
+        from pygments.lexers import get_lexer_by_name  # pylint: disable = C0415
+        from pygments.util import ClassNotFound  # pylint: disable = C0415
+    except ImportError:
+        return None
+    try:
+        return get_lexer_by_name(language or "text")
+    except ClassNotFound:
+        return get_lexer_by_name("text")
+
+
+@lru_cache(maxsize=1)
+def get_formatter() -> Any:
+    from pygments.formatters import Terminal256Formatter  # pylint: disable = C0415
+
+    return Terminal256Formatter(style="monokai")
+
+
+@lru_cache(maxsize=64)
+def highlight(code: str, language: str) -> str:
+    # lexing is most of a render, and a block looks the same at every width
+    lexer = get_lexer(language)
+    if lexer is None:
+        return f"{CODE}{code}{RESET}"
+    from pygments import highlight as pygmentize  # pylint: disable = C0415
+
+    return pygmentize(code, lexer, get_formatter())
+
+
+def render(text: str, width: int) -> str:
+    out: list[str] = []
+    code: list[str] | None = None
+    fence = language = indent = ""
+    for line in text.split("\n"):
+        if code is not None:
+            if line.strip().startswith(fence):
+                block = highlight("\n".join(code), language).rstrip("\n")
+                out.extend(indent + row for row in block.split("\n"))
+                code = None
+            else:
+                code.append(line)
+            continue
+
+        if match := FENCE.match(line):
+            indent, fence, language = match.groups()
+            code = []
+        elif match := HEADER.match(line):
+            out.append(f"{HEADING}{match.group(2)}{RESET}")
+        elif RULE.match(line):
+            out.append(DIM + "─" * max(1, width - 1) + RESET)
+        elif match := BULLET.match(line):
+            space, mark, item = match.groups()
+            mark = "•" if mark in "-*+" else mark
+            out.extend(wrap(item, width, f"{space}{mark} ", " " * (len(space) + 2)))
+        elif line.startswith(">"):
+            quoted = wrap(line.lstrip("> "), width - 2, "", "")
+            out.extend(f"{QUOTE}│ {row}{RESET}" for row in quoted)
+        elif line.lstrip().startswith("|"):
+            out.append(line)
+        else:
+            out.extend(wrap(line, width, "", "") if line.strip() else [""])
+
+    if code is not None:  # unclosed fence, as while streaming
+        out.append(highlight("\n".join(code), language).rstrip("\n"))
+    return "\n".join(out) + "\n"
@@ -0,0 +1,446 @@
+# pylint: disable = C0116, C0115, C0114, C0411
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, AsyncIterator, Iterator
+
+from google import genai
+from google.genai import types
+import google.genai.errors as g_error
+
+from AI_TUI import metrics, ratelimit
+from AI_TUI.backend import StreamError, pause_on_error, run_tools
+from AI_TUI.context import estimate_tokens
+from AI_TUI.server_context import context_key
+from AI_TUI.tools.registry import get_registry
+
+if TYPE_CHECKING:
+    from AI_TUI.main import Message, Config
+    from AI_TUI.server_context import ServerContext
+
+# gemini refuses to cache less than about this much
+CACHE_MIN_TOKENS = 1024
+# models that refused to create a cache, not asked again this session
+_uncacheable: set[str] = set()
+
+
+def get_gemini_tools(home: Path) -> types.Tool:
+    return get_registry(home).gemini_tool()
+
+
+def round_config(
+    round_: int, config: Config, model_config: types.GenerateContentConfig
+) -> types.GenerateContentConfig:
+    if round_ < config.max_tool_rounds:
+        return model_config
+    # the last allowed round has to produce text instead of more tool calls
+    return model_config.model_copy(
+        update={
+            "tool_config": types.ToolConfig(
+                function_calling_config=types.FunctionCallingConfig(mode="NONE")
+            )
+        }
+    )
+
+
+def content_tokens(contents: list[types.Content]) -> int:
+    return sum(
+        estimate_tokens(part.text)
+        for content in contents
+        for part in content.parts or []
+        if part.text
+    )
+
+
+def cache_prefix(
+    contents: list[types.Content], model_config: types.GenerateContentConfig
+) -> list:
+    # the system prompt is in the cache too, a new one has to miss it
+    return [model_config.system_instruction, *contents]
+
+
+def cache_key(config: Config, model_config: types.GenerateContentConfig) -> str:
+    # and so are the tools, which only change with tools.json
+    return f"{context_key(config)}#{tools_digest(model_config)}"
+
+
+def create_cache(
+    client: genai.Client,
+    contents: list[types.Content],
+    config: Config,
+    model_config: types.GenerateContentConfig,
+    context: ServerContext,
+) -> None:
+    try:
+        cache = client.caches.create(
+            model=config.model,
+            config=types.CreateCachedContentConfig(
+                contents=contents,
+                system_instruction=model_config.system_instruction,
+                tools=model_config.tools,
+                ttl=f"{config.server_cache_ttl:.0f}s",
+            ),
+        )
+    except g_error.APIError as e:
+        _uncacheable.add(config.model)
+        print(f"WARN: not caching the context of {config.model}: {e.message}")
+        return
+    if not cache.name:
+        return
+    expires = time.time() + config.server_cache_ttl
+    if cache.expire_time:
+        expires = min(expires, cache.expire_time.timestamp())
+    prefix = cache_prefix(contents, model_config)
+    old = context.put(cache_key(config, model_config), cache.name, prefix, expires)
+    if old:
+        try:
+            client.caches.delete(name=old.name)
+        except g_error.APIError:
+            pass  # it expires by itself
+
+
+def cached_request(
+    client: genai.Client,
+    messages: list[types.Content],
+    config: Config,
+    request: types.GenerateContentConfig,
+    context: ServerContext | None,
+    first_round: bool,
+) -> tuple[list[types.Content], types.GenerateContentConfig]:
+    """
+    the contents to send and the config to send them with. a cached prefix of
+    messages is left out, the config points at the cache instead. the history
+    before the new prompt gets (re)cached once enough of it is uncached
+    """
+    if context is None or config.model in _uncacheable or request.tool_config:
+        # the forced last round sets tool_config, a cached request can't
+        return messages, request
+    head = cache_prefix(messages, request)
+    entry = context.get(cache_key(config, request), head)
+    cached = len(entry.prefix) - 1 if entry else 0
+    if first_round and content_tokens(messages[cached:-1]) >= CACHE_MIN_TOKENS:
+        create_cache(client, messages[:-1], config, request, context)
+        entry = context.get(cache_key(config, request), head)
+    if entry is None:
+        return messages, request
+    return messages[len(entry.prefix) - 1 :], types.GenerateContentConfig(
+        cached_content=entry.name
+    )
+
+
+def expired(
+    err: g_error.APIError,
+    cached: types.GenerateContentConfig,
+    request: types.GenerateContentConfig,
+    context: ServerContext | None,
+    config: Config,
+) -> bool:
+    """the cache went away before its time, the request goes again without it"""
+    if context is None or not cached.cached_content:
+        return False
+    if not isinstance(err, g_error.ClientError):
+        return False
+    context.drop(cache_key(config, request))
+    return True
+
+
+def record_usage(usage: types.GenerateContentResponseUsageMetadata | None) -> None:
+    if usage:
+        metrics.add_tokens(usage.prompt_token_count, usage.candidates_token_count)
+
+
+def retryable(err: Exception) -> bool:
+    return isinstance(err, g_error.APIError) and err.code in ratelimit.RETRY_STATUSES
+
+
+def make_query_gemini(
+    client: genai.Client,
+    messages: list[types.Content],
+    config: Config,
+    model_config: types.GenerateContentConfig,
+    home: Path,
+    context: ServerContext | None = None,
+) -> str | None:
+    def generate(contents: list[types.Content], request: types.GenerateContentConfig):
+        return ratelimit.call(
+            lambda: client.models.generate_content(
+                model=config.model, contents=contents, config=request
+            ),
+            config,
+            retryable,
+        )
+
+    for round_ in range(config.max_tool_rounds + 1):
+        try:
+            request = round_config(round_, config, model_config)
+            contents, cached = cached_request(
+                client, messages, config, request, context, round_ == 0
+            )
+            try:
+                response = generate(contents, cached)
+            except g_error.APIError as e:
+                if not expired(e, cached, request, context, config):
+                    raise
+                response = generate(messages, request)
+            record_usage(response.usage_metadata)
+        except g_error.APIError as e:
+            print(e)
+            pause_on_error()
+            return None
+
+        if response.function_calls:
+            messages.extend(
+                gemini_tool_contents(response.function_calls, config, home)
+            )
+            continue
+
+        if response.text:
+            return response.text
+
+        print(f"ERROR: {response}")
+        pause_on_error()
+        return None
+
+    return None
+
+
+def stream_query_gemini(
+    client: genai.Client,
+    messages: list[types.Content],
+    config: Config,
+    model_config: types.GenerateContentConfig,
+    home: Path,
+    context: ServerContext | None = None,
+) -> Iterator[str]:
+    def generate(
+        contents: list[types.Content], request: types.GenerateContentConfig
+    ) -> Iterator[types.GenerateContentResponse]:
+        return ratelimit.open_stream(
+            lambda: client.models.generate_content_stream(
+                model=config.model, contents=contents, config=request
+            ),
+            config,
+            retryable,
+        )
+
+    def opened(request: types.GenerateContentConfig, first_round: bool):
+        # the stream opens on its first chunk, an expired cache fails there
+        contents, cached = cached_request(
+            client, messages, config, request, context, first_round
+        )
+        chunks = generate(contents, cached)
+        try:
+            head = next(chunks, None)
+        except g_error.APIError as e:
+            if not expired(e, cached, request, context, config):
+                raise
+            chunks = generate(messages, request)
+            head = next(chunks, None)
+        if head is not None:
+            yield head
+            yield from chunks
+
+    for round_ in range(config.max_tool_rounds + 1):
+        calls: list[types.FunctionCall] = []
+        # every chunk repeats the usage so far, the last one has the totals
+        usage = None
+        request = round_config(round_, config, model_config)
+        try:
+            for chunk in opened(request, round_ == 0):
+                usage = chunk.usage_metadata or usage
+                if chunk.function_calls:
+                    calls.extend(chunk.function_calls)
+                elif chunk.text:
+                    yield chunk.text
+        except g_error.APIError as e:
+            print(e)
+            pause_on_error()
+            raise StreamError(e) from e
+
+        record_usage(usage)
+        if not calls:
+            return
+        messages.extend(gemini_tool_contents(calls, config, home))
+
+
+async def stream_query_gemini_async(
+    client: genai.Client,
+    messages: list[types.Content],
+    config: Config,
+    model_config: types.GenerateContentConfig,
+    home: Path,
+    context: ServerContext | None = None,
+) -> AsyncIterator[str]:
+    def generate(
+        contents: list[types.Content], request: types.GenerateContentConfig
+    ) -> AsyncIterator[types.GenerateContentResponse]:
+        return ratelimit.open_stream_async(
+            lambda: client.aio.models.generate_content_stream(
+                model=config.model, contents=contents, config=request
+            ),
+            config,
+            retryable,
+        )
+
+    async def opened(request: types.GenerateContentConfig, first_round: bool):
+        # creating the cache is a blocking request
+        contents, cached = await asyncio.to_thread(
+            cached_request, client, messages, config, request, context, first_round
+        )
+        chunks = generate(contents, cached)
+        try:
+            head = await anext(chunks, None)
+        except g_error.APIError as e:
+            if not expired(e, cached, request, context, config):
+                raise
+            chunks = generate(messages, request)
+            head = await anext(chunks, None)
+        if head is not None:
+            yield head
+            async for chunk in chunks:
+                yield chunk
+
+    for round_ in range(config.max_tool_rounds + 1):
+        calls: list[types.FunctionCall] = []
+        # every chunk repeats the usage so far, the last one has the totals
+        usage = None
+        request = round_config(round_, config, model_config)
+        try:
+            async for chunk in opened(request, round_ == 0):
+                usage = chunk.usage_metadata or usage
+                if chunk.function_calls:
+                    calls.extend(chunk.function_calls)
+                elif chunk.text:
+                    yield chunk.text
+        except g_error.APIError as e:
+            # no input() here, the prompt is still running
+            print(e)
+            raise StreamError(e) from e
+
+        record_usage(usage)
+        if not calls:
+            return
+        contents = await asyncio.to_thread(gemini_tool_contents, calls, config, home)
+        messages.extend(contents)
+
+
+def gemini_tool_contents(
+    calls: list[types.FunctionCall], config: Config, home: Path
+) -> list[types.Content]:
+    for call in calls:
+        if not call.name:
+            raise ValueError(
+                f"invalid function call in {gemini_tool_contents.__name__}: {call}"
+            )
+    named_calls = [(c.name, c.args or {}) for c in calls]
+    results = run_tools(named_calls, config, home)  # type: ignore
+    return add_function_call_content(
+        calls,
+        [
+            types.Part.from_function_response(name=c.name, response={"result": r})
+            for c, r in zip(calls, results)
+        ],
+    )
+
+
+def add_function_call_content(
+    calls: list[types.FunctionCall], responses: list[types.Part]
+) -> list[types.Content]:
+    return [
+        types.Content(role="model", parts=[types.Part(function_call=c) for c in calls]),
+        types.Content(role="user", parts=responses),
+    ]
+
+
+def ping(client: genai.Client, config: Config) -> None:
+    """a small request, it leaves a warm connection for the next one"""
+    client.models.get(model=config.model)
+
+
+async def ping_async(client: genai.Client, config: Config) -> None:
+    await client.aio.models.get(model=config.model)
+
+
+def convert(message: Message) -> types.Content:
+    role = "model" if message.role == "assistant" else "user"
+    return types.Content(parts=[types.Part(text=message.content)], role=role)
+
+
+def load_item(data: dict) -> types.Content:
+    """a payload item read back from a session snapshot"""
+    return types.Content.model_validate(data)
+
+
+_model_configs: dict[tuple[int, int], types.GenerateContentConfig] = {}
+# the config is kept alive with its digest, so its id can't be reused
+_tool_digests: dict[int, tuple[types.GenerateContentConfig, str]] = {}
+
+
+def get_model_config(system: types.Content, home: Path) -> types.GenerateContentConfig:
+    # the system content comes out of the payload cache, so the same prompt is
+    # the same object every turn. the tool changes when tools.json does
+    tool = get_gemini_tools(home)
+    key = (id(system), id(tool))
+    if key not in _model_configs:
+        _model_configs.clear()
+        _model_configs[key] = types.GenerateContentConfig(
+            system_instruction=system, tools=[tool]
+        )
+    return _model_configs[key]
+
+
+def tools_digest(model_config: types.GenerateContentConfig) -> str:
+    """stable across sessions, unlike the id of the tool"""
+    key = id(model_config)
+    if key not in _tool_digests:
+        _tool_digests.clear()
+        dumped = "".join(t.model_dump_json() for t in model_config.tools or [])
+        digest = hashlib.blake2b(dumped.encode(), digest_size=8).hexdigest()
+        _tool_digests[key] = (model_config, digest)
+    return _tool_digests[key][1]
+
+
+def google_messages_formatter(
+    payload: list[types.Content], home: Path
+) -> tuple[list[types.Content], types.GenerateContentConfig]:
+    """splits off the developer prompt, it goes in the config on gemini"""
+    return payload[1:], get_model_config(payload[0], home)
+
+
+def query(
+    client: genai.Client,
+    payload: list[types.Content],
+    config: Config,
+    home: Path,
+    context: ServerContext | None = None,
+) -> str | None:
+    msgs, model_config = google_messages_formatter(payload, home)
+    return make_query_gemini(client, msgs, config, model_config, home, context)
+
+
+def stream(
+    client: genai.Client,
+    payload: list[types.Content],
+    config: Config,
+    home: Path,
+    context: ServerContext | None = None,
+) -> Iterator[str]:
+    msgs, model_config = google_messages_formatter(payload, home)
+    return stream_query_gemini(client, msgs, config, model_config, home, context)
+
+
+def stream_async(
+    client: genai.Client,
+    payload: list[types.Content],
+    config: Config,
+    home: Path,
+    context: ServerContext | None = None,
+) -> AsyncIterator[str]:
+    msgs, model_config = google_messages_formatter(payload, home)
+    return stream_query_gemini_async(
+        client, msgs, config, model_config, home, context
+    )
@@ -0,0 +1,335 @@
+# pylint: disable = C0116, C0115, C0114, C0411
+
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, AsyncIterator, Iterator
+
+import openai
+from openai import AsyncOpenAI, OpenAI
+
+from AI_TUI import metrics, ratelimit
+from AI_TUI.backend import StreamError, get_tools, pause_on_error, run_tools
+from AI_TUI.server_context import context_key
+
+if TYPE_CHECKING:
+    from AI_TUI.main import Message, Config
+    from AI_TUI.server_context import ServerContext
+
+
+def openai_tool_items(calls: list, config: Config, home: Path) -> list:
+    """the function calls plus their outputs, ready to extend the input with"""
+    results = run_tools(
+        [(c.name, json.loads(c.arguments or "{}")) for c in calls], config, home
+    )
+    items: list = []
+    for call, result in zip(calls, results):
+        items.append(call)
+        items.append(
+            {
+                "type": "function_call_output",
+                "call_id": call.call_id,
+                "output": str(result),
+            }
+        )
+    return items
+
+
+def tool_choice(round_: int, config: Config) -> str:
+    # the last allowed round has to produce text instead of more tool calls
+    return "none" if round_ >= config.max_tool_rounds else "auto"
+
+
+def request_args(
+    messages: list, config: Config, home: Path, round_: int, previous: str | None
+) -> dict:
+    args = {
+        "model": config.model,
+        "input": messages,
+        "tools": get_tools(home),
+        "tool_choice": tool_choice(round_, config),
+    }
+    if previous:
+        args["previous_response_id"] = previous
+    return args
+
+
+def chained(
+    context: ServerContext | None, config: Config, messages: list
+) -> tuple[str | None, list]:
+    """the stored response to continue from and what is left to send after it"""
+    entry = context.get(context_key(config), messages) if context else None
+    if entry is None:
+        return None, messages
+    return entry.name, messages[len(entry.prefix) :]
+
+
+def next_input(items: list, messages: list, previous: str | None) -> list:
+    if previous:  # the calls are part of the previous response already
+        return [item for item in items if isinstance(item, dict)]
+    messages.extend(items)
+    return messages
+
+
+def remember(
+    context: ServerContext | None, config: Config, turn: list, response: Any
+) -> None:
+    """the server holds the turn and its answer now, the next one can chain"""
+    if context is None or response is None or not response.id:
+        return
+    answer = {"role": "assistant", "content": response.output_text}
+    expires = time.time() + config.server_cache_ttl
+    context.put(context_key(config), response.id, [*turn, answer], expires)
+
+
+def chain_expired(err: openai.APIStatusError) -> bool:
+    """the error is about previous_response_id, not the rest of the request"""
+    return (
+        err.param == "previous_response_id"
+        or err.code == "previous_response_not_found"
+    )
+
+
+def create(client: OpenAI, config: Config, args: dict, full: dict | None) -> Any:
+    """
+    responses.create, sent again with the full history (full) when the
+    response it chains from has expired on the server
+    """
+    try:
+        return ratelimit.call(
+            lambda: client.responses.create(**args), config, retryable
+        )
+    except (openai.BadRequestError, openai.NotFoundError) as err:
+        if full is None or not chain_expired(err):
+            raise
+        return ratelimit.call(
+            lambda: client.responses.create(**full), config, retryable
+        )
+
+
+async def create_async(
+    client: AsyncOpenAI, config: Config, args: dict, full: dict | None
+) -> Any:
+    try:
+        return await ratelimit.call_async(
+            lambda: client.responses.create(**args), config, retryable
+        )
+    except (openai.BadRequestError, openai.NotFoundError) as err:
+        if full is None or not chain_expired(err):
+            raise
+        return await ratelimit.call_async(
+            lambda: client.responses.create(**full), config, retryable
+        )
+
+
+def round_args(
+    pending: list,
+    messages: list,
+    config: Config,
+    home: Path,
+    round_: int,
+    previous: str | None,
+) -> tuple[dict, dict | None]:
+    """the request, and on the first round of a chained turn its fallback"""
+    args = request_args(pending, config, home, round_, previous)
+    if round_ or not previous:
+        return args, None
+    return args, request_args(messages, config, home, round_, None)
+
+
+def record_usage(response: Any) -> None:
+    if response is not None and response.usage:
+        metrics.add_tokens(response.usage.input_tokens, response.usage.output_tokens)
+
+
+def retryable(err: Exception) -> bool:
+    if isinstance(err, openai.APIConnectionError):
+        return True
+    return (
+        isinstance(err, openai.APIStatusError)
+        and err.status_code in ratelimit.RETRY_STATUSES
+    )
+
+
+def make_query_openai(
+    client: OpenAI,
+    messages: list,
+    config: Config,
+    home: Path,
+    context: ServerContext | None = None,
+) -> str | None:
+    turn = list(messages)
+    previous, pending = chained(context, config, messages)
+    try:
+        for round_ in range(config.max_tool_rounds + 1):
+            args, full = round_args(pending, messages, config, home, round_, previous)
+            response = create(client, config, args, full)
+            record_usage(response)
+            calls = [c for c in response.output if c.type == "function_call"]
+            if not calls:
+                remember(context, config, turn, response)
+                return response.output_text
+            items = openai_tool_items(calls, config, home)
+            previous = response.id if context else None
+            pending = next_input(items, messages, previous)
+
+    except openai.RateLimitError:
+        print("Too many requests, even after retrying. Try again later.")
+        return None
+
+    except openai.OpenAIError as err:
+        print(err or "")
+        print(f"ERROR MSG: {getattr(err, 'message', 'None avaliable')}")
+        pause_on_error()
+        return None
+
+    return None
+
+
+def stream_query_openai(
+    client: OpenAI,
+    messages: list,
+    config: Config,
+    home: Path,
+    context: ServerContext | None = None,
+) -> Iterator[str]:
+    turn = list(messages)
+    previous, pending = chained(context, config, messages)
+    try:
+        for round_ in range(config.max_tool_rounds + 1):
+            args, full = round_args(pending, messages, config, home, round_, previous)
+            events = create(
+                client,
+                config,
+                {**args, "stream": True},
+                full and {**full, "stream": True},
+            )
+            response = None
+            for event in events:
+                if event.type == "response.output_text.delta":
+                    yield event.delta
+                elif event.type == "response.completed":
+                    response = event.response
+            if response is None:
+                # failed or incomplete, the stream ended without completing
+                print("ERROR: the response stream ended early.")
+                raise StreamError("the response stream ended early")
+            record_usage(response)
+
+            calls = [c for c in response.output if c.type == "function_call"]
+            if not calls:
+                remember(context, config, turn, response)
+                return
+            items = openai_tool_items(calls, config, home)
+            previous = response.id if context else None
+            pending = next_input(items, messages, previous)
+
+    except openai.RateLimitError as err:
+        print("Too many requests, even after retrying. Try again later.")
+        raise StreamError(err) from err
+
+    except openai.OpenAIError as err:
+        print(err or "")
+        print(f"ERROR MSG: {getattr(err, 'message', 'None avaliable')}")
+        pause_on_error()
+        raise StreamError(err) from err
+
+
+async def stream_query_openai_async(
+    client: AsyncOpenAI,
+    messages: list,
+    config: Config,
+    home: Path,
+    context: ServerContext | None = None,
+) -> AsyncIterator[str]:
+    turn = list(messages)
+    previous, pending = chained(context, config, messages)
+    try:
+        for round_ in range(config.max_tool_rounds + 1):
+            args, full = round_args(pending, messages, config, home, round_, previous)
+            events = await create_async(
+                client,
+                config,
+                {**args, "stream": True},
+                full and {**full, "stream": True},
+            )
+            response = None
+            async for event in events:
+                if event.type == "response.output_text.delta":
+                    yield event.delta
+                elif event.type == "response.completed":
+                    response = event.response
+            if response is None:
+                # failed or incomplete, the stream ended without completing
+                print("ERROR: the response stream ended early.")
+                raise StreamError("the response stream ended early")
+            record_usage(response)
+
+            calls = [c for c in response.output if c.type == "function_call"]
+            if not calls:
+                remember(context, config, turn, response)
+                return
+            items = await asyncio.to_thread(openai_tool_items, calls, config, home)
+            previous = response.id if context else None
+            pending = next_input(items, messages, previous)
+
+    except openai.RateLimitError as err:
+        print("Too many requests, even after retrying. Try again later.")
+        raise StreamError(err) from err
+
+    except openai.OpenAIError as err:
+        # no input() here, the prompt is still running
+        print(err or "")
+        print(f"ERROR MSG: {getattr(err, 'message', 'None avaliable')}")
+        raise StreamError(err) from err
+
+
+def ping(client: OpenAI, config: Config) -> None:
+    """a small request, it leaves a warm connection for the next one"""
+    client.models.retrieve(config.model)
+
+
+async def ping_async(client: AsyncOpenAI, config: Config) -> None:
+    await client.models.retrieve(config.model)
+
+
+def convert(message: Message) -> dict[str, str]:
+    return message.to_dict()
+
+
+def load_item(data: Any) -> Any:
+    """a payload item read back from a session snapshot, they are plain dicts"""
+    return data
+
+
+def query(
+    client: OpenAI,
+    payload: list,
+    config: Config,
+    home: Path,
+    context: ServerContext | None = None,
+) -> str | None:
+    return make_query_openai(client, payload, config, home, context)
+
+
+def stream(
+    client: OpenAI,
+    payload: list,
+    config: Config,
+    home: Path,
+    context: ServerContext | None = None,
+) -> Iterator[str]:
+    return stream_query_openai(client, payload, config, home, context)
+
+
+def stream_async(
+    client: AsyncOpenAI,
+    payload: list,
+    config: Config,
+    home: Path,
+    context: ServerContext | None = None,
+) -> AsyncIterator[str]:
+    return stream_query_openai_async(client, payload, config, home, context)
@@ -4,15 +4,15 @@ from __future__ import annotations
 
 from typing import Literal, cast, TypeAlias
 from pydantic import BaseModel, ConfigDict, HttpUrl, field_validator
-from AI_TUI.pydantic_stuff.validators import (
-    verify_endpoint,
-    verify_api_key,
-    get_models_list,
-)
+from AI_TUI.ratelimit import parse_limits
 
 DEFAULT_API = cast(HttpUrl, "https://generativelanguage.googleapis.com/v1beta/")
 ApiType: TypeAlias = Literal["google", "openai"]
 StringBool: TypeAlias = Literal["yes", "no"]
+FsyncPolicy: TypeAlias = Literal["always", "exit", "never"]
+ContextStrategy: TypeAlias = Literal["window", "summarize"]
+Renderer: TypeAlias = Literal["mdv", "native"]
+BackendMode: TypeAlias = Literal["single", "hedged", "fanout"]
 
 
 class Config(BaseModel):
@@ -20,11 +20,53 @@ class Config(BaseModel):
     api_key: str
     prompt: str = "You are a helpful assistant."
     overwrite_log: StringBool = "no"
+    log_fsync: FsyncPolicy = "exit"
     model: str = "gemini-2.5-flash-preview-04-17"
     api_type: ApiType = "google"
     endpoint: HttpUrl = DEFAULT_API
+    stream: StringBool = "yes"
+    async_ui: StringBool = "yes"
+    http2: StringBool = "no"
+    pool_size: int = 10
+    tool_workers: int = 4
+    tool_timeout: float = 30.0
+    max_tool_rounds: int = 8
+    context_budget: int = 0  # in tokens, 0 means no limit
+    context_strategy: ContextStrategy = "window"
+    response_cache: StringBool = "no"
+    response_cache_mb: float = 64.0
+    history_ram_mb: float = 64.0  # older message bodies go to disk, 0 means never
+    renderer: Renderer = "mdv"  # native is faster, mdv is fancier
+    metrics_export: StringBool = "no"  # appends every turn to metrics.jsonl
+    max_retries: int = 5
+    retry_max_delay: float = 60.0
+    rate_limits: tuple[str, ...] = ()  # like "openai/gpt-4o=60", per minute
+    # extra backends like "openai/gpt-4o" or "openai/some-model@https://host/v1/"
+    backends: tuple[str, ...] = ()
+    backend_mode: BackendMode = "single"
+    hedge_after: float = 2.0  # seconds without a first token before hedging
+    # openai previous_response_id / gemini cached content instead of resending
+    server_context: StringBool = "no"
+    server_cache_ttl: float = 3600.0  # seconds
+    probe_ttl_hours: float = 24.0
     model_config = ConfigDict(str_min_length=2, frozen=True)
+    # network checks are in probe.py, they are too slow for validation
 
-    @field_validator("endpoint")
-    def _(cls, v) -> HttpUrl:
-        return verify_endpoint(v)
+    @field_validator("rate_limits", mode="before")
+    def _(cls, v) -> tuple[str, ...]:
+        if isinstance(v, str):  # typed into config_wiz as "a=1, b=2"
+            v = [entry for entry in v.split(",") if entry.strip()]
+        parse_limits(tuple(v))
+        return tuple(v)
+
+    @field_validator("backends", mode="before")
+    def _check_backends(cls, v) -> tuple[str, ...]:
+        if isinstance(v, str):
+            v = [entry.strip() for entry in v.split(",") if entry.strip()]
+        for entry in v:
+            api_type, _, model = entry.partition("@")[0].partition("/")
+            if api_type not in ("google", "openai") or not model:
+                raise ValueError(
+                    f"invalid backend {entry!r}, use google/model or openai/model"
+                )
+        return tuple(v)
@@ -0,0 +1,98 @@
+# pylint: disable = C0116, C0115, C0114, C0411
+"""
+network checks of the config (endpoint, api key, model). these used to run
+inside the pydantic validators, now they run on a background thread and a
+passing result is remembered for a while so unchanged configs skip them
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from pydantic_core import PydanticCustomError
+
+from AI_TUI.pydantic_stuff.validators import (
+    verify_api_key,
+    verify_endpoint,
+    verify_models_list,
+)
+
+if TYPE_CHECKING:
+    from .models import Config
+
+PROBE_FILE = "probe_cache.json"
+
+
+def fingerprint(config: Config) -> str:
+    # the key is part of the hash, so it never ends up on disk in plain text
+    return hashlib.sha256(config.model_dump_json().encode()).hexdigest()
+
+
+def read_cache(file: Path) -> dict[str, float]:
+    try:
+        return json.loads(file.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def is_fresh(file: Path, config: Config) -> bool:
+    checked_at = read_cache(file).get(fingerprint(config), 0)
+    return time.time() - checked_at < config.probe_ttl_hours * 3600
+
+
+def remember(file: Path, config: Config) -> None:
+    cache = read_cache(file)
+    now = time.time()
+    ttl = config.probe_ttl_hours * 3600
+    cache = {k: v for k, v in cache.items() if now - v < ttl}
+    cache[fingerprint(config)] = now
+    file.write_text(json.dumps(cache), encoding="utf-8")
+
+
+def check(config: Config) -> str | None:
+    """returns what is wrong with the config, or None if the checks pass"""
+    try:
+        verify_endpoint(config.endpoint)
+        verify_api_key(config, config.api_key)
+        verify_models_list(config, config.api_key, config.model)
+    except PydanticCustomError as err:
+        return err.message()
+    return None
+
+
+class Probe:
+    def __init__(self, home: Path, config: Config) -> None:
+        self.file = home / PROBE_FILE
+        self.config = config
+        self.error: str | None = None
+        self.done = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> Probe:
+        if is_fresh(self.file, self.config):
+            self.done.set()
+        else:
+            self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        try:
+            self.error = check(self.config)
+            if self.error is None:
+                remember(self.file, self.config)
+        except Exception as err:  # pylint: disable = W0718
+            self.error = f"Connection check failed: {err}"
+        finally:
+            self.done.set()
+
+    def take_error(self) -> str | None:
+        """the error if the probe finished and failed, only returned once"""
+        if not self.done.is_set():
+            return None
+        error, self.error = self.error, None
+        return error
@@ -5,19 +5,18 @@ from __future__ import annotations
 from functools import lru_cache
 from typing import TYPE_CHECKING
 
-import google.genai.errors as g_error
-from google import genai
-from openai import OpenAI
-import openai
 from pydantic import HttpUrl
 from pydantic_core import PydanticCustomError
-import requests
+
+from AI_TUI.clients import get_client
 
 if TYPE_CHECKING:
     from .models import Config
 
 
 def verify_endpoint(url: HttpUrl) -> HttpUrl:
+    import requests  # pylint: disable = C0415
+
     try:
         _ = requests.head(str(url), timeout=5)
         return url
@@ -28,27 +27,41 @@ def verify_endpoint(url: HttpUrl) -> HttpUrl:
             {"code": err.response.status_code if err.response else "unknown"},
         ) from None
 
-@lru_cache
-def get_models_list(config: Config, key: str) -> list:
+
+def api_errors(config: Config) -> tuple[type[Exception], ...]:
+    # pylint: disable = C0415
     if config.api_type == "google":
-        client = genai.Client(api_key=key)
-    else:
-        client = OpenAI(api_key=key)
+        import google.genai.errors as g_error
+
+        return (g_error.APIError,)
+    import openai
+
+    return (openai.APIError,)
 
+
+@lru_cache
+def get_models_list(config: Config, key: str) -> list:
+    client = get_client(config, key)
     models = list(client.models.list())  # polyglot coding
 
     return models
 
 
+def model_names(models: list) -> list[str]:
+    # openai models have an id, gemini ones a name like "models/gemini-..."
+    names = [getattr(m, "id", None) or getattr(m, "name", "") for m in models]
+    return [n.removeprefix("models/") for n in names]
+
+
 def verify_models_list(config: Config, key: str, selected_model: str) -> str:
-    models = get_models_list(config, key)
-    if selected_model not in models:
+    models = model_names(get_models_list(config, key))
+    if selected_model.removeprefix("models/") not in models:
         raise PydanticCustomError(
             "Invalid model error",
             "Selected AI model not in the API's model list. Avaliable models: {models}",
             {"models": models},
         )
-    return key
+    return selected_model
 
 
 def verify_api_key(config: Config, key: str) -> str:
@@ -59,7 +72,7 @@ def verify_api_key(config: Config, key: str) -> str:
         )
     try:
         get_models_list(config, key)
-    except (g_error.APIError, openai.APIError):
+    except api_errors(config):
         raise PydanticCustomError(
             "API error",
             "API key could not fetch models from api url."
@@ -0,0 +1,180 @@
+# pylint: disable = C0116, C0115, C0114, C0411
+"""
+retries with exponential backoff and jitter for provider calls, plus a
+token bucket per api_type/model. Config.rate_limits holds entries like
+"openai/gpt-4o=60" or "google=15", in requests a minute
+"""
+
+from __future__ import annotations
+
+import asyncio
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterator,
+    TypeVar,
+)
+
+if TYPE_CHECKING:
+    from AI_TUI.pydantic_stuff.models import Config
+
+T = TypeVar("T")
+Retryable = Callable[[Exception], bool]
+
+RETRY_STATUSES = frozenset({408, 409, 429, 500, 502, 503, 504})
+BASE_DELAY = 0.5
+_DONE = object()
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float) -> None:
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """takes a token, returns how long to wait before it may be used"""
+        with self._lock:
+            now = time.monotonic()
+            refill = (now - self.last) * self.rate
+            self.tokens = min(self.capacity, self.tokens + refill)
+            self.last = now
+            # going negative queues callers up behind each other
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+
+_buckets: dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+@lru_cache
+def parse_limits(entries: tuple[str, ...]) -> dict[str, float]:
+    limits = {}
+    for entry in entries:
+        key, _, value = entry.partition("=")
+        try:
+            limits[key.strip()] = float(value)
+        except ValueError:
+            raise ValueError(f"invalid rate limit {entry!r}, use key=number") from None
+    return limits
+
+
+def get_bucket(config: Config) -> TokenBucket | None:
+    """the most specific limit wins: "openai/gpt-4o" over "openai" """
+    limits = parse_limits(config.rate_limits)
+    for key in (f"{config.api_type}/{config.model}", config.api_type):
+        if limits.get(key, 0) > 0:
+            with _buckets_lock:
+                if key not in _buckets:
+                    _buckets[key] = TokenBucket(limits[key])
+                return _buckets[key]
+    return None
+
+
+def status_code(err: Exception) -> int | None:
+    # openai errors have status_code, google.genai ones have code
+    code = getattr(err, "status_code", None) or getattr(err, "code", None)
+    return code if isinstance(code, int) else None
+
+
+def retry_after(err: Exception) -> float | None:
+    headers = getattr(getattr(err, "response", None), "headers", None) or {}
+    if value := headers.get("retry-after-ms"):
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    if value := headers.get("retry-after"):
+        try:
+            return float(value)
+        except ValueError:
+            pass
+        try:
+            when = parsedate_to_datetime(value)
+            return (when - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            pass
+    return None
+
+
+def backoff(err: Exception, attempt: int, config: Config) -> float:
+    if (wait := retry_after(err)) is not None:
+        return min(max(0.0, wait), config.retry_max_delay)
+    # full jitter
+    return random.uniform(0, min(config.retry_max_delay, BASE_DELAY * 2**attempt))
+
+
+def call(fn: Callable[[], T], config: Config, retryable: Retryable) -> T:
+    bucket = get_bucket(config)
+    for attempt in range(config.max_retries + 1):
+        if bucket:
+            time.sleep(bucket.reserve())
+        try:
+            return fn()
+        except Exception as err:  # pylint: disable = W0718
+            if attempt >= config.max_retries or not retryable(err):
+                raise
+            time.sleep(backoff(err, attempt, config))
+    raise AssertionError("unreachable")
+
+
+async def call_async(
+    fn: Callable[[], Awaitable[T]], config: Config, retryable: Retryable
+) -> T:
+    bucket = get_bucket(config)
+    for attempt in range(config.max_retries + 1):
+        if bucket:
+            await asyncio.sleep(bucket.reserve())
+        try:
+            return await fn()
+        except Exception as err:  # pylint: disable = W0718
+            if attempt >= config.max_retries or not retryable(err):
+                raise
+            await asyncio.sleep(backoff(err, attempt, config))
+    raise AssertionError("unreachable")
+
+
+def open_stream(
+    make: Callable[[], Iterator[T]], config: Config, retryable: Retryable
+) -> Iterator[T]:
+    """
+    retries a stream until its first item arrives, after that a failure
+    would repeat text the user already saw, so it is not retried
+    """
+
+    def first() -> tuple[Iterator[T], Any]:
+        stream = iter(make())
+        return stream, next(stream, _DONE)
+
+    stream, head = call(first, config, retryable)
+    if head is not _DONE:
+        yield head
+        yield from stream
+
+
+async def open_stream_async(
+    make: Callable[[], Awaitable[AsyncIterator[T]]],
+    config: Config,
+    retryable: Retryable,
+) -> AsyncIterator[T]:
+    async def first() -> tuple[AsyncIterator[T], Any]:
+        stream = await make()
+        return stream, await anext(stream, _DONE)
+
+    stream, head = await call_async(first, config, retryable)
+    if head is not _DONE:
+        yield head
+        async for item in stream:
+            yield item
@@ -0,0 +1,111 @@
+# pylint: disable = C0116, C0115, C0114, C0411
+
+from __future__ import annotations
+
+import hashlib
+import re
+import shutil
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+from prompt_toolkit.utils import get_cwidth
+
+from AI_TUI import metrics, native_render
+
+if TYPE_CHECKING:
+    from AI_TUI.pydantic_stuff.models import Renderer
+
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;?]*[A-Za-z]")
+FENCES = ("```", "~~~")
+RENDER_CACHE = 256
+
+# set from Config.renderer at startup
+renderer: Renderer = "mdv"
+_cache: OrderedDict[tuple[bytes, int, str], str] = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def render_mdv(text: str, width: int) -> str:
+    import mdv  # pylint: disable = C0415
+
+    return mdv.main(text, cols=width)
+
+
+def markdown(text: str, width: int | None = None, cache: bool = True) -> str:
+    """
+    renders for the terminal width. the same text at the same width comes
+    out of a cache, so only a resize renders it again. cache=False is for
+    text that won't be seen twice, like a block that is still streaming
+    """
+    width = width or shutil.get_terminal_size().columns
+    key = (hashlib.blake2b(text.encode(), digest_size=16).digest(), width, renderer)
+    if cache:
+        with _cache_lock:
+            if key in _cache:
+                _cache.move_to_end(key)
+                return _cache[key]
+
+    with metrics.span("render"):
+        if renderer == "native":
+            rendered = native_render.render(text, width)
+        else:
+            rendered = render_mdv(text, width)
+
+    if cache:
+        with _cache_lock:
+            _cache[key] = rendered
+            if len(_cache) > RENDER_CACHE:
+                _cache.popitem(last=False)
+    return rendered
+
+
+def fit(line: str, width: int) -> str:
+    """line cut or padded to width columns, escape codes don't count"""
+    out, used = [], 0
+    for part in re.split(f"({ANSI_ESCAPE.pattern})", line):
+        if ANSI_ESCAPE.fullmatch(part):
+            out.append(part)
+            continue
+        for char in part:
+            used += get_cwidth(char)
+            if used > width:
+                return "".join(out) + "\x1b[0m"
+            out.append(char)
+    return "".join(out) + "\x1b[0m" + " " * (width - used)
+
+
+def side_by_side(columns: list[tuple[str, str]], width: int | None = None) -> str:
+    """(title, markdown) pairs rendered next to each other"""
+    width = width or shutil.get_terminal_size().columns
+    inner = max(10, (width - 3 * (len(columns) - 1)) // len(columns))
+    rendered = [
+        [f"\x1b[1m{title}\x1b[0m", ""]
+        + markdown(text, inner).rstrip("\n").split("\n")
+        for title, text in columns
+    ]
+    rows = max(len(lines) for lines in rendered)
+    return "\n".join(
+        " │ ".join(fit(lines[i] if i < len(lines) else "", inner) for lines in rendered)
+        for i in range(rows)
+    )
+
+
+def last_block_boundary(text: str) -> int:
+    """
+    index right after the last blank line that is not inside a code fence.
+    everything before it is a finished markdown block, 0 if there is none
+    """
+    boundary = 0
+    in_fence = False
+    position = 0
+    for line in text.splitlines(keepends=True):
+        position += len(line)
+        if not line.endswith("\n"):
+            break
+        stripped = line.strip()
+        if stripped.startswith(FENCES):
+            in_fence = not in_fence
+        elif not stripped and not in_fence:
+            boundary = position
+    return boundary
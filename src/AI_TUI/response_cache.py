@@ -0,0 +1,102 @@
+# pylint: disable = C0116, C0115, C0114, C0411
+"""
+opt-in sqlite cache of whole responses, keyed by everything that goes into
+a request. least recently used entries go first once it grows past its size
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Sequence
+
+if TYPE_CHECKING:
+    from AI_TUI.main import Message
+    from AI_TUI.pydantic_stuff.models import Config
+
+CACHE_FILE = "response_cache.sqlite3"
+
+
+def cache_key(config: Config, tools: list, messages: Sequence[Message]) -> str:
+    header = json.dumps(
+        [
+            config.api_type,
+            config.model,
+            str(config.endpoint),
+            config.context_budget,
+            config.context_strategy,
+            tools,
+        ],
+        sort_keys=True,
+    )
+    key = hashlib.sha256(header.encode())
+    for m in messages:
+        key.update(m.digest)
+    return key.hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path: Path, max_mb: float) -> None:
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        # set by the bypass key binding, skips the lookup of the next query
+        self.bypass_next = False
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+            "size INTEGER NOT NULL, used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS by_use ON responses (used)")
+        self._db.commit()
+
+    def get(self, key: str) -> str | None:
+        if self.bypass_next:
+            self.bypass_next = False
+            return None
+        with self._lock:
+            row = self._db.execute(
+                "SELECT response FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE responses SET used = ? WHERE key = ?", (time.time(), key)
+            )
+            self._db.commit()
+            return row[0]
+
+    def put(self, key: str, response: str) -> None:
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, response, size, time.time()),
+            )
+            self._evict()
+            self._db.commit()
+
+    def _evict(self) -> None:
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses")
+        excess = total.fetchone()[0] - self.max_bytes
+        if excess <= 0:
+            return
+        freed = 0
+        doomed = []
+        rows = self._db.execute("SELECT key, size FROM responses ORDER BY used")
+        for key, size in rows:
+            if freed >= excess:
+                break
+            doomed.append((key,))
+            freed += size
+        self._db.executemany("DELETE FROM responses WHERE key = ?", doomed)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,69 @@
+# pylint: disable = C0116, C0115, C0114, C0411
+"""
+what the provider already holds of a conversation, with Config.server_context
+on. for openai that is the last response (previous_response_id), for gemini a
+cached content with the system prompt, tools and older history. each entry
+remembers the payload it covers, a request only sends what comes after it,
+and a payload that no longer starts with it (undo, context window, expiry)
+goes out whole again
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import TYPE_CHECKING, Any, NamedTuple, Sequence
+
+if TYPE_CHECKING:
+    from AI_TUI.pydantic_stuff.models import Config
+
+
+class Entry(NamedTuple):
+    name: str  # response id or cached content name
+    prefix: tuple[Any, ...]  # the payload items the server has
+    expires: float
+
+
+def context_key(config: Config) -> str:
+    return f"{config.api_type}/{config.model}@{config.endpoint}"
+
+
+def starts_with(payload: Sequence[Any], prefix: Sequence[Any]) -> bool:
+    # converted messages are reused between turns, so "is" settles most of them
+    return len(payload) > len(prefix) and all(
+        a is b or a == b for a, b in zip(prefix, payload)
+    )
+
+
+class ServerContext:
+    def __init__(self) -> None:
+        # one per backend, hedged and fan-out queries share a conversation
+        self._entries: dict[str, Entry] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str, payload: Sequence[Any]) -> Entry | None:
+        """the entry covering the start of payload, if it is still there"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires > time.time() and starts_with(payload, entry.prefix):
+                return entry
+        return None
+
+    def put(
+        self, key: str, name: str, prefix: Sequence[Any], expires: float
+    ) -> Entry | None:
+        """stores the new entry, returns the one it replaced"""
+        with self._lock:
+            old = self._entries.get(key)
+            self._entries[key] = Entry(name, tuple(prefix), expires)
+        return old
+
+    def entries(self) -> dict[str, Entry]:
+        with self._lock:
+            return dict(self._entries)
+
+    def drop(self, key: str) -> Entry | None:
+        with self._lock:
+            return self._entries.pop(key, None)
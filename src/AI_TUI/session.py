@@ -0,0 +1,238 @@
+# pylint: disable = C0116, C0115, C0114, C0411
+"""
+binary snapshot of a session, kept next to its log and appended to along
+with it: the messages, the undo stack and the server context ids. --resume
+reads it back in one pass, no markdown gets parsed
+"""
+
+from __future__ import annotations
+
+import hashlib
+import importlib
+import json
+import struct
+import time
+from collections import deque
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, BinaryIO, NamedTuple, Sequence
+
+from AI_TUI.log_writer import append, close_file, replace_file
+
+if TYPE_CHECKING:
+    from AI_TUI.main import Message, MessagesArray
+    from AI_TUI.pydantic_stuff.models import FsyncPolicy
+
+MAGIC = b"AI-TUI session 1\n"
+SESSION_SUFFIX = ".session"
+RECORD = struct.Struct("<cI")  # kind, length of the body
+
+MESSAGE = b"M"  # role \0 content, appended to the messages
+UNDONE = b"P"  # the last message moves to the undo stack
+DELETED = b"D"  # role \0 content, pushed on the undo stack
+REDONE = b"U"  # the top of the undo stack moves back to the messages
+DROPPED = b"O"  # the top of the undo stack is gone, a MESSAGE brings it back
+SERVER = b"S"  # key \0 server context entry as json
+FORGOTTEN = b"F"  # key of a server context entry that is gone
+# a snapshot can come from anywhere, only these get imported for its entries
+PROVIDERS = {
+    "openai": "AI_TUI.providers.openai_api",
+    "google": "AI_TUI.providers.google_api",
+}
+
+
+class Session(NamedTuple):
+    messages: list[tuple[str, str]]
+    deleted: deque[tuple[str, str]]
+    # decoding them imports a provider sdk, so they wait until needed
+    server: dict[str, bytes]
+
+
+def record(kind: bytes, body: bytes) -> bytes:
+    return RECORD.pack(kind, len(body)) + body
+
+
+def pack_message(message: Message) -> bytes:
+    return f"{message.role}\0{message.content}".encode("utf-8")
+
+
+def unpack_message(body: bytes) -> tuple[str, str]:
+    role, _, content = body.decode("utf-8").partition("\0")
+    return role, content
+
+
+def load_session(path: Path, undo_limit: int) -> Session:
+    data = path.read_bytes()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path.name} is not a session snapshot")
+    session = Session([], deque(maxlen=undo_limit), {})
+    at = len(MAGIC)
+    while at + RECORD.size <= len(data):
+        kind, length = RECORD.unpack_from(data, at)
+        body = data[at + RECORD.size : at + RECORD.size + length]
+        if len(body) < length:
+            break  # cut short by a crash, everything before it is fine
+        at += RECORD.size + length
+        replay(session, kind, body)
+    return session
+
+
+def replay(session: Session, kind: bytes, body: bytes) -> None:
+    messages, deleted = session.messages, session.deleted
+    if kind == MESSAGE:
+        messages.append(unpack_message(body))
+    elif kind == UNDONE and messages:
+        deleted.append(messages.pop())
+    elif kind == DELETED:
+        deleted.append(unpack_message(body))
+    elif kind == REDONE and deleted:
+        messages.append(deleted.pop())
+    elif kind == DROPPED and deleted:
+        deleted.pop()
+    elif kind == SERVER:
+        key, _, entry = body.partition(b"\0")
+        session.server[key.decode()] = entry
+    elif kind == FORGOTTEN:
+        session.server.pop(body.decode(), None)
+
+
+def find_session(folder: Path, stem: str, name: str = "") -> Path | None:
+    """the session called name, or the last one written when there is no name"""
+    if name:
+        for path in (Path(name), folder / name, folder / f"{name}{SESSION_SUFFIX}"):
+            if path.is_file():
+                return path
+        return None
+    sessions = list(folder.glob(f"{stem}*{SESSION_SUFFIX}"))
+    return max(sessions, key=lambda p: p.stat().st_mtime) if sessions else None
+
+
+def prefix_digest(messages: Sequence[Message], count: int) -> bytes:
+    return hashlib.blake2b(b"".join(m.digest for m in messages[:count])).digest()
+
+
+def dump_item(item: Any) -> Any:
+    """a payload item as json, sdk objects included"""
+    if hasattr(item, "model_dump"):
+        return item.model_dump(mode="json", exclude_none=True)
+    return item
+
+
+def restore_entry(messages: MessagesArray, key: str, body: bytes) -> None:
+    data = json.loads(body)
+    if data["expires"] <= time.time() or data["count"] > len(messages):
+        return
+    if prefix_digest(messages, data["count"]).hex() != data["digest"]:
+        return  # the developer prompt changed since
+    provider = importlib.import_module(PROVIDERS[key.partition("/")[0]])
+    prefix = [provider.load_item(item) for item in data["rest"]]
+    if data["count"]:
+        prefix[:0] = messages.converted(
+            provider.__name__, provider.convert, 0, data["count"]
+        )
+    messages.server.put(key, data["name"], prefix, data["expires"])
+
+
+def restore_server(messages: MessagesArray, entries: dict[str, bytes]) -> None:
+    """puts back the server context entries that still match the messages"""
+    for key, body in entries.items():
+        try:
+            restore_entry(messages, key, body)
+        except (ValueError, KeyError, TypeError, ImportError):
+            # an older snapshot, another sdk version or not an entry at all,
+            # the conversation just goes out whole the first time
+            continue
+
+
+class SessionWriter:
+    def __init__(
+        self, path: Path, fsync: FsyncPolicy, deleted: deque[Message]
+    ) -> None:
+        self.path = path
+        self.fsync = fsync
+        # the undo stack, a resumed one is written out when the file is made
+        self.deleted = deleted
+        self.count = 0
+        self._server: dict[str, str] = {}  # key -> name of the written entry
+        self._file: BinaryIO | None = None
+
+    def _get_file(self) -> BinaryIO:
+        if self._file is None:
+            self.path.parent.mkdir(exist_ok=True, parents=True)
+            self._file = self.path.open("ab")
+            if not self._file.tell():
+                self._file.write(MAGIC)
+                for message in self.deleted:
+                    self._file.write(record(DELETED, pack_message(message)))
+        return self._file
+
+    def _write(self, *records: bytes) -> None:
+        if not records:
+            return
+        append(self._get_file(), b"".join(records), self.fsync)
+
+    def sync(self, messages: MessagesArray) -> None:
+        """appends the messages and server context changes not written yet"""
+        records = [record(MESSAGE, pack_message(m)) for m in messages[self.count :]]
+        self.count = len(messages)
+        records.extend(self._server_records(messages))
+        self._write(*records)
+
+    def _server_records(self, messages: MessagesArray) -> list[bytes]:
+        entries = messages.server.entries()
+        records = [
+            record(FORGOTTEN, key.encode()) for key in self._server.keys() - entries
+        ]
+        for key in self._server.keys() - entries:
+            del self._server[key]
+        for key, entry in entries.items():
+            if self._server.get(key) == entry.name:
+                continue
+            _, count = messages.shared(entry.prefix)
+            body = {
+                "count": count,
+                "digest": prefix_digest(messages, count).hex(),
+                "name": entry.name,
+                "expires": entry.expires,
+                # the converted messages are converted again on resume
+                "rest": [dump_item(item) for item in entry.prefix[count:]],
+            }
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            records.append(record(SERVER, key.encode() + b"\0" + data))
+            self._server[key] = entry.name
+        return records
+
+    def undo(self, message: Message, length: int) -> None:
+        """message was popped off the end, leaving length messages"""
+        if self.count > length:
+            self.count = length
+            self._write(record(UNDONE, b""))
+        else:
+            self._write(record(DELETED, pack_message(message)))
+
+    def redo(self, length: int) -> None:
+        """the top of the undo stack was appended, making length messages"""
+        if self.count == length - 1:
+            self.count = length
+            self._write(record(REDONE, b""))
+        else:
+            # there are unwritten messages before it, sync() writes it later
+            self._write(record(DROPPED, b""))
+
+    def compact(self, messages: MessagesArray) -> None:
+        """rewrites the snapshot as its end state, nothing left to replay"""
+        self.close()
+        if not self.path.exists():
+            return
+        self._server = {}
+        records = [
+            MAGIC,
+            *(record(DELETED, pack_message(m)) for m in self.deleted),
+            *(record(MESSAGE, pack_message(m)) for m in messages[: self.count]),
+            *self._server_records(messages),
+        ]
+        replace_file(self.path, b"".join(records), self.fsync)
+
+    def close(self) -> None:
+        if self._file is not None:
+            close_file(self._file, self.fsync)
+            self._file = None
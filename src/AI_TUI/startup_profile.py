@@ -0,0 +1,67 @@
+# pylint: disable = C0116, C0115, C0114, C0411
+"""import time breakdown of the application, for ai-tui --profile-startup"""
+
+from __future__ import annotations
+
+import subprocess
+import sys
+
+# prompt_toolkit and pydantic take about 300 ms between them, the rest of
+# the application has to fit in what is left
+STARTUP_BUDGET_MS = 350
+SHOWN_MODULES = 15
+PROFILED = "AI_TUI.main"
+
+
+def parse_importtime(output: str, parent: str = PROFILED) -> tuple[int, dict[str, int]]:
+    """
+    cumulative microseconds of parent and of each of its direct imports in
+    -X importtime output. what parent runs itself is under "parent (self)"
+    """
+    children: dict[str, int] = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        own, cumulative, name = line.split(":", 1)[1].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # the header line
+        # one space before top level imports, two more for every level under
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        if depth == 0:
+            # imports are listed before the module importing them
+            if name == parent:
+                children[f"{name} (self)"] = int(own)
+                return int(cumulative), children
+            children = {}
+        elif depth == 1:
+            children[name] = children.get(name, 0) + int(cumulative)
+    return 0, {}
+
+
+def profile_startup() -> int:
+    if getattr(sys, "frozen", False):
+        print("Startup profiling needs a python interpreter, run it from source.")
+        return 1
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {PROFILED}"],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    total, children = parse_importtime(result.stderr)
+    if result.returncode != 0 or not total:
+        print(result.stderr)
+        return 1
+
+    total_ms = total / 1000
+    print(f"{'imported by ' + PROFILED:<40}{'ms':>10}{'share':>8}")
+    for name, micro in sorted(children.items(), key=lambda i: -i[1])[:SHOWN_MODULES]:
+        ms = micro / 1000
+        print(f"{name:<40}{ms:>10.1f}{ms / total_ms:>8.0%}")
+    print(f"\n{'total':<40}{total_ms:>10.1f}")
+
+    verdict = "within" if total_ms <= STARTUP_BUDGET_MS else "OVER"
+    print(f"{verdict} the startup budget of {STARTUP_BUDGET_MS} ms")
+    return 0 if total_ms <= STARTUP_BUDGET_MS else 1
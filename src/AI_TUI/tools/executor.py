@@ -0,0 +1,133 @@
+# pylint: disable = C0116, C0115, C0114, C0411
+"""
+runs every function call of a model turn at the same time.
+tools run on a thread pool unless tools.json says "executor": "process",
+"timeout" overrides the default time limit of a tool and "cache": true
+remembers its results for the rest of the session.
+a call that times out while running keeps its worker, so its pool gets
+replaced. a thread can't be stopped though, it runs on in the background
+until it returns (process workers are terminated from python 3.14 on)
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+import time
+from concurrent.futures import (
+    CancelledError,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    TimeoutError as FutureTimeout,
+)
+from typing import TYPE_CHECKING, Any
+
+from AI_TUI import metrics
+from AI_TUI.tools import tools as tool_callables
+
+if TYPE_CHECKING:
+    from AI_TUI.tools.registry import ToolRegistry
+
+_pools: dict[str, Executor] = {}
+_lock = threading.Lock()
+_results: dict[tuple[str, str], Any] = {}
+
+
+def call_tool(name: str, args: dict[str, Any]) -> Any:
+    # module level so process pools can pickle it
+    return tool_callables.functions[name](**args)
+
+
+def get_pool(kind: str, workers: int) -> Executor:
+    with _lock:
+        if kind not in _pools:
+            if kind == "process":
+                _pools[kind] = ProcessPoolExecutor(max_workers=workers)
+            else:
+                _pools[kind] = ThreadPoolExecutor(
+                    max_workers=workers, thread_name_prefix="tool"
+                )
+        return _pools[kind]
+
+
+def retire_pool(kind: str) -> None:
+    """drops a pool whose workers are held by calls that timed out"""
+    with _lock:
+        pool = _pools.pop(kind, None)
+    if pool is None:
+        return
+    terminate = getattr(pool, "terminate_workers", None)
+    if terminate is not None:
+        terminate()
+    else:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def cache_key(name: str, args: dict[str, Any]) -> tuple[str, str]:
+    return name, json.dumps(args, sort_keys=True, default=str)
+
+
+def submit(kind: str, workers: int, name: str, args: dict[str, Any]) -> Future:
+    future = get_pool(kind, workers).submit(call_tool, name, args)
+    if turn := metrics.current():
+        future.add_done_callback(turn.timer(f"tool:{name}"))
+    return future
+
+
+def run_calls(
+    calls: list[tuple[str, dict[str, Any]]],
+    registry: ToolRegistry,
+    workers: int,
+    timeout: float,
+) -> list[Any]:
+    """returns the results in the same order as the calls"""
+    pending: dict[int, Future] = {}
+    kinds: dict[int, str] = {}
+    results: list[Any] = [None] * len(calls)
+
+    for i, (name, args) in enumerate(calls):
+        key = cache_key(name, args)
+        if registry.option(name, "cache", False) and key in _results:
+            results[i] = _results[key]
+            continue
+        kinds[i] = registry.option(name, "executor", "thread")
+        pending[i] = submit(kinds[i], workers, name, args)
+
+    started = time.monotonic()
+    for i, future in pending.items():
+        name, args = calls[i]
+        limit = registry.option(name, "timeout", timeout)
+        remaining = max(0.0, started + limit - time.monotonic())
+        try:
+            results[i] = future.result(timeout=remaining)
+        except FutureTimeout:
+            if not future.cancel():
+                retire_pool(kinds[i])
+                # the calls queued behind it go to the new pool
+                for j in pending:
+                    if j > i and kinds[j] == kinds[i] and pending[j].cancel():
+                        pending[j] = submit(kinds[j], workers, *calls[j])
+            results[i] = f"ERROR: tool {name} timed out after {limit} seconds"
+            continue
+        except CancelledError:
+            # queued on a pool that another turn's timeout retired
+            results[i] = f"ERROR: tool {name} was cancelled"
+            continue
+        except Exception as err:  # pylint: disable = W0718
+            # the model gets told instead of the whole turn dying
+            results[i] = f"ERROR: tool {name} failed: {err!r}"
+            continue
+        if registry.option(name, "cache", False):
+            _results[cache_key(name, args)] = results[i]
+
+    return results
+
+
+def shutdown_pools() -> None:
+    with _lock:
+        for pool in _pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        _pools.clear()
+        _results.clear()
@@ -0,0 +1,114 @@
+# pylint: disable = C0116, C0115, C0114, C0411
+"""
+loads tools.json once, checks it against tools.py and keeps the
+provider-specific tool representations around until the file changes
+"""
+
+from __future__ import annotations
+
+import inspect
+import json
+from functools import lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from AI_TUI.tools import tools as tool_callables
+
+if TYPE_CHECKING:
+    from google.genai import types
+
+# keys in tools.json that are sent to the providers, the rest is for us
+SCHEMA_KEYS = ("name", "description", "parameters")
+EXECUTORS = ("thread", "process")
+
+
+def tools_path(home: Path) -> Path:
+    if (home / "src").exists():
+        home = home / "src"
+    return home / "tools" / "tools.json"
+
+
+def validate_schema(schema: Any) -> None:
+    if not isinstance(schema, dict) or not isinstance(schema.get("name"), str):
+        raise ValueError(f"tool schema without a name: {schema}")
+    name = schema["name"]
+    if name not in tool_callables.functions:
+        raise ValueError(f"tool {name} has no matching function in tools.py")
+
+    if schema.get("executor", "thread") not in EXECUTORS:
+        raise ValueError(f"executor of tool {name} must be one of {EXECUTORS}")
+    if not isinstance(schema.get("timeout", 1), (int, float)):
+        raise ValueError(f"timeout of tool {name} must be a number of seconds")
+    if not isinstance(schema.get("cache", False), bool):
+        raise ValueError(f"cache of tool {name} must be true or false")
+
+    parameters = schema.get("parameters", {})
+    if parameters.get("type", "object") != "object":
+        raise ValueError(f"parameters of tool {name} must be an object")
+
+    signature = inspect.signature(tool_callables.functions[name])
+    accepted = set(signature.parameters)
+    declared = set(parameters.get("properties", {}))
+    if unknown := declared - accepted:
+        raise ValueError(f"tool {name} declares unknown parameters {unknown}")
+    if not set(parameters.get("required", [])) <= declared:
+        raise ValueError(f"tool {name} requires undeclared parameters")
+
+
+class ToolRegistry:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.mtime: int | None = None
+        self.schemas: dict[str, dict] = {}
+        self._openai: list[dict] = []
+        self._gemini: types.Tool | None = None
+
+    def refresh(self) -> None:
+        """reloads tools.json, but only if it changed since the last load"""
+        if not self.path.exists():
+            raise FileNotFoundError(f"json tool data not found in {self.path}")
+        mtime = self.path.stat().st_mtime_ns
+        if mtime == self.mtime:
+            return
+
+        data = json.loads(self.path.read_text(encoding="utf-8"))
+        for schema in data:
+            validate_schema(schema)
+
+        self.schemas = {s["name"]: s for s in data}
+        self._openai = [
+            {"type": "function", **{k: s[k] for k in SCHEMA_KEYS if k in s}}
+            for s in data
+        ]
+        self._gemini = None
+        self.mtime = mtime
+
+    def option(self, name: str, key: str, default: Any = None) -> Any:
+        """reads one of our own keys from a tool's entry in tools.json"""
+        return self.schemas.get(name, {}).get(key, default)
+
+    def openai_tools(self) -> list[dict]:
+        self.refresh()
+        return self._openai
+
+    def gemini_tool(self) -> types.Tool:
+        self.refresh()
+        if self._gemini is None:
+            from google.genai import types  # pylint: disable = C0415
+
+            self._gemini = types.Tool(
+                function_declarations=[
+                    types.FunctionDeclaration(
+                        **{k: s[k] for k in SCHEMA_KEYS if k in s}
+                    )
+                    for s in self.schemas.values()
+                ]
+            )
+        return self._gemini
+
+
+@lru_cache
+def get_registry(home: Path) -> ToolRegistry:
+    registry = ToolRegistry(tools_path(home))
+    registry.refresh()
+    return registry
@@ -0,0 +1,63 @@
+# pylint: disable = C0116, C0115, C0114, C0411
+"""
+gets the next request ready while the prompt is being typed: the provider
+sdk imported, its client created and connected to Config.endpoint, the
+tools loaded and the history converted and counted. sending the prompt then
+only converts the new message. failures are left for the request to report
+"""
+
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from AI_TUI.backend import get_provider, get_tools
+from AI_TUI.clients import get_async_client, get_client
+from AI_TUI.multi_backend import backend_configs
+
+if TYPE_CHECKING:
+    from AI_TUI.main import MessagesArray
+    from AI_TUI.pydantic_stuff.models import Config
+
+
+def prepare(messages: MessagesArray, config: Config, home: Path) -> None:
+    get_tools(home)
+    provider = get_provider(config)
+    messages.converted(provider.__name__, provider.convert)
+    for message in messages:
+        _ = message.tokens, message.digest
+
+
+def connect(config: Config, api_key: str) -> None:
+    get_provider(config).ping(get_client(config, api_key), config)
+
+
+async def connect_async(config: Config, api_key: str) -> None:
+    # the sdk import and client creation block, the request itself doesn't
+    provider = await asyncio.to_thread(get_provider, config)
+    client = await asyncio.to_thread(get_async_client, config, api_key)
+    await provider.ping_async(client, config)
+
+
+async def warm_up(
+    messages: MessagesArray, config: Config, api_key: str, home: Path
+) -> None:
+    """
+    runs on the event loop of the next request, async clients are tied to
+    it. streamed and fan-out answers use the async clients, the rest the
+    sync ones
+    """
+    backends = backend_configs(config, api_key)
+    if config.backend_mode == "single":
+        backends = backends[:1]
+    streaming = config.stream == "yes" or config.backend_mode == "fanout"
+    for backend, key in backends:
+        try:
+            await asyncio.to_thread(prepare, messages, backend, home)
+            if streaming:
+                await connect_async(backend, key)
+            else:
+                await asyncio.to_thread(connect, backend, key)
+        except Exception:  # pylint: disable = W0718
+            continue
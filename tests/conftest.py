@@ -0,0 +1,14 @@
+# pylint: disable = C0116, C0115, C0114, C0411
+
+import pytest
+
+from AI_TUI import main
+from AI_TUI.pydantic_stuff.models import Config
+
+
+@pytest.fixture
+def config(monkeypatch: pytest.MonkeyPatch) -> Config:
+    """a default config, without the config file next to the app"""
+    config = Config(api_key="test-key")
+    monkeypatch.setattr(main, "get_config", lambda: config)
+    return config
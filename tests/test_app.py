@@ -0,0 +1,135 @@
+# pylint: disable = C0116, C0115, C0114, C0411, W0613, W0621
+
+import asyncio
+from collections import deque
+
+import pytest
+from prompt_toolkit.key_binding import KeyBindings
+from prompt_toolkit.keys import Keys
+
+from AI_TUI import app as app_module
+from AI_TUI import main, metrics, multi_backend, render
+from AI_TUI.app import ChatApp
+from AI_TUI.log_writer import LogWriter
+from AI_TUI.main import Message, MessagesArray, add_global_bindings
+
+
+@pytest.fixture
+def chat(config, monkeypatch, tmp_path) -> ChatApp:
+    streaming = config.model_copy(update={"stream": "yes"})
+    monkeypatch.setattr(app_module, "get_config", lambda: streaming)
+    # mdv isn't needed to test the screen
+    monkeypatch.setattr(render, "renderer", "native")
+    warmed: list[int] = []
+
+    async def warm_up(*args) -> None:
+        warmed.append(len(args[0]))
+
+    monkeypatch.setattr(app_module, "warm_up", warm_up)
+    messages = MessagesArray([Message(role="user", content="earlier")])
+    chat = ChatApp(messages, "key", LogWriter(tmp_path / "log.md", "never"))
+    chat.warmed = warmed  # type: ignore
+    return chat
+
+
+def send(chat: ChatApp, *queries: str, cancel: bool = False) -> None:
+    async def run() -> None:
+        for query in queries:
+            chat.input.text = query
+            chat.submit()
+        if cancel:
+            await asyncio.sleep(0)
+            chat.interrupt()
+        for result in await asyncio.gather(*chat.tasks, return_exceptions=True):
+            assert result is None or isinstance(result, asyncio.CancelledError)
+        if chat.warm:
+            await chat.warm
+
+    asyncio.run(run())
+
+
+def test_failed_answer_is_reported(chat, monkeypatch, capsys):
+    async def broken(*args):
+        yield "half"
+        raise OSError("connection reset")
+
+    monkeypatch.setattr(multi_backend, "stream_async", broken)
+    send(chat, "hi")
+    assert [m.content for m in chat.messages[1:]] == ["earlier"]
+    assert "ERROR: connection reset" in capsys.readouterr().out
+    assert chat.warmed == [2]  # type: ignore
+
+
+def test_cancelled_prompts_stop_waiting(chat, monkeypatch):
+    async def slow(*args):
+        await asyncio.sleep(10)
+        yield "late"
+
+    async def quick(*args):
+        yield "ok"
+
+    monkeypatch.setattr(multi_backend, "stream_async", slow)
+    send(chat, "one", "two", "three", cancel=True)
+    assert not chat.waiting
+    monkeypatch.setattr(multi_backend, "stream_async", quick)
+    send(chat, "four")
+    assert not chat.waiting
+    assert [m.content for m in chat.messages[1:]] == ["earlier", "four", "ok"]
+
+
+def test_late_probe_error_shows_up(chat, monkeypatch):
+    errors = [None, "endpoint unreachable"]
+
+    class Probe:
+        def take_error(self) -> str | None:
+            return errors.pop(0) if errors else None
+
+    monkeypatch.setattr(app_module, "get_probe", Probe)
+    assert "WARN" not in chat.status()
+    assert "WARN: endpoint unreachable" in chat.status()
+    assert "WARN: endpoint unreachable" in chat.status()
+
+
+def test_answer_render_counts_towards_its_turn(chat, monkeypatch):
+    async def quick(*args):
+        yield "**done**"
+
+    monkeypatch.setattr(multi_backend, "stream_async", quick)
+    send(chat, "go")
+    assert metrics.last is not None
+    assert metrics.last.spans["render"] > 0
+
+
+def test_undo_waits_for_the_answer(chat, monkeypatch):
+    monkeypatch.setattr(main, "GLOBAL_KEYS", KeyBindings())
+    monkeypatch.setattr(main, "deleted", deque(maxlen=main.UNDO_LIMIT))
+    add_global_bindings(chat.messages, chat.log, chat.notice, chat.answering)
+    (undo,) = main.GLOBAL_KEYS.get_bindings_for_keys((Keys.ControlZ,))
+    release = asyncio.Event()
+
+    async def held(*args):
+        await release.wait()
+        yield "answer"
+
+    async def run() -> None:
+        chat.input.text = "question"
+        chat.submit()
+        await asyncio.sleep(0)
+        undo.handler(None)  # type: ignore
+        assert "Wait for the answer" in chat.notice_text
+        release.set()
+        await asyncio.gather(*chat.tasks)
+        if chat.warm:
+            await chat.warm
+
+    monkeypatch.setattr(multi_backend, "stream_async", held)
+    asyncio.run(run())
+    assert [m.role for m in chat.messages] == [
+        "developer",
+        "user",
+        "user",
+        "assistant",
+    ]
+    assert not main.deleted
+    undo.handler(None)  # type: ignore
+    assert [m.content for m in main.deleted] == ["answer"]
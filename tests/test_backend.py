@@ -0,0 +1,89 @@
+# pylint: disable = C0116, C0115, C0114, C0411, W0613
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from AI_TUI import backend, metrics
+from AI_TUI.backend import StreamError, make_query_async, make_query_stream
+from AI_TUI.main import Message, MessagesArray
+from AI_TUI.response_cache import ResponseCache
+
+
+def chunks(broken: bool):
+    yield "one "
+    yield "two "
+    if broken:
+        raise StreamError("500")
+    yield "three"
+
+
+async def chunks_async(broken: bool):
+    for chunk in chunks(broken):
+        yield chunk
+
+
+@pytest.fixture
+def provider(monkeypatch: pytest.MonkeyPatch) -> SimpleNamespace:
+    fake = SimpleNamespace(
+        __name__="fake",
+        convert=lambda m: m.to_dict(),
+        broken=True,
+    )
+    fake.stream = lambda *args: chunks(fake.broken)
+    fake.stream_async = lambda *args: chunks_async(fake.broken)
+    monkeypatch.setattr(backend, "get_provider", lambda config: fake)
+    monkeypatch.setattr(backend, "get_client", lambda config, key: None)
+    monkeypatch.setattr(backend, "get_async_client", lambda config, key: None)
+    monkeypatch.setattr(backend, "get_tools", lambda home: [])
+    return fake
+
+
+def test_broken_stream_is_not_cached(config, provider, tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite3", 1)
+    messages = MessagesArray([Message(role="user", content="count")])
+    received: list[str] = []
+    with pytest.raises(StreamError):
+        for chunk in make_query_stream("key", messages, config, tmp_path, cache):
+            received.append(chunk)
+    assert received == ["one ", "two "]
+
+    provider.broken = False
+    answer = "".join(make_query_stream("key", messages, config, tmp_path, cache))
+    assert answer == "one two three"
+    provider.broken = True
+    # the whole answer comes from the cache now
+    assert list(make_query_stream("key", messages, config, tmp_path, cache)) == [
+        "one two three"
+    ]
+    cache.close()
+
+
+def test_broken_async_stream_is_not_cached(config, provider, tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite3", 1)
+    messages = MessagesArray([Message(role="user", content="count")])
+
+    async def collect() -> str:
+        stream = make_query_async("key", messages, config, tmp_path, cache)
+        return "".join([chunk async for chunk in stream])
+
+    with pytest.raises(StreamError):
+        asyncio.run(collect())
+    provider.broken = False
+    assert asyncio.run(collect()) == "one two three"
+    cache.close()
+
+
+def test_async_stream_is_measured(config, provider, tmp_path):
+    provider.broken = False
+    messages = MessagesArray([Message(role="user", content="count")])
+
+    async def collect() -> None:
+        with metrics.turn() as turn:
+            async for _ in make_query_async("key", messages, config, tmp_path):
+                pass
+        assert turn.spans["request"] > 0
+        assert turn.first_token is not None
+
+    asyncio.run(collect())
@@ -0,0 +1,46 @@
+# pylint: disable = C0116, C0115, C0114, C0411, W0613
+
+import io
+import json
+
+from AI_TUI import backend, batch
+
+
+def test_malformed_job_fails_alone(config, monkeypatch, tmp_path):
+    monkeypatch.setattr(batch, "get_config", lambda: config)
+    monkeypatch.setattr(backend, "make_query", lambda *args: "answer")
+    jobs = tmp_path / "jobs.jsonl"
+    jobs.write_text(
+        '{"id": "bad", "messages": [{"role": "user", "text": "b"}]}\n'
+        '{"id": "robot", "messages": [{"role": "robot", "content": "b"}]}\n'
+        '{"id": "good", "prompt": "a"}\n',
+        encoding="utf-8",
+    )
+    output = io.StringIO()
+    assert batch.run_batch(jobs, output, 2) == 1
+    results = {r["id"]: r for r in map(json.loads, output.getvalue().splitlines())}
+    assert results["good"]["response"] == "answer"
+    assert results["bad"]["error"].startswith("TypeError")
+    assert results["robot"]["error"].startswith("ValueError")
+
+
+def test_bad_lines_fail_alone(config, monkeypatch, tmp_path):
+    monkeypatch.setattr(batch, "get_config", lambda: config)
+    monkeypatch.setattr(backend, "make_query", lambda *args: "answer")
+    jobs = tmp_path / "jobs.jsonl"
+    jobs.write_text(
+        '{"id": "good", "prompt": "a"}\n'
+        "{not json\n"
+        '["a", "list"]\n'
+        '{"id": "empty"}\n'
+        "\n"
+        '{"prompt": "b"}\n',
+        encoding="utf-8",
+    )
+    output = io.StringIO()
+    assert batch.run_batch(jobs, output, 2) == 1
+    results = {r["id"]: r for r in map(json.loads, output.getvalue().splitlines())}
+    assert results["good"]["response"] == results[6]["response"] == "answer"
+    assert results[2]["error"].startswith("line 2 is not json")
+    assert results[3]["error"] == "line 3 is not a json object"
+    assert results["empty"]["error"] == "line 4 has no prompt or messages"
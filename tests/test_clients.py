@@ -0,0 +1,10 @@
+# pylint: disable = C0116, C0115, C0114, C0411, W0212
+
+from AI_TUI.clients import create_gemini
+
+
+def test_gemini_async_client_gets_the_pool_settings(config):
+    pooled = config.model_copy(update={"pool_size": 3})
+    options = create_gemini(pooled, "test-key")._api_client._http_options
+    assert options.client_args["limits"].max_connections == 3
+    assert options.async_client_args == options.client_args
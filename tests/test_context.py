@@ -0,0 +1,94 @@
+# pylint: disable = C0116, C0115, C0114, C0411, W0613
+
+from AI_TUI.context import SUMMARY_PREFIX, SUMMARY_SHARE
+from AI_TUI.main import Message, MessagesArray
+from AI_TUI.pydantic_stuff.models import Config
+
+
+def conversation(turns: int) -> MessagesArray:
+    messages = MessagesArray()
+    for i in range(turns):
+        messages.append(Message(role="user", content=f"question {i:03}" * 4))
+        messages.append(Message(role="assistant", content=f"answer {i:05}" * 4))
+    return messages
+
+
+def budgeted(config: Config, tokens: int, strategy: str = "window") -> Config:
+    return config.model_copy(
+        update={"context_budget": tokens, "context_strategy": strategy}
+    )
+
+
+class Summarizer:
+    def __init__(self) -> None:
+        self.calls: list[tuple[str, list[str]]] = []
+
+    def __call__(self, text: str, dropped) -> str:
+        self.calls.append((text, [m.content for m in dropped]))
+        return f"{text}+{len(dropped)}"
+
+
+def test_everything_fits(config):
+    messages = conversation(3)
+    total = sum(m.tokens for m in messages)
+    assert messages.context.fit(messages, budgeted(config, total)).start == 1
+    assert messages.context.fit(messages, budgeted(config, 0)).start == 1
+
+
+def test_budget_keeps_the_developer_prompt(config):
+    messages = conversation(3)
+    # not even the prompt fits, the last message still goes with it
+    window = messages.context.fit(messages, budgeted(config, 1))
+    assert window.start == len(messages) - 1
+    assert window.summary is None
+
+
+def test_window_drops_the_oldest_turns(config):
+    messages = conversation(5)
+    budget = messages[0].tokens + sum(m.tokens for m in messages[-4:])
+    window = messages.context.fit(messages, budgeted(config, budget))
+    assert window.start == len(messages) - 4
+    # summarize without a summarizer falls back to the window
+    summarizing = budgeted(config, budget, "summarize")
+    assert messages.context.fit(messages, summarizing).start == len(messages) - 4
+
+
+def test_only_newly_dropped_turns_get_summarized(config):
+    messages = conversation(5)
+    kept = messages[0].tokens + sum(m.tokens for m in messages[-4:])
+    summarizing = budgeted(config, int(kept / (1 - SUMMARY_SHARE)) + 1, "summarize")
+    summarize = Summarizer()
+
+    window = messages.context.fit(messages, summarizing, summarize)
+    assert window.start == 7
+    assert window.summary is not None
+    assert window.summary.content == SUMMARY_PREFIX + "+6"
+    assert summarize.calls == [("", [m.content for m in messages[1:7]])]
+
+    # nothing new dropped, the summary is reused
+    assert messages.context.fit(messages, summarizing, summarize) == window
+    assert len(summarize.calls) == 1
+
+    messages.extend(conversation(1)[1:])
+    window = messages.context.fit(messages, summarizing, summarize)
+    assert window.start == 9
+    assert window.summary.content == SUMMARY_PREFIX + "+6+2"
+    assert summarize.calls[1] == ("+6", [m.content for m in messages[7:9]])
+
+
+def test_undo_invalidates_the_summary(config):
+    messages = conversation(5)
+    kept = messages[0].tokens + sum(m.tokens for m in messages[-4:])
+    summarizing = budgeted(config, int(kept / (1 - SUMMARY_SHARE)) + 1, "summarize")
+    summarize = Summarizer()
+    messages.context.fit(messages, summarizing, summarize)
+
+    # undone past the end of the summary, then asked differently
+    while len(messages) > 5:
+        messages.pop()
+    messages.extend(Message(role="user", content=f"other {i}" * 8) for i in range(6))
+    window = messages.context.fit(messages, summarizing, summarize)
+    assert summarize.calls[-1][0] == ""
+    assert summarize.calls[-1][1][0] == messages[1].content
+    assert window.summary is not None
+    assert window.summary.content == SUMMARY_PREFIX + f"+{window.start - 1}"
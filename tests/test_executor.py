@@ -0,0 +1,35 @@
+# pylint: disable = C0116, C0115, C0114, C0411
+
+import threading
+
+import pytest
+
+from AI_TUI.tools import executor
+from AI_TUI.tools import tools as tool_callables
+
+
+class Registry:
+    def __init__(self, **options: dict) -> None:
+        self.options = options
+
+    def option(self, name: str, key: str, default):
+        return self.options.get(name, {}).get(key, default)
+
+
+@pytest.fixture
+def tools(monkeypatch: pytest.MonkeyPatch):
+    release = threading.Event()
+    monkeypatch.setitem(tool_callables.functions, "hang", lambda: release.wait(5))
+    monkeypatch.setitem(tool_callables.functions, "echo", lambda text: text)
+    yield
+    release.set()
+    executor.shutdown_pools()
+
+
+def test_hung_tools_dont_block_later_calls(tools):
+    registry = Registry(hang={"timeout": 0.1})
+    first = executor.run_calls([("hang", {}), ("echo", {"text": "a"})], registry, 1, 1)
+    assert first[0].startswith("ERROR: tool hang timed out")
+    # queued behind the hung call on the only worker
+    assert first[1] == "a"
+    assert executor.run_calls([("echo", {"text": "b"})], registry, 1, 1) == ["b"]
@@ -0,0 +1,43 @@
+# pylint: disable = C0116, C0115, C0114, C0411, W0613
+
+from AI_TUI.log_index import LogIndex
+from AI_TUI.log_writer import format_msgs, parse_msgs
+from AI_TUI.main import Message
+
+REPLY = "intro\n\n### Summary:\nthe end"
+
+
+def test_parse_keeps_headings_inside_messages(config):
+    text = format_msgs(
+        [Message(role="user", content="hi"), Message(role="assistant", content=REPLY)]
+    )
+    assert parse_msgs(text) == [("user", "hi"), ("assistant", REPLY)]
+
+
+def test_resume_only_gets_valid_roles(tmp_path):
+    (tmp_path / "log_1.md").write_text(
+        f"### User:\nhi\n\n### Assistant:\n{REPLY}\n\n", encoding="utf-8"
+    )
+    index = LogIndex(tmp_path / "index.sqlite3", tmp_path, "log*.md")
+    index.refresh()
+    # a row written by an older parser
+    stale = Message(role="summary", content="the end")  # type: ignore
+    index.add("log_1.md", 2, [stale])
+    assert index.messages("log_1.md", 5) == [("user", "hi"), ("assistant", REPLY)]
+    (hit,) = index.search("intro")
+    assert (hit.log, hit.position) == ("log_1.md", 1)
+    index.close()
+
+
+def test_old_indexes_get_rebuilt(tmp_path):
+    (tmp_path / "log_1.md").write_text("### User:\nhi\n\n", encoding="utf-8")
+    index = LogIndex(tmp_path / "index.sqlite3", tmp_path, "log*.md")
+    index.refresh()
+    index._db.execute("PRAGMA user_version = 0")  # pylint: disable = W0212
+    index._db.commit()  # pylint: disable = W0212
+    index.close()
+    index = LogIndex(tmp_path / "index.sqlite3", tmp_path, "log*.md")
+    assert not index.search("hi")
+    index.refresh()
+    assert index.messages("log_1.md", 0) == [("user", "hi")]
+    index.close()
@@ -0,0 +1,17 @@
+# pylint: disable = C0116, C0115, C0114, C0411
+
+from AI_TUI.log_viewer import header_offsets
+from AI_TUI.log_writer import parse_msgs
+
+LOG = (
+    "### Developer:\nbe nice\n\n"
+    "### User:\nhi\n\n"
+    "### Assistant:\nintro\n\n### Summary:\nthe end\n\n"
+    "### User:\nthanks\n\n"
+)
+
+
+def test_turns_match_the_index_positions():
+    offsets = header_offsets(LOG.encode())
+    assert len(offsets) == len(parse_msgs(LOG)) == 4
+    assert LOG.encode()[offsets[3] :].startswith(b"### User:\nthanks")
@@ -0,0 +1,19 @@
+# pylint: disable = C0116, C0115, C0114, C0411, W0613
+
+from AI_TUI.log_writer import TOMBSTONE, LogWriter, apply_tombstones
+from AI_TUI.main import Message
+
+
+def test_tombstone_retracts_a_reply_with_headings(config, tmp_path):
+    path = tmp_path / "log.md"
+    log = LogWriter(path, "never")
+    messages = [
+        Message(role="user", content="hi"),
+        Message(role="assistant", content="intro\n\n### Summary:\nthe end"),
+    ]
+    log.sync(messages)
+    log.retract(1)
+    log.close()
+    text = path.read_text(encoding="utf-8")
+    assert text.endswith(TOMBSTONE)
+    assert apply_tombstones(text) == "### User:\nhi\n\n"
@@ -0,0 +1,103 @@
+# pylint: disable = C0116, C0115, C0114, C0411, W0613
+
+from AI_TUI import main
+from AI_TUI.main import Message, MessagesArray
+
+
+class Converter:
+    """counts what it converts"""
+
+    def __init__(self) -> None:
+        self.seen: list[str] = []
+
+    def __call__(self, message: Message) -> dict[str, str]:
+        self.seen.append(message.content)
+        return message.to_dict()
+
+
+def conversation(*contents: str) -> MessagesArray:
+    return MessagesArray(Message(role="user", content=c) for c in contents)
+
+
+def check(messages: MessagesArray, convert: Converter) -> list[dict[str, str]]:
+    converted = messages.converted("fake", convert)
+    assert converted == messages.to_list()
+    return converted
+
+
+def test_only_new_messages_get_converted(config):
+    messages = conversation("a", "b")
+    convert = Converter()
+    first = check(messages, convert)
+    assert convert.seen == [config.prompt, "a", "b"]
+
+    assert all(x is y for x, y in zip(check(messages, convert), first))
+    messages.append(Message(role="assistant", content="c"))
+    check(messages, convert)
+    assert convert.seen[3:] == ["c"]
+    assert messages.converted("fake", convert, 1, 3) == messages.to_list()[1:3]
+    assert len(convert.seen) == 4
+    # every provider has a cache of its own
+    messages.converted("other", convert)
+    assert len(convert.seen) == 8
+
+
+def test_changes_reconvert_from_where_they_are(config):
+    messages = conversation("a", "b", "c", "d")
+    convert = Converter()
+    check(messages, convert)
+
+    messages.pop()
+    messages.append(Message(role="user", content="e"))
+    del convert.seen[:]
+    first = check(messages, convert)
+    assert convert.seen == ["e"]
+
+    messages.insert(2, Message(role="user", content="x"))
+    del convert.seen[:]
+    converted = check(messages, convert)
+    assert convert.seen == ["x", "b", "c", "e"]
+    assert converted[:2] == first[:2] and converted[0] is first[0]
+
+    messages[3] = Message(role="user", content="y")
+    del convert.seen[:]
+    check(messages, convert)
+    assert convert.seen == ["y", "c", "e"]
+
+    del messages[1]
+    messages.remove(messages[-1])
+    del convert.seen[:]
+    check(messages, convert)
+    assert convert.seen == ["x", "y", "c"]
+
+    messages[1:] = [Message(role="user", content="z")]
+    del convert.seen[:]
+    check(messages, convert)
+    assert convert.seen == [config.prompt, "z"]
+
+
+def test_spilled_messages_are_converted_every_time(config, monkeypatch):
+    # room for the two newest bodies, the developer prompt never spills
+    spilling = config.model_copy(update={"history_ram_mb": 250 / 1024 / 1024})
+    monkeypatch.setattr(main, "get_config", lambda: spilling)
+    bodies = [f"{i}" * 90 for i in range(4)]
+    messages = conversation(*bodies[:2])
+    convert = Converter()
+    check(messages, convert)
+    assert not any(m.spilled for m in messages)
+
+    messages.extend(conversation(*bodies[2:])[1:])
+    del convert.seen[:]
+    check(messages, convert)
+    assert [m.spilled for m in messages] == [False, True, True, False, False]
+    assert convert.seen == bodies[2:] + bodies[:2]
+
+    # the spilled ones again, the rest stays converted
+    del convert.seen[:]
+    check(messages, convert)
+    assert convert.seen == bodies[:2]
+
+    messages.pop(1)
+    del convert.seen[:]
+    check(messages, convert)
+    assert convert.seen == [*bodies[2:], bodies[1]]
@@ -0,0 +1,69 @@
+# pylint: disable = C0116, C0115, C0114, C0411, W0613
+
+import threading
+
+import pytest
+
+from AI_TUI import metrics, multi_backend
+from AI_TUI.backend import StreamError
+
+
+def test_hedged_stream_passes_on_a_broken_winner(config, monkeypatch):
+    def broken(*args):
+        yield "half "
+        raise StreamError("500")
+
+    monkeypatch.setattr(multi_backend, "make_query_stream", broken)
+    stream = multi_backend.hedged_stream("key", [], config, None)  # type: ignore
+    received: list[str] = []
+    with pytest.raises(StreamError):
+        for chunk in stream:
+            received.append(chunk)
+    assert received == ["half "]
+
+
+def test_hedged_losers_are_closed_and_measured(config, monkeypatch):
+    hedged = config.model_copy(
+        update={"backends": ("openai/fast",), "hedge_after": 0.01}
+    )
+    release, closed = threading.Event(), threading.Event()
+
+    def racing(key, messages, backend_config, home, cache):
+        metrics.add_tokens(10, 0)
+        if backend_config.model != "fast":
+            release.wait()
+            try:
+                yield "late"
+                yield "never read"
+            finally:
+                closed.set()
+            return
+        with metrics.span("request"):
+            yield "fast "
+            yield "answer"
+        metrics.add_tokens(0, 2)
+
+    monkeypatch.setattr(multi_backend, "make_query_stream", racing)
+    with metrics.turn() as turn:
+        chunks = multi_backend.hedged_stream("key", [], hedged, None)  # type: ignore
+        assert "".join(chunks) == "fast answer"
+        # its read was under way, it gets closed once that returns
+        assert not closed.is_set()
+        release.set()
+        assert closed.wait(5)
+    assert (turn.tokens_in, turn.tokens_out) == (20, 2)
+    assert turn.spans["request"] > 0
+
+
+def test_fan_out_is_measured(config, monkeypatch):
+    fanned = config.model_copy(update={"backends": ("openai/other",)})
+
+    def answer(key, messages, backend_config, home, cache):
+        metrics.add_tokens(5, 1)
+        return backend_config.model
+
+    monkeypatch.setattr(multi_backend, "make_query", answer)
+    with metrics.turn() as turn:
+        answers = multi_backend.fan_out("key", [], fanned, None)  # type: ignore
+    assert [text for _, text in answers] == [config.model, "other"]
+    assert (turn.tokens_in, turn.tokens_out) == (10, 2)
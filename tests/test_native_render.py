@@ -0,0 +1,47 @@
+# pylint: disable = C0116, C0115, C0114, C0411
+
+import textwrap
+
+from prompt_toolkit.utils import get_cwidth
+
+from AI_TUI.native_render import BOLD, CODE, ESCAPE, RESET, render, wrap
+
+
+def plain(lines: list[str]) -> list[str]:
+    return [ESCAPE.sub("", line) for line in lines]
+
+
+def test_styles_survive_a_line_break():
+    lines = wrap("some **bold text that crosses** and a `code span here`", 20, "", "")
+    assert plain(lines) == ["some bold text that", "crosses and a code", "span here"]
+    assert "*" not in "".join(lines) and "`" not in "".join(lines)
+    assert lines[0].endswith(RESET) and lines[1].startswith(BOLD)
+    assert lines[1].endswith(RESET) and lines[2].startswith(CODE)
+
+
+def test_wraps_like_textwrap():
+    text = "a " + "x" * 45 + " b and some more words to wrap around"
+    for width in (10, 17, 30):
+        expected = textwrap.wrap(text, width, break_on_hyphens=False)
+        assert plain(wrap(text, width, "", "")) == expected
+
+
+def test_bullets_keep_their_indent():
+    assert render("- one two three four", 12) == "• one two\n  three four\n"
+
+
+def test_wide_characters_take_two_columns():
+    text = "漢字かな交じり文 の 折り返し 😀😀😀😀😀😀 and **太字のテキスト** too"
+    for width in (10, 11, 17, 24):
+        lines = plain(wrap(text, width, "", ""))
+        assert all(get_cwidth(line) <= width for line in lines)
+        assert "".join(lines).replace(" ", "") == text.replace("**", "").replace(
+            " ", ""
+        )
+    # a word too long for any line starts where the last one ended
+    assert plain(wrap("ab 漢字漢字漢字", 10, "", "")) == ["ab 漢字漢", "字漢字"]
+
+
+def test_deep_indents_still_end():
+    rows = render(" " * 12 + "- deep", 10).splitlines()
+    assert "".join(rows).replace(" ", "") == "•deep"
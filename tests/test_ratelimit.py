@@ -0,0 +1,182 @@
+# pylint: disable = C0116, C0115, C0114, C0411, W0613, W0621
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+from google.genai import errors as g_error
+
+from AI_TUI import ratelimit
+from AI_TUI.providers import google_api, openai_api
+
+
+class Clock:
+    """time.monotonic and time.sleep, without the waiting"""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.slept: list[float] = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class Failure(Exception):
+    def __init__(self, status: int, **headers: str) -> None:
+        super().__init__(f"status {status}")
+        self.status_code = status
+        self.response = SimpleNamespace(headers=headers)
+
+
+def retryable(err: Exception) -> bool:
+    return ratelimit.status_code(err) in ratelimit.RETRY_STATUSES
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(ratelimit, "time", clock)
+    monkeypatch.setattr(ratelimit, "_buckets", {})
+    # the top of the jitter range, so the delays can be compared
+    monkeypatch.setattr(ratelimit.random, "uniform", lambda low, high: high)
+    return clock
+
+
+def failing(*errors: Exception, result: str = "ok"):
+    calls: list[int] = []
+
+    def fn() -> str:
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+
+    return fn, calls
+
+
+def test_retry_after_headers():
+    assert ratelimit.retry_after(Failure(429, **{"retry-after-ms": "1500"})) == 1.5
+    assert ratelimit.retry_after(Failure(429, **{"retry-after": "3"})) == 3.0
+    later = datetime.now(timezone.utc) + timedelta(seconds=30)
+    dated = Failure(429, **{"retry-after": format_datetime(later)})
+    wait = ratelimit.retry_after(dated)
+    assert wait is not None and 28 < wait <= 30
+    assert ratelimit.retry_after(Failure(429, **{"retry-after": "soon"})) is None
+    assert ratelimit.retry_after(ValueError("no response")) is None
+
+
+def test_backoff(config, clock):
+    capped = config.model_copy(update={"retry_max_delay": 5.0})
+    assert ratelimit.backoff(Failure(429), 0, capped) == ratelimit.BASE_DELAY
+    assert ratelimit.backoff(Failure(429), 2, capped) == ratelimit.BASE_DELAY * 4
+    assert ratelimit.backoff(Failure(429), 10, capped) == 5.0
+    # the server knows best, within retry_max_delay
+    assert ratelimit.backoff(Failure(429, **{"retry-after": "2"}), 9, capped) == 2.0
+    assert ratelimit.backoff(Failure(429, **{"retry-after": "99"}), 0, capped) == 5.0
+    assert ratelimit.backoff(Failure(429, **{"retry-after": "-1"}), 0, capped) == 0.0
+
+
+def test_retryable_failures_are_retried(config, clock):
+    fn, calls = failing(Failure(503), Failure(429, **{"retry-after": "7"}))
+    assert ratelimit.call(fn, config, retryable) == "ok"
+    assert len(calls) == 3
+    assert clock.slept == [ratelimit.BASE_DELAY, 7.0]
+
+
+def test_other_failures_are_raised(config, clock):
+    fn, calls = failing(Failure(400))
+    with pytest.raises(Failure):
+        ratelimit.call(fn, config, retryable)
+    assert len(calls) == 1 and not clock.slept
+
+    few = config.model_copy(update={"max_retries": 2})
+    fn, calls = failing(*[Failure(500)] * 5)
+    with pytest.raises(Failure):
+        ratelimit.call(fn, few, retryable)
+    assert len(calls) == 3
+
+
+def test_async_calls_retry_too(config, clock, monkeypatch):
+    slept: list[float] = []
+
+    async def sleep(seconds: float) -> None:
+        slept.append(seconds)
+
+    monkeypatch.setattr(ratelimit.asyncio, "sleep", sleep)
+    fn, calls = failing(Failure(502))
+
+    async def call() -> str:
+        return fn()
+
+    assert asyncio.run(ratelimit.call_async(call, config, retryable)) == "ok"
+    assert len(calls) == 2 and slept == [ratelimit.BASE_DELAY]
+
+
+def test_streams_are_retried_until_the_first_item(config, clock):
+    attempts: list[int] = []
+
+    def make():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise Failure(503)
+        yield "a"
+        raise Failure(503)
+
+    stream = ratelimit.open_stream(make, config, retryable)
+    assert next(stream) == "a"
+    with pytest.raises(Failure):
+        next(stream)  # text was shown already, not retried
+    assert len(attempts) == 2
+
+
+def test_bucket_spaces_calls_out(clock):
+    bucket = ratelimit.TokenBucket(60)
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 1.0, 2.0]
+    clock.now += 10
+    # refilled up to the capacity, not past it
+    assert [bucket.reserve() for _ in range(2)] == [0.0, 1.0]
+
+    burst = ratelimit.TokenBucket(600)
+    assert [burst.reserve() for _ in range(11)][-2:] == [0.0, 0.1]
+
+
+def test_most_specific_limit_wins(config, clock):
+    limited = config.model_copy(
+        update={
+            "api_type": "openai",
+            "model": "gpt-4o",
+            "rate_limits": ("openai=10", "openai/gpt-4o=60"),
+        }
+    )
+    assert ratelimit.get_bucket(limited).rate == 1.0
+    other = limited.model_copy(update={"model": "gpt-4.1"})
+    assert ratelimit.get_bucket(other).rate == 10 / 60
+    assert ratelimit.get_bucket(config) is None
+
+    fn, _ = failing()
+    for _ in range(3):
+        ratelimit.call(fn, limited, retryable)
+    assert clock.slept == [0.0, 1.0, 1.0]
+
+
+def test_provider_filters():
+    request = httpx.Request("POST", "http://localhost/")
+
+    def status(code: int) -> openai.APIStatusError:
+        response = httpx.Response(code, request=request)
+        return openai.APIStatusError("failed", response=response, body=None)
+
+    assert openai_api.retryable(status(429))
+    assert openai_api.retryable(openai.APIConnectionError(request=request))
+    assert not openai_api.retryable(status(400))
+    assert not openai_api.retryable(ValueError())
+    assert google_api.retryable(g_error.APIError(503, {"error": {"message": "x"}}))
+    assert not google_api.retryable(g_error.APIError(404, {"error": {"message": "x"}}))
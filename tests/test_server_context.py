@@ -0,0 +1,197 @@
+# pylint: disable = C0116, C0115, C0114, C0411, W0613, W0621
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+from google.genai import errors as g_error
+from google.genai import types
+
+from AI_TUI.providers import google_api, openai_api
+from AI_TUI.pydantic_stuff.models import Config
+from AI_TUI.server_context import ServerContext, context_key
+
+REQUEST = httpx.Request("POST", "http://localhost/v1/responses")
+CHAIN_GONE = {
+    "message": "Previous response with id 'resp_1' not found.",
+    "param": "previous_response_id",
+    "code": "previous_response_not_found",
+}
+
+
+def bad_request(body: dict) -> openai.BadRequestError:
+    response = httpx.Response(400, request=REQUEST)
+    return openai.BadRequestError(body["message"], response=response, body=body)
+
+
+class Responses:
+    """client.responses, failing every chained request with error"""
+
+    def __init__(self, error: Exception) -> None:
+        self.error = error
+        self.sent: list[dict] = []
+
+    def create(self, **args):
+        self.sent.append(args)
+        if "previous_response_id" in args:
+            raise self.error
+        return SimpleNamespace(
+            id=f"resp_{len(self.sent)}", output=[], output_text="answer", usage=None
+        )
+
+
+class AsyncResponses(Responses):
+    async def create(self, **args):  # type: ignore
+        return Responses.create(self, **args)
+
+
+@pytest.fixture
+def openai_config(config, monkeypatch) -> Config:
+    monkeypatch.setattr(openai_api, "get_tools", lambda home: [])
+    monkeypatch.setattr(openai_api, "pause_on_error", lambda: None)
+    return config.model_copy(update={"api_type": "openai", "model": "gpt-test"})
+
+
+def chained_conversation(config: Config) -> tuple[list, ServerContext]:
+    old = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "yo"}]
+    context = ServerContext()
+    context.put(context_key(config), "resp_old", old, time.time() + 60)
+    return [*old, {"role": "user", "content": "again"}], context
+
+
+def test_expired_chain_sends_the_whole_history(openai_config, tmp_path):
+    payload, context = chained_conversation(openai_config)
+    responses = Responses(bad_request(CHAIN_GONE))
+    client = SimpleNamespace(responses=responses)
+    answer = openai_api.make_query_openai(
+        client, payload, openai_config, tmp_path, context  # type: ignore
+    )
+    assert answer == "answer"
+    chained, full = responses.sent
+    assert chained["previous_response_id"] == "resp_old"
+    assert chained["input"] == payload[2:]
+    assert "previous_response_id" not in full and full["input"] == payload
+    assert context.entries()[context_key(openai_config)].name == "resp_2"
+
+
+def test_other_bad_requests_are_not_resent(openai_config, tmp_path, capsys):
+    payload, context = chained_conversation(openai_config)
+    error = bad_request({"message": "bad input", "param": "input", "code": None})
+    responses = Responses(error)
+    client = SimpleNamespace(responses=responses)
+    answer = openai_api.make_query_openai(
+        client, payload, openai_config, tmp_path, context  # type: ignore
+    )
+    assert answer is None
+    assert len(responses.sent) == 1
+    assert "bad input" in capsys.readouterr().out
+
+
+def test_expired_chain_async(openai_config):
+    payload, _ = chained_conversation(openai_config)
+    client = SimpleNamespace(responses=AsyncResponses(bad_request(CHAIN_GONE)))
+    args = {"input": payload[2:], "previous_response_id": "resp_old"}
+    full = {"input": payload}
+    response = asyncio.run(
+        openai_api.create_async(client, openai_config, args, full)  # type: ignore
+    )
+    assert response.id == "resp_2"
+    with pytest.raises(openai.BadRequestError):
+        asyncio.run(
+            openai_api.create_async(client, openai_config, args, None)  # type: ignore
+        )
+
+
+class Models:
+    """client.models of gemini, requests using a cache fail with error"""
+
+    def __init__(self, error: Exception | None = None) -> None:
+        self.error = error
+        self.sent: list[tuple[list, types.GenerateContentConfig]] = []
+
+    def generate_content(self, model, contents, config):
+        self.sent.append((list(contents), config))
+        if config.cached_content and self.error:
+            raise self.error
+        return SimpleNamespace(usage_metadata=None, function_calls=None, text="answer")
+
+
+class Caches:
+    def __init__(self, error: Exception) -> None:
+        self.error = error
+        self.created = 0
+
+    def create(self, model, config):
+        self.created += 1
+        raise self.error
+
+
+def content(text: str, role: str = "user") -> types.Content:
+    return types.Content(role=role, parts=[types.Part(text=text)])
+
+
+@pytest.fixture
+def gemini(config, monkeypatch) -> SimpleNamespace:
+    monkeypatch.setattr(google_api, "pause_on_error", lambda: None)
+    monkeypatch.setattr(google_api, "_uncacheable", set())
+    model_config = types.GenerateContentConfig(system_instruction="be brief")
+    messages = [content("hi"), content("yo", "model"), content("again")]
+    context = ServerContext()
+    key = google_api.cache_key(config, model_config)
+    prefix = google_api.cache_prefix(messages[:2], model_config)
+    context.put(key, "cachedContents/1", prefix, time.time() + 60)
+    return SimpleNamespace(
+        # no waiting for retries
+        config=config.model_copy(update={"max_retries": 0}),
+        model_config=model_config,
+        messages=messages,
+        context=context,
+    )
+
+
+def ask(gemini: SimpleNamespace, client: SimpleNamespace, tmp_path) -> str | None:
+    return google_api.make_query_gemini(
+        client,  # type: ignore
+        list(gemini.messages),
+        gemini.config,
+        gemini.model_config,
+        tmp_path,
+        gemini.context,
+    )
+
+
+def test_expired_cache_is_dropped_and_skipped(gemini, tmp_path):
+    models = Models(g_error.ClientError(404, {"error": {"message": "no cache"}}))
+    assert ask(gemini, SimpleNamespace(models=models), tmp_path) == "answer"
+    (cached_contents, cached), (contents, request) = models.sent
+    assert cached.cached_content == "cachedContents/1"
+    assert cached_contents == gemini.messages[2:]
+    assert contents == gemini.messages and request is gemini.model_config
+    assert not gemini.context.entries()
+
+
+def test_server_errors_keep_the_cache(gemini, tmp_path, capsys):
+    models = Models(g_error.ServerError(500, {"error": {"message": "oops"}}))
+    assert ask(gemini, SimpleNamespace(models=models), tmp_path) is None
+    assert len(models.sent) == 1
+    assert gemini.context.entries()
+
+
+def test_failed_cache_creation_sends_without_it(gemini, tmp_path, capsys):
+    gemini.context = ServerContext()
+    long = content("words " * 1000)
+    gemini.messages = [long, content("yo", "model"), content("again")]
+    caches = Caches(g_error.ClientError(400, {"error": {"message": "too small"}}))
+    client = SimpleNamespace(models=Models(), caches=caches)
+    assert ask(gemini, client, tmp_path) == "answer"
+    assert caches.created == 1
+    ((contents, request),) = client.models.sent
+    assert contents == gemini.messages and request is gemini.model_config
+    assert "not caching" in capsys.readouterr().out
+
+    # the model isn't asked again this session
+    assert ask(gemini, client, tmp_path) == "answer"
+    assert caches.created == 1
@@ -0,0 +1,113 @@
+# pylint: disable = C0116, C0115, C0114, C0411, W0613
+
+import hashlib
+import json
+import pickle
+import sys
+import time
+from collections import deque
+from types import ModuleType
+
+import pytest
+
+from AI_TUI import main, session
+from AI_TUI.log_index import LogIndex
+from AI_TUI.main import Message, MessagesArray
+from AI_TUI.session import SessionWriter, load_session, record, restore_server
+
+KEY = "fake/model@http://localhost/"
+
+
+class Exploit:
+    def __reduce__(self):
+        return (exec, ("raise SystemExit('ran code from a snapshot')",))
+
+
+@pytest.fixture
+def provider(monkeypatch: pytest.MonkeyPatch) -> ModuleType:
+    fake = ModuleType("fake_provider")
+    fake.convert = lambda m: m.to_dict()  # type: ignore
+    fake.load_item = lambda data: data  # type: ignore
+    monkeypatch.setitem(sys.modules, "fake_provider", fake)
+    monkeypatch.setitem(session.PROVIDERS, "fake", "fake_provider")
+    return fake
+
+
+def conversation() -> MessagesArray:
+    return MessagesArray(
+        [Message(role="user", content="hi"), Message(role="assistant", content="yo")]
+    )
+
+
+def test_server_context_survives_a_resume(config, provider, tmp_path):
+    path = tmp_path / "log.session"
+    messages = conversation()
+    prefix = messages.converted("fake_provider", provider.convert)
+    answer = {"role": "assistant", "content": "from the server"}
+    messages.server.put(KEY, "resp_1", [*prefix, answer], time.time() + 60)
+    writer = SessionWriter(path, "never", deque())
+    writer.sync(messages)
+    writer.close()
+
+    snapshot = load_session(path, 10)
+    resumed = conversation()
+    restore_server(resumed, snapshot.server)
+    entry = resumed.server.entries()[KEY]
+    assert entry.name == "resp_1"
+    assert list(entry.prefix) == [*prefix, answer]
+
+
+def test_untrusted_entries_are_skipped(config, provider, tmp_path):
+    path = tmp_path / "log.session"
+    # would match, if "os" were a provider
+    entry = {
+        "count": 0,
+        "digest": hashlib.blake2b(b"").hexdigest(),
+        "name": "resp_1",
+        "expires": time.time() + 60,
+        "rest": [],
+    }
+    entries = {
+        KEY: pickle.dumps(Exploit()),
+        "os/system@x": json.dumps(entry).encode(),
+        "fake/other@x": b"not json",
+    }
+    path.write_bytes(
+        session.MAGIC
+        + b"".join(
+            record(session.SERVER, key.encode() + b"\0" + body)
+            for key, body in entries.items()
+        )
+    )
+    resumed = conversation()
+    restore_server(resumed, load_session(path, 10).server)
+    assert not resumed.server.entries()
+
+
+def test_resumed_session_outlives_overwrite_log(config, monkeypatch, tmp_path):
+    overwrite = config.model_copy(update={"overwrite_log": "yes"})
+    monkeypatch.setattr(main, "get_config", lambda: overwrite)
+    monkeypatch.setattr(main, "HOME", tmp_path)
+    monkeypatch.setattr(main, "deleted", deque(maxlen=main.UNDO_LIMIT))
+    monkeypatch.setattr(main.ArgsSingleton, "resume", [])
+    monkeypatch.setattr(main.ArgsSingleton, "server", {})
+    index = LogIndex(tmp_path / "index.sqlite3", tmp_path / "logs", "*.md")
+    monkeypatch.setattr(main, "get_log_index", lambda: index)
+
+    log = main.open_log(conversation())
+    log.sync(conversation())
+    log.compact(conversation())
+    main.load_resumed_session("")
+    messages = MessagesArray(
+        Message(role=role, content=content)  # type: ignore
+        for role, content in main.ArgsSingleton.resume
+        if role != "developer"
+    )
+    # the user leaves before asking anything
+    log = main.open_log(messages)
+    log.compact(messages)
+    index.close()
+
+    path = (tmp_path / main.LOG_NAME).with_suffix(session.SESSION_SUFFIX)
+    snapshot = load_session(path, main.UNDO_LIMIT)
+    assert snapshot.messages[1:] == [("user", "hi"), ("assistant", "yo")]
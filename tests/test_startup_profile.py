@@ -0,0 +1,28 @@
+# pylint: disable = C0116, C0115, C0114, C0411
+
+from AI_TUI.startup_profile import parse_importtime
+
+OUTPUT = """\
+import time: self [us] | cumulative | imported package
+import time:       100 |        100 | site
+import time:        10 |         10 |     tomllib._re
+import time:        40 |         50 |   tomllib
+import time:        20 |         20 |   prompt_toolkit
+import time:         5 |         25 |   tomllib
+import time:         7 |        102 | AI_TUI.main
+import time:         3 |          3 | atexit
+"""
+
+
+def test_direct_imports_of_main():
+    total, children = parse_importtime(OUTPUT)
+    assert total == 102
+    assert children == {
+        "tomllib": 75,
+        "prompt_toolkit": 20,
+        "AI_TUI.main (self)": 7,
+    }
+
+
+def test_missing_module():
+    assert parse_importtime(OUTPUT, "AI_TUI.app") == (0, {})
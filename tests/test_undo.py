@@ -0,0 +1,53 @@
+# pylint: disable = C0116, C0115, C0114, C0411, W0613
+
+from collections import deque
+
+import pytest
+from prompt_toolkit.key_binding import KeyBindings
+from prompt_toolkit.keys import Keys
+
+from AI_TUI import main
+from AI_TUI.log_writer import LogWriter, apply_tombstones, parse_msgs
+from AI_TUI.main import Message, MessagesArray, add_global_bindings
+from AI_TUI.session import SESSION_SUFFIX, SessionWriter, load_session
+
+
+@pytest.fixture
+def keys(monkeypatch: pytest.MonkeyPatch) -> KeyBindings:
+    monkeypatch.setattr(main, "GLOBAL_KEYS", KeyBindings())
+    monkeypatch.setattr(main, "deleted", deque(maxlen=main.UNDO_LIMIT))
+    return main.GLOBAL_KEYS
+
+
+def press(keys: KeyBindings, key: Keys) -> None:
+    (binding,) = keys.get_bindings_for_keys((key,))
+    binding.handler(None)  # type: ignore
+
+
+def test_undo_then_redo(config, keys, tmp_path):
+    path = tmp_path / "log.md"
+    session = SessionWriter(path.with_suffix(SESSION_SUFFIX), "never", main.deleted)
+    log = LogWriter(path, "never", session=session)
+    messages = MessagesArray(
+        [Message(role="user", content="hi"), Message(role="assistant", content="yo")]
+    )
+    log.sync(messages)
+    notices: list[str] = []
+    add_global_bindings(messages, log, notices.append)
+
+    press(keys, Keys.ControlZ)
+    assert [m.content for m in messages[1:]] == ["hi"]
+    assert [m.content for m in main.deleted] == ["yo"]
+
+    press(keys, Keys.ControlY)
+    assert [m.content for m in messages[1:]] == ["hi", "yo"]
+    assert not main.deleted
+    assert len(notices) == 2
+    log.close()
+    session.close()
+
+    text = apply_tombstones(path.read_text(encoding="utf-8"))
+    assert parse_msgs(text)[1:] == [("user", "hi")]  # redone but not synced yet
+    snapshot = load_session(path.with_suffix(SESSION_SUFFIX), main.UNDO_LIMIT)
+    assert snapshot.messages[1:] == [("user", "hi"), ("assistant", "yo")]
+    assert not snapshot.deleted